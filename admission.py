@@ -0,0 +1,350 @@
+# admission.py
+# Bounded worker pools with per endpoint cost lanes and load shedding
+
+# https://docs.python.org/3/library/socketserver.html
+
+import time
+import select
+import socket
+import threading
+import collections
+import metrics
+
+try:
+	from BaseHTTPServer import HTTPServer
+except ImportError:
+	from http.server import HTTPServer
+
+
+# lane of requests that are cheap to answer, served by its own workers
+cheap_lane = "cheap"
+# lane of every other request
+heavy_lane = "heavy"
+
+# bytes of request peeked to classify it, a longer request head is classified by its request line alone
+peek_size = 8192
+
+# seconds a new connection has to send its request head, then it is closed without taking a worker
+header_timeout = 1.0
+
+# seconds between peeks of a connection whose request head arrived in part, its socket stays readable
+peek_interval = 0.01
+
+# seconds between checks for queued connections waiting past their lane's timeout
+shed_interval = 0.05
+
+# seconds a rejected client should wait before retrying
+retry_after = 1
+
+# response sent without parsing the request when a lane is saturated
+rejection = ("HTTP/1.1 503 Service Unavailable\r\n"
+			"Retry-After: " + str(retry_after) + "\r\n"
+			"Content-Length: 0\r\n"
+			"Connection: close\r\n\r\n").encode("ascii")
+
+# response sent to a connection that did not send its request head in time
+request_timeout = ("HTTP/1.1 408 Request Timeout\r\n"
+					"Content-Length: 0\r\n"
+					"Connection: close\r\n\r\n").encode("ascii")
+
+metrics.registry.describe("http_requests_rejected_total", "Number of connections shed by lane and reason", "counter")
+
+
+def get_request_path(data):
+	# path of request line "GET /path?query HTTP/1.1" once the head up to its blank line arrived,
+	# None if not complete yet, so workers never wait on a client sending its headers
+	if data.find(b"\r\n\r\n") == -1 and data.find(b"\n\n") == -1 and len(data) < peek_size:
+		return None
+
+	parts = data.split(b"\n", 1)[0].rstrip(b"\r").split(b" ")
+	if len(parts) < 2:
+		return ""
+
+	return parts[1].split(b"?")[0].decode("ascii", "replace")
+
+
+def wait_readable(sockets, timeout):
+	# sockets of the list with data to read within timeout seconds
+	# poll where available, select is limited to descriptors below 1024
+	if not hasattr(select, "poll"):
+		return select.select(sockets, [], [], timeout)[0]
+
+	poller = select.poll()
+	by_descriptor = {}
+	for sock in sockets:
+		by_descriptor[sock.fileno()] = sock
+		poller.register(sock, select.POLLIN)
+
+	return [by_descriptor[descriptor] for descriptor, event in poller.poll(timeout * 1000)]
+
+
+class Lane:
+	# bounded queue of accepted connections and the workers serving it
+
+	def __init__(self, name, workers, queue_size, queue_timeout):
+		self.name = name
+		self.workers = workers
+		# (request, client address, queued time) of connections waiting for a worker, oldest first
+		self.queue = collections.deque()
+		self.queue_size = queue_size
+		# seconds a connection may wait before it is shed instead of served
+		self.queue_timeout = queue_timeout
+		# signals workers when a connection is queued, shared by lanes whose workers help each other
+		self.condition = threading.Condition()
+		self.threads = []
+
+	def put(self, item):
+		# queue connection, False if the lane is full
+		with self.condition:
+			if len(self.queue) >= self.queue_size:
+				return False
+			self.queue.append(item)
+			# waiting workers may belong to other lanes
+			self.condition.notify_all()
+		return True
+
+	def get(self, helped=()):
+		# lane and oldest queued connection of this lane, or of a helped lane once this one is empty
+		# None when the lane is stopped
+		with self.condition:
+			while True:
+				if len(self.queue) > 0:
+					return self, self.queue.popleft()
+
+				for lane in helped:
+					# stop markers are left to the lane's own workers
+					if len(lane.queue) > 0 and lane.queue[0] is not None:
+						return lane, lane.queue.popleft()
+
+				self.condition.wait()
+
+	def take_expired(self, now):
+		# connections that waited longer than queue_timeout, removed so no worker serves them
+		expired = []
+		with self.condition:
+			while len(self.queue) > 0 and self.queue[0] is not None and now - self.queue[0][2] > self.queue_timeout:
+				expired.append(self.queue.popleft())
+		return expired
+
+	def get_depth(self):
+		with self.condition:
+			return len(self.queue)
+
+	def stop(self):
+		# stop workers once they finish their current connection
+		with self.condition:
+			for thread in self.threads:
+				self.queue.append(None)
+			self.condition.notify_all()
+		return
+
+
+class PooledHTTPServer(HTTPServer):
+	# HTTP server with a fixed number of worker threads per lane instead of a thread per connection
+	# handlers answer one request per connection, so every request is classified on its own
+
+	# let restarts bind while old connections linger in TIME_WAIT
+	allow_reuse_address = True
+	# connections the kernel holds until accepted, a full backlog drops SYNs and costs clients a 1s retransmit
+	request_queue_size = 128
+
+	def __init__(self, server_address, handler_class, classify, lanes):
+		# classify maps request path to lane name, lanes are Lane objects
+		HTTPServer.__init__(self, server_address, handler_class)
+		self.classify = classify
+		self.lanes = dict([(lane.name, lane) for lane in lanes])
+
+		# idle heavy workers take cheap requests, which are most of a usual load, so lanes share one condition
+		condition = threading.Condition()
+		for lane in lanes:
+			lane.condition = condition
+		# connections handed off by their handler, left open when the worker is done with them
+		self.detached = set()
+		self.detached_lock = threading.Lock()
+		# lane of the connection each worker thread is serving
+		self.local = threading.local()
+
+		# (request, client address, accepted time, request head incomplete) of connections whose
+		# request head is awaited, classified by their own thread so accepting never waits on a client
+		self.pending = []
+		self.pending_lock = threading.Lock()
+		# written to by the accepting thread to wake the classifying thread
+		self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+		# set by server_close to stop the classifying thread
+		self.closed = False
+
+		for lane in lanes:
+			for i in range(0, lane.workers):
+				thread = threading.Thread(target=self.serve_lane, args=(lane,))
+				thread.daemon = True
+				thread.start()
+				lane.threads.append(thread)
+
+		self.classifier = threading.Thread(target=self.classify_connections)
+		self.classifier.daemon = True
+		self.classifier.start()
+
+		metrics.registry.register_gauge("http_queue_depth", "Number of connections waiting for a worker by lane",
+										self.get_queue_depths)
+
+	def get_queue_depths(self):
+		return [((("lane", name),), self.lanes[name].get_depth()) for name in sorted(self.lanes)]
+
+	def process_request(self, request, client_address):
+		# called by the accepting thread, never waits on the client or a full lane
+		with self.pending_lock:
+			self.pending.append((request, client_address, time.time(), False))
+
+		self.wake_classifier()
+		return
+
+	def wake_classifier(self):
+		try:
+			self.wakeup_writer.send(b"\0")
+		except socket.error:
+			pass
+		return
+
+	def peek_path(self, request):
+		# path of the request line without consuming it, the handler still reads it
+		# None if not complete yet, "" if unreadable or the client closed
+		try:
+			data = request.recv(peek_size, socket.MSG_PEEK)
+		except socket.error:
+			return ""
+
+		if len(data) == 0:
+			return ""
+
+		return get_request_path(data)
+
+	def classify_connections(self):
+		# queue each new connection to the lane of its request once the request head arrives,
+		# close it once header_timeout passes without one, and shed connections queued too long
+		while not self.closed:
+			now = time.time()
+			with self.pending_lock:
+				pending = list(self.pending)
+
+			# a request head seen incomplete keeps its socket readable, so it is peeked every peek_interval
+			waiting = [entry[0] for entry in pending if not entry[3]]
+			deadlines = [entry[2] + header_timeout for entry in pending]
+			deadlines += [now + peek_interval for entry in pending if entry[3]]
+			timeout = max(0.0, min([shed_interval] + [deadline - now for deadline in deadlines]))
+
+			try:
+				readable = wait_readable([self.wakeup_reader] + waiting, timeout)
+			except (select.error, socket.error, ValueError):
+				readable = []
+
+			if self.wakeup_reader in readable:
+				self.wakeup_reader.recv(4096)
+
+			now = time.time()
+			done = set()
+			for entry in pending:
+				request, client_address, accepted_time, incomplete = entry
+				timed_out = now - accepted_time >= header_timeout
+				if request not in readable and not incomplete and not timed_out:
+					continue
+
+				path = self.peek_path(request) if request in readable or incomplete else None
+				if path is None:
+					if timed_out:
+						# slow or idle client, never handed a worker to wait on
+						done.add(request)
+						self.close_unclassified(request)
+					elif not incomplete:
+						# partial request head, wait for the rest until the deadline
+						with self.pending_lock:
+							self.pending[self.pending.index(entry)] = (request, client_address, accepted_time, True)
+					continue
+
+				lane = self.lanes.get(self.classify(path), self.lanes[heavy_lane])
+				done.add(request)
+				if not lane.put((request, client_address, now)):
+					self.reject(request, lane, "queue_full")
+
+			if len(done) > 0:
+				with self.pending_lock:
+					self.pending = [entry for entry in self.pending if entry[0] not in done]
+
+			# client has likely given up, shed it while it waits so it can retry elsewhere
+			for lane in self.lanes.values():
+				for request, client_address, queued_time in lane.take_expired(now):
+					self.reject(request, lane, "queue_timeout")
+
+	def close_unclassified(self, request):
+		# 408 written straight to the socket of a connection without a complete request head
+		metrics.registry.inc("http_requests_rejected_total", (("lane", "none"), ("reason", "header_timeout")))
+		try:
+			request.sendall(request_timeout)
+		except socket.error:
+			pass
+		self.shutdown_request(request)
+		return
+
+	def reject(self, request, lane, reason):
+		# fast 503 written straight to the socket, request is never parsed
+		metrics.registry.inc("http_requests_rejected_total", (("lane", lane.name), ("reason", reason)))
+		try:
+			request.sendall(rejection)
+		except socket.error:
+			pass
+		self.shutdown_request(request)
+		return
+
+	def serve_lane(self, lane):
+		self.local.lane = lane
+		# heavy workers may serve any request, so they help other lanes while their own is empty
+		helped = [other for other in self.lanes.values() if other is not lane] if lane.name == heavy_lane else []
+		while True:
+			queued_lane, item = lane.get(helped)
+			if item is None:
+				break
+
+			request, client_address, queued_time = item
+
+			# expired while the worker was being woken
+			if time.time() - queued_time > queued_lane.queue_timeout:
+				self.reject(request, queued_lane, "queue_timeout")
+				continue
+
+			try:
+				self.finish_request(request, client_address)
+			except Exception:
+				self.handle_error(request, client_address)
+			finally:
+				if not self.claim_detached(request):
+					self.shutdown_request(request)
+		return
+
+	def admits(self, path):
+		# whether the worker thread's lane may serve the request, cheap workers only serve cheap requests
+		lane = getattr(self.local, "lane", None)
+		return lane is None or lane.name != cheap_lane or self.classify(path) == cheap_lane
+
+	def detach(self, request):
+		# connection answered later by another thread, which closes it, so the worker can serve others
+		with self.detached_lock:
+			self.detached.add(request)
+		return
+
+	def claim_detached(self, request):
+		# whether the connection was detached, forgetting it
+		with self.detached_lock:
+			if request not in self.detached:
+				return False
+			self.detached.remove(request)
+		return True
+
+	def server_close(self):
+		HTTPServer.server_close(self)
+
+		self.closed = True
+		self.wake_classifier()
+		self.classifier.join()
+
+		for lane in self.lanes.values():
+			lane.stop()
+		return
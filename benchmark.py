@@ -0,0 +1,344 @@
+# benchmark.py
+# Reproducible benchmarks of blockchain loading, lookups and HTTP throughput
+
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import platform
+import tempfile
+import threading
+import binascii
+import argparse
+import generate
+import codec
+import blockchain
+import server
+
+try:
+	from httplib import HTTPConnection
+except ImportError:
+	from http.client import HTTPConnection
+
+
+def percentile(sorted_values, fraction):
+	# nearest rank percentile of sorted list
+	if len(sorted_values) == 0:
+		return 0.0
+
+	index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+	return sorted_values[index]
+
+
+def time_calls(function, args_list, repeat):
+	# call function with every args tuple, repeat times, and summarize latency
+	latencies = []
+	for i in range(0, repeat):
+		for args in args_list:
+			start = time.time()
+			function(*args)
+			latencies.append(time.time() - start)
+
+	latencies.sort()
+	total = sum(latencies)
+
+	result = {}
+	result["calls"] = len(latencies)
+	result["ops_per_second"] = len(latencies) / total if total > 0 else 0.0
+	result["mean_us"] = 1e6 * total / max(len(latencies), 1)
+	result["p50_us"] = 1e6 * percentile(latencies, 0.50)
+	result["p99_us"] = 1e6 * percentile(latencies, 0.99)
+
+	return result
+
+
+def time_batch(function, args_list, repeat):
+	# time whole passes over args, for conversions too fast to time one call at a time
+	seconds = []
+	for i in range(0, repeat):
+		start = time.time()
+		for args in args_list:
+			function(*args)
+		seconds.append(time.time() - start)
+
+	total = sum(seconds)
+	calls = len(args_list) * repeat
+
+	result = {}
+	result["calls"] = calls
+	result["ops_per_second"] = calls / total if total > 0 else 0.0
+	result["mean_us"] = 1e6 * total / max(calls, 1)
+
+	return result
+
+
+def sample_hashes(rng, count):
+	# block and transaction hashes from the loaded chain, big endian
+	blocks = [rng.choice(blockchain.current.main_chain_blocks) for i in range(0, count)]
+	block_hashes = [block.get_curr_hash_big() for block in blocks]
+	tx_hashes = [rng.choice(block.get_transactions()).get_hash_big() for block in blocks]
+
+	return block_hashes, tx_hashes
+
+
+def bench_load(directory_path):
+	# full setup, with per phase and per file timings from load stats
+	start = time.time()
+	blockchain.setup(directory_path)
+	seconds = time.time() - start
+
+	stats = blockchain.load_stats
+	result = {}
+	result["seconds"] = seconds
+	result["blocks"] = stats.blocks_done
+	result["txs"] = stats.txs_done
+	result["bytes"] = stats.bytes_done
+	result["phase_seconds"] = dict(stats.phase_seconds)
+	result["peak_memory_bytes"] = stats.get_peak_memory()
+
+	# load_file throughput over every file
+	file_seconds = sum([report["read_seconds"] + report["parse_seconds"] for report in stats.file_reports])
+	result["load_file_bytes_per_second"] = stats.bytes_done / file_seconds if file_seconds > 0 else 0.0
+	result["load_file_blocks_per_second"] = stats.blocks_done / file_seconds if file_seconds > 0 else 0.0
+	result["load_file_txs_per_second"] = stats.txs_done / file_seconds if file_seconds > 0 else 0.0
+
+	return result
+
+
+def bench_bfs(repeat):
+	# BFS over the already loaded block graph
+	return time_calls(blockchain.compute_distances_bfs,
+					[(blockchain.current, [(blockchain.source_hash, -1)])], repeat)
+
+
+def bench_lookups(rng, samples, repeat):
+	block_hashes, tx_hashes = sample_hashes(rng, samples)
+	height = blockchain.get_latest_height()
+	times = [block.get_time_int() for block in blockchain.current.main_chain_blocks]
+
+	# unknown hashes exercise the miss path
+	invalid_hashes = ["%064x" % rng.getrandbits(256) for i in range(0, samples)]
+
+	block_args = [(block_hash,) for block_hash in block_hashes]
+	tx_args = [(tx_hash,) for tx_hash in tx_hashes]
+
+	results = {}
+	results["get_block_header"] = time_calls(blockchain.get_block_header, block_args, repeat)
+	results["get_block_height"] = time_calls(blockchain.get_block_height, block_args, repeat)
+	results["get_main_chain"] = time_calls(blockchain.get_main_chain, block_args, repeat)
+	results["get_block_transactions"] = time_calls(blockchain.get_block_transactions, block_args, repeat)
+	results["get_latest_block"] = time_calls(blockchain.get_latest_block, [()] * samples, repeat)
+	results["get_latest_height"] = time_calls(blockchain.get_latest_height, [()] * samples, repeat)
+	results["get_transaction_info"] = time_calls(blockchain.get_transaction_info, tx_args, repeat)
+	results["get_transaction_inputs"] = time_calls(blockchain.get_transaction_inputs, tx_args, repeat)
+	results["get_transaction_outputs"] = time_calls(blockchain.get_transaction_outputs, tx_args, repeat)
+	results["get_transaction_proof"] = time_calls(blockchain.get_transaction_proof, tx_args, repeat)
+	results["get_block_header_invalid"] = time_calls(blockchain.get_block_header,
+													[(h,) for h in invalid_hashes], repeat)
+	results["get_transaction_info_invalid"] = time_calls(blockchain.get_transaction_info,
+													[(h,) for h in invalid_hashes], repeat)
+
+	# range lookups over random height and time windows
+	ranges = []
+	for i in range(0, samples):
+		start = rng.randint(0, height)
+		ranges.append((start, min(start + 100, height)))
+	results["get_range_stats"] = time_calls(blockchain.get_range_stats, ranges, repeat)
+	results["get_blocks_between"] = time_calls(blockchain.get_blocks_between,
+											[(times[start], times[end], 0) for start, end in ranges], repeat)
+
+	# address lookups of outputs of sampled transactions
+	addresses = []
+	for tx_hash in tx_hashes:
+		count, outputs = blockchain.get_transaction_outputs(tx_hash)
+		addresses += [(address, 0) for value, script, script_type, address in outputs if address != ""]
+	results["get_address_outputs"] = time_calls(blockchain.get_address_outputs, addresses[:samples], repeat)
+
+	return results
+
+
+def hexlify_reverse_hex(hex_string):
+	# byte order swap the way str.decode('hex') and encode('hex_codec') did it, through binascii
+	return binascii.hexlify(binascii.unhexlify(hex_string)[::-1]).decode("ascii")
+
+
+def hexlify_hex_to_int(hex_string):
+	# little endian field to int the way it was done before codec, through a reversed hex string
+	return int(binascii.hexlify(binascii.unhexlify(hex_string)[::-1]), 16)
+
+
+def bench_codec(rng, samples, repeat):
+	# per lookup conversions of codec against the binascii round trips they replace
+	block_hashes, tx_hashes = sample_hashes(rng, samples)
+	blocks = [rng.choice(blockchain.current.main_chain_blocks) for i in range(0, samples)]
+
+	hash_args = [(tx_hash,) for tx_hash in block_hashes + tx_hashes]
+	# 4 byte header fields and 8 byte output amounts
+	int_args = [(block.version,) for block in blocks] + [(block.nonce,) for block in blocks]
+	int_args += [(block.get_transactions()[0].get_outputs()[0].satoshi_amount,) for block in blocks]
+
+	results = {}
+	results["reverse_hex"] = time_batch(codec.reverse_hex, hash_args, repeat)
+	results["reverse_hex_binascii"] = time_batch(hexlify_reverse_hex, hash_args, repeat)
+	results["hex_to_int"] = time_batch(codec.hex_to_int, int_args, repeat)
+	results["hex_to_int_binascii"] = time_batch(hexlify_hex_to_int, int_args, repeat)
+	results["get_curr_hash_big"] = time_batch(lambda block: block.get_curr_hash_big(),
+											[(block,) for block in blocks], repeat)
+
+	return results
+
+
+def bench_http(rng, samples, duration, concurrency):
+	# end-to-end throughput of the server over localhost
+	httpd = server.create_server(("localhost", 0))
+	server_thread = threading.Thread(target=httpd.serve_forever)
+	server_thread.daemon = True
+	server_thread.start()
+	port = httpd.server_address[1]
+
+	block_hashes, tx_hashes = sample_hashes(rng, samples)
+	paths = (["/blockheader?" + h for h in block_hashes] +
+			["/blockheight?" + h for h in block_hashes] +
+			["/transactioninfo?" + h for h in tx_hashes] +
+			["/latestheight"])
+
+	# silence request logging of the handler
+	stdout = sys.stdout
+	sys.stdout = open(os.devnull, "w")
+	server.Handler.log_message = lambda self, *args: None
+
+	latencies = []
+	errors = [0]
+	lock = threading.Lock()
+	deadline = time.time() + duration
+
+	def worker(seed):
+		worker_rng = random.Random(seed)
+		worker_latencies = []
+		worker_errors = 0
+		while time.time() < deadline:
+			path = worker_rng.choice(paths)
+			start = time.time()
+			connection = HTTPConnection("localhost", port)
+			try:
+				connection.request("GET", path)
+				response = connection.getresponse()
+				response.read()
+				if response.status != 200:
+					worker_errors += 1
+			except Exception:
+				worker_errors += 1
+			finally:
+				connection.close()
+			worker_latencies.append(time.time() - start)
+
+		with lock:
+			latencies.extend(worker_latencies)
+			errors[0] += worker_errors
+		return
+
+	threads = [threading.Thread(target=worker, args=(i,)) for i in range(0, concurrency)]
+	start = time.time()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	seconds = time.time() - start
+
+	sys.stdout.close()
+	sys.stdout = stdout
+	httpd.shutdown()
+	httpd.server_close()
+
+	latencies.sort()
+	result = {}
+	result["requests"] = len(latencies)
+	result["errors"] = errors[0]
+	result["concurrency"] = concurrency
+	result["requests_per_second"] = len(latencies) / seconds if seconds > 0 else 0.0
+	result["p50_ms"] = 1e3 * percentile(latencies, 0.50)
+	result["p99_ms"] = 1e3 * percentile(latencies, 0.99)
+
+	return result
+
+
+def compare(results, baseline, threshold):
+	# print relative change of throughput metrics, return names that regressed
+	regressions = []
+
+	def walk(prefix, current, previous):
+		for key in sorted(current):
+			name = prefix + "." + key if prefix != "" else key
+			if isinstance(current[key], dict) and isinstance(previous.get(key), dict):
+				walk(name, current[key], previous[key])
+			elif key.endswith("per_second") and previous.get(key):
+				change = (current[key] - previous[key]) / float(previous[key])
+				print("%-60s %+7.1f%%" % (name, 100.0 * change))
+				if change < -threshold:
+					regressions.append(name)
+		return
+
+	walk("", results, baseline)
+
+	return regressions
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmark blockchain loading, lookups and HTTP throughput")
+	parser.add_argument("--data-dir", default=None, help="existing blk files to load, with trailing slash")
+	parser.add_argument("--blocks", type=int, default=2000, help="length of generated chain")
+	parser.add_argument("--txs", type=int, default=20, help="transactions per generated block")
+	parser.add_argument("--fork-rate", type=float, default=0.02, help="stale block rate of generated chain")
+	parser.add_argument("--shuffle-window", type=int, default=8, help="out of order window of generated chain")
+	parser.add_argument("--seed", type=int, default=0, help="random seed of generator and samples")
+	parser.add_argument("--samples", type=int, default=200, help="hashes sampled per lookup benchmark")
+	parser.add_argument("--repeat", type=int, default=5, help="repetitions of each lookup sample")
+	parser.add_argument("--http-seconds", type=float, default=5.0, help="duration of HTTP benchmark, 0 to skip")
+	parser.add_argument("--concurrency", type=int, default=8, help="concurrent HTTP clients")
+	parser.add_argument("--output", default="benchmark.json", help="file to write JSON results to")
+	parser.add_argument("--compare", default=None, help="baseline JSON results to compare against")
+	parser.add_argument("--threshold", type=float, default=0.10, help="throughput drop counted as regression")
+	args = parser.parse_args()
+
+	rng = random.Random(args.seed)
+
+	# generate a chain unless real blk files are given
+	temp_dir = None
+	directory_path = args.data_dir
+	if directory_path is None:
+		temp_dir = tempfile.mkdtemp(prefix="blkbench")
+		directory_path = temp_dir + os.sep
+		generator = generate.ChainGenerator(args.seed, args.txs, 2, 2, 72, args.fork_rate)
+		generate.write_files(generator, args.blocks, temp_dir, 128 * 1024 * 1024, args.shuffle_window)
+
+	results = {}
+	results["environment"] = {"python": platform.python_version(), "implementation": platform.python_implementation(),
+							"platform": platform.platform(), "time": time.time()}
+	results["parameters"] = vars(args)
+
+	try:
+		results["load"] = bench_load(directory_path)
+		results["bfs"] = bench_bfs(args.repeat)
+		results["lookups"] = bench_lookups(rng, args.samples, args.repeat)
+		results["codec"] = bench_codec(rng, args.samples, args.repeat)
+		if args.http_seconds > 0:
+			results["http"] = bench_http(rng, args.samples, args.http_seconds, args.concurrency)
+	finally:
+		if temp_dir is not None:
+			shutil.rmtree(temp_dir)
+
+	with open(args.output, "w") as out:
+		json.dump(results, out, indent=2, sort_keys=True)
+	print("Results written to " + args.output)
+
+	# exit status 1 when throughput regressed against the baseline
+	if args.compare is not None:
+		with open(args.compare) as baseline_file:
+			baseline = json.load(baseline_file)
+
+		regressions = compare(results, baseline, args.threshold)
+		if len(regressions) != 0:
+			print("Regressions: " + ", ".join(regressions))
+			sys.exit(1)
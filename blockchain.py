@@ -15,42 +15,96 @@ import string
 import json
 import time
 import struct
-import binascii
 import hashlib
+import array
+import threading
+import collections
+import codec
+import script
+import cache
+import loadstats
+import generation
+import txindex
+import diskindex
+
+try:
+	from Queue import Queue, Empty, Full
+except ImportError:
+	from queue import Queue, Empty, Full
 
 
 # previous block hash of genesis block of bitcoin blockchain
 source_hash = "0000000000000000000000000000000000000000000000000000000000000000"
 
-# previous block header hash (little endian) to block
-# prev_hash -> block
-prev_hash_to_blocks = {}
+# every index of the blockchain as last published
+# request threads read it once per query and never see a half built update
+current = generation.IndexGeneration()
 
-# current block header hash (little endian) to previous block header hash (little endian)
-# curr_hash -> prev_hash -> block
-curr_hash_to_prev_hash = {}
+# serializes setup and updates, the only writers of new generations
+update_lock = threading.Lock()
 
-# total number of blocks
-block_count = 0
+# notified after every publish, so threads waiting for a new latest block wake at once
+published = threading.Condition()
 
-# number of blocks in longest chain
-blockchain_height = 0
+# byte offset of the next unparsed block of each file
+# filename -> offset
+file_offsets = {}
 
-# block hash of latest block (little endian)
-latest_block_little = ""
+# transactions spending outputs not loaded yet, retried on every update
+unresolved_txs = []
 
-# transaction hash (little endian) to previous block header hash (little endian)
-# txid -> prev_hash -> block
-txid_to_prev_hash = {}
+# (tx, block, input value index) of transactions on disk spending outputs not loaded yet,
+# retried after every file is indexed
+unresolved_values = []
+
+# outpoint index of the null outpoint spent by a coinbase transaction
+coinbase_index = 0xFFFFFFFF
+
+# number of outputs returned per page of address lookups
+address_page_size = 100
+
+# number of blocks returned per page of time range lookups
+blocks_page_size = 100
+
+# phase timers, rates and progress of loading the blockchain
+load_stats = loadstats.LoadStats()
+
+# files read ahead of the one being parsed, each held in memory until parsed, 0 reads and parses in turn
+read_ahead_files = 2
+
+# file the packed txid index is saved to and mapped from on restart, None keeps it in memory only
+txindex_path = None
+
+# directory of txid index runs read through a page cache, None keeps every index in memory
+# transactions are then dropped once indexed and parsed again from the files when requested
+disk_index_path = None
+
+# parsed transactions take about this many times the bytes of their raw block
+parsed_size_ratio = 7
+
+# transactions of recently requested blocks whose transactions are not kept in memory,
+# bounded by approximate bytes of parsed transactions rather than blocks, as block sizes vary widely
+# (filename, offset) -> [Transaction, ...]
+transaction_cache = cache.LRUCache("block_transactions", 256 * 1024 * 1024)
+
+# blocks and time of parsing transactions again, separate from load statistics
+reload_stats = loadstats.LoadStats()
+
+# merkle tree levels of recently proven blocks
+# curr_hash -> [[tx hashes], [parent hashes], ..., [merkle root]]
+merkle_cache = cache.LRUCache("merkle_levels", 256)
 
 
 # input transaction of a transaction
 class InputTransaction:
 
-	def __init__(self, prev_tx_hash, script, seq_num):
+	def __init__(self, prev_tx_hash, prev_tx_index, script, seq_num):
 		# txid of the transaction holding the output to spend
 		# 32 bytes little endian
 		self.prev_tx_hash = prev_tx_hash
+		# output index number of the specific output to spend from the transaction
+		# 4 bytes little endian
+		self.prev_tx_index = prev_tx_index
 		# script that satisfies the conditions placed in the outpoint's pubkey script
 		# variable length hex string
 		self.script = script
@@ -62,22 +116,24 @@ class InputTransaction:
 		return self.prev_tx_hash
 
 	def get_prev_hash_big(self):
-		# convert to binary
-		hash_bin = self.prev_tx_hash.decode('hex')
-
 		# big-endian hash
-		hash_hex = hash_bin[::-1].encode('hex_codec')
+		return codec.reverse_hex(self.prev_tx_hash)
 
-		return hash_hex
+	def get_prev_index_int(self):
+		return codec.hex_to_int(self.prev_tx_index)
+
+	def is_coinbase(self):
+		# coinbase input spends the null outpoint
+		return self.prev_tx_hash == source_hash and self.get_prev_index_int() == coinbase_index
 
 	def get_script_little(self):
 		return self.script
 
 	def get_script_big(self):
-		return self.script.decode('hex')[::-1].encode('hex_codec')
+		return codec.reverse_hex(self.script)
 
 	def get_seq_int(self):
-		return int(self.seq_num.decode('hex')[::-1].encode('hex_codec'), 16)
+		return codec.hex_to_int(self.seq_num)
 
 
 # output transaction of a transaction
@@ -92,19 +148,20 @@ class OutputTransaction:
 		self.script = script
 
 	def get_satoshi_int(self):
-		return int(self.satoshi_amount.decode('hex')[::-1].encode('hex_codec'), 16)
+		return codec.hex_to_int(self.satoshi_amount)
 
 	def get_script_little(self):
 		return self.script
 
 	def get_script_big(self):
-		return self.script.decode('hex')[::-1].encode('hex_codec')
+		return codec.reverse_hex(self.script)
 
 
 # Each transaction in a block
 class Transaction:
 
-	def __init__(self, tx_hash, ver_num, input_tx_count, input_txs, output_tx_count, output_txs, locktime):
+	def __init__(self, tx_hash, ver_num, input_tx_count, input_txs, output_tx_count, output_txs, locktime, size,
+				output_values):
 		# txid of the transaction
 		# 32 bytes little endian
 		self.hash = tx_hash
@@ -124,21 +181,23 @@ class Transaction:
 		# time (Unix epoch time) or block number
 		# 4 bytes little endian
 		self.locktime = locktime
+		# number of bytes of the raw transaction
+		self.size = size
+		# satoshi amount of each output
+		self.output_values = output_values
+		# total satoshi amount of the outputs spent by the inputs
+		# -1 until resolved from the prevout values after loading
+		self.input_value = -1
 
 	def get_hash_little(self):
 		return self.hash
 
 	def get_hash_big(self):
-		# convert to binary
-		hash_bin = self.hash.decode('hex')
-
 		# big-endian hash
-		hash_hex = hash_bin[::-1].encode('hex_codec')
-
-		return hash_hex
+		return codec.reverse_hex(self.hash)
 
 	def get_version_int(self):
-		return int(self.version.decode('hex')[::-1].encode('hex_codec'), 16)
+		return codec.hex_to_int(self.version)
 
 	def get_input_count_int(self):
 		return self.input_tx_count
@@ -153,13 +212,32 @@ class Transaction:
 		return self.output_txs
 
 	def get_locktime_int(self):
-		return int(self.locktime.decode('hex')[::-1].encode('hex_codec'), 16)
+		return codec.hex_to_int(self.locktime)
+
+	def get_size_int(self):
+		return self.size
+
+	def is_coinbase(self):
+		return self.input_tx_count == 1 and self.input_txs[0].is_coinbase()
+
+	def set_input_value(self, satoshi):
+		self.input_value = satoshi
+		return
+
+	def get_input_value_int(self):
+		return self.input_value
+
+	def get_output_values(self):
+		return self.output_values
+
+	def get_output_value_int(self):
+		return sum(self.output_values)
 
 
 # Each block in blockchain
 class Block:
 
-	def __init__(self, ver_num, prev_hash, merk_hash, start_time, nBits, nonce, tx_count, txs):
+	def __init__(self, ver_num, prev_hash, merk_hash, start_time, nBits, nonce, tx_count, txs, size):
 		# block version number indicates which set of block validation rules to follow
 		# 4 bytes little endian
 		self.version = ver_num
@@ -182,51 +260,79 @@ class Block:
 		# hash less than or equal to the target threshold
 		# 4 bytes little endian
 		self.nonce = nonce
-		# indicator of whether this block is in the longest blockchain
-		self.main_chain = False
 		# blockchain height of this block
-		self.height = 0
+		# -1 until connected to genesis block, never changes afterwards
+		self.height = -1
 		# number of transactions in this block
 		self.tx_count = tx_count
 		# list of transactions (Transaction)
+		# None once dropped from memory, parsed again from the file when requested
 		self.txs = txs
+		# number of bytes of the serialized block
+		self.size = size
+		# (filename, byte offset of magic number) the block was parsed from
+		self.location = None
+		# index of the input value of the first transaction in the input value file,
+		# -1 while the transactions are kept in memory
+		self.input_values_start = -1
+		# satoshi amount of coinbase outputs, satoshi amount and number of inputs of all transactions
+		# kept when transactions are dropped, for main chain aggregates
+		self.coinbase_value = 0
+		self.output_value = 0
+		self.input_count = 0
 
 	def get_transactions(self):
+		if self.txs is None:
+			return load_transactions(self)
 		return self.txs
 
+	def set_location(self, filename, offset):
+		self.location = (filename, offset)
+		return
+
+	def unload_transactions(self):
+		self.txs = None
+		return
+
+	def set_totals(self, coinbase_value, output_value, input_count):
+		self.coinbase_value = coinbase_value
+		self.output_value = output_value
+		self.input_count = input_count
+		return
+
+	def get_coinbase_value_int(self):
+		return self.coinbase_value
+
+	def get_output_value_int(self):
+		return self.output_value
+
+	def get_input_count_int(self):
+		return self.input_count
+
+	def get_size_int(self):
+		return self.size
+
 	def get_tx_count_int(self):
 		return self.tx_count
 
 	def get_version_int(self):
-		return int(self.version.decode('hex')[::-1].encode('hex_codec'), 16)
+		return codec.hex_to_int(self.version)
 
 	def get_time_int(self):
-		return int(self.start_time.decode('hex')[::-1].encode('hex_codec'), 16)
+		return codec.hex_to_int(self.start_time)
 
 	def get_nBits_int(self):
-		return int(self.nBits.decode('hex')[::-1].encode('hex_codec'), 16)
+		return codec.hex_to_int(self.nBits)
 
 	def get_nonce_int(self):
-		return int(self.nonce.decode('hex')[::-1].encode('hex_codec'), 16)
+		return codec.hex_to_int(self.nonce)
 
 	def get_merk_hash_little(self):
 		return self.merkle_root_hash
 
 	def get_merk_hash_big(self):
-		# convert to binary
-		hash_bin = self.merkle_root_hash.decode('hex')
-
 		# big-endian hash
-		hash_hex = hash_bin[::-1].encode('hex_codec')
-
-		return hash_hex
-
-	def set_main_chain(self):
-		self.main_chain = True
-		return
-
-	def get_main_chain(self):
-		return self.main_chain
+		return codec.reverse_hex(self.merkle_root_hash)
 
 	def set_height(self, height):
 		self.height = height
@@ -239,13 +345,8 @@ class Block:
 		return self.previous_block_header_hash
 
 	def get_prev_hash_big(self):
-		# convert to binary
-		hash_bin = self.previous_block_header_hash.decode('hex')
-
 		# big-endian hash
-		hash_hex = hash_bin[::-1].encode('hex_codec')
-
-		return hash_hex
+		return codec.reverse_hex(self.previous_block_header_hash)
 
 	def get_curr_hash_little(self):
 		# header in little-endian hex
@@ -253,13 +354,13 @@ class Block:
 			self.start_time + self.nBits + self.nonce)
 
 		# convert to binary
-		header_bin = header_hex.decode('hex')
+		header_bin = codec.from_hex(header_hex)
 
 		# SHA256(SHA256(header))
 		header_hash = hashlib.sha256(hashlib.sha256(header_bin).digest()).digest()
 
 		# little-endian hash
-		hash_little = header_hash.encode('hex_codec')
+		hash_little = codec.to_hex(header_hash)
 
 		return hash_little
 
@@ -269,13 +370,13 @@ class Block:
 			self.start_time + self.nBits + self.nonce)
 
 		# convert to binary
-		header_bin = header_hex.decode('hex')
+		header_bin = codec.from_hex(header_hex)
 
 		# SHA256(SHA256(header))
 		header_hash = hashlib.sha256(hashlib.sha256(header_bin).digest()).digest()
 
 		# big-endian hash
-		hash_big = header_hash[::-1].encode('hex_codec')
+		hash_big = codec.to_hex(header_hash[::-1])
 
 		return hash_big
 
@@ -294,7 +395,7 @@ def get_merkle_root(child_hashes):
 			child_hashes += [child_hashes[len(child_hashes) - 1]]
 
 		# number of pairs of children
-		num_pair = len(child_hashes) / 2
+		num_pair = len(child_hashes) // 2
 
 		# compute parent hash for each children pair hashes
 		for i in range(0, num_pair):
@@ -302,14 +403,14 @@ def get_merkle_root(child_hashes):
 			child_2 = child_hashes[i * 2 + 1]
 
 			# convert to binary data
-			child_1_bin = child_1.decode('hex')
-			child_2_bin = child_2.decode('hex')
+			child_1_bin = codec.from_hex(child_1)
+			child_2_bin = codec.from_hex(child_2)
 
 			# SHA256(SHA256(hash | hash))
 			parent_bin = hashlib.sha256(hashlib.sha256(child_1_bin + child_2_bin).digest()).digest()
 
 			# little-endian hash
-			parent = parent_bin.encode('hex_codec')
+			parent = codec.to_hex(parent_bin)
 
 			parent_hashes += [parent]
 
@@ -349,21 +450,22 @@ def parse_var_len_int(block, nth_byte):
 
 def byte_to_hex_string_little(bytes):
 	# hex string little endian
-	return  binascii.hexlify(bytes)
+	return  codec.to_hex(bytes)
 
 
 def byte_to_hex_string_big(bytes):
 	# hex string big endian
-	return  binascii.hexlify(bytes[::-1])
+	return  codec.reverse_hex(codec.to_hex(bytes))
 
 
-def parse_block(block, nth_byte):
+def parse_block(block, nth_byte, stats):
+	# decode one block without indexing it, timing merkle verification in stats
 	# magic number 0xD9B4BEF9
 	# 4 bytes little endian to hex big endian
 	magic_num = byte_to_hex_string_big(block[nth_byte: nth_byte + 4])
 	#print (magic_num)
 	# make sure block parsed correctly
-	assert (magic_num == b'd9b4bef9')
+	assert (magic_num == 'd9b4bef9')
 	nth_byte += 4
 
 	# block size
@@ -418,17 +520,13 @@ def parse_block(block, nth_byte):
 	for i in range(0, tx_count):
 		# start index of transaction
 		start_tx_byte = nth_byte
-		# raw transaction data concatenated to compute txid
-		raw_tx_data = ""
 
 		# transaction version number
 		tx_ver_num = byte_to_hex_string_little(block[nth_byte: nth_byte + 4])
-		raw_tx_data += tx_ver_num
 		nth_byte += 4
 
 		# input transaction count
 		input_tx_count, num_byte_parsed = parse_var_len_int(block, nth_byte)
-		raw_tx_data += byte_to_hex_string_little(block[nth_byte: nth_byte + num_byte_parsed])
 		nth_byte += num_byte_parsed
 
 		# list of all input transactions
@@ -438,56 +536,50 @@ def parse_block(block, nth_byte):
 		for j in range(0, input_tx_count):
 			# txid of the transaction holding the output to spend
 			prev_tx_hash = byte_to_hex_string_little(block[nth_byte: nth_byte + 32])
-			raw_tx_data += prev_tx_hash
 			nth_byte += 32
 
 			# output index number of the specific output to spend from the transaction
 			prev_tx_index = byte_to_hex_string_little(block[nth_byte: nth_byte + 4])
-			raw_tx_data += prev_tx_index
 			nth_byte += 4
 
 			# script size
 			script_size, num_byte_parsed = parse_var_len_int(block, nth_byte)
-			raw_tx_data += byte_to_hex_string_little(block[nth_byte: nth_byte + num_byte_parsed])
 			nth_byte += num_byte_parsed
 
 			# script that satisfies the conditions placed in the outpoint's pubkey script
 			script = byte_to_hex_string_little(block[nth_byte: nth_byte + script_size])
-			raw_tx_data += byte_to_hex_string_little(block[nth_byte: nth_byte + script_size])
 			nth_byte += script_size
 
 			# sequence number
 			seq_num = byte_to_hex_string_little(block[nth_byte: nth_byte + 4])
-			raw_tx_data += seq_num
 			nth_byte += 4
 
 			# new input transaction
-			input_tx = InputTransaction(prev_tx_hash, script, seq_num)
+			input_tx = InputTransaction(prev_tx_hash, prev_tx_index, script, seq_num)
 			input_transactions += [input_tx]
 
 		# output transaction count
 		output_tx_count, num_byte_parsed = parse_var_len_int(block, nth_byte)
-		raw_tx_data += byte_to_hex_string_little(block[nth_byte: nth_byte + num_byte_parsed])
 		nth_byte += num_byte_parsed
 
 		# list of all output transactions
 		output_transactions = []
+		# satoshi amount of each output transaction
+		output_values = []
 
 		# parse each output transaction
 		for j in range(0, output_tx_count):
 			# amount of satoshis to spend
 			satoshi_amount = byte_to_hex_string_little(block[nth_byte: nth_byte + 8])
-			raw_tx_data += satoshi_amount
+			output_values += [struct.unpack("<Q", block[nth_byte: nth_byte + 8])[0]]
 			nth_byte += 8
 
 			# script size
 			script_size, num_byte_parsed = parse_var_len_int(block, nth_byte)
-			raw_tx_data += byte_to_hex_string_little(block[nth_byte: nth_byte + num_byte_parsed])
 			nth_byte += num_byte_parsed
 
 			# script that satisfies the conditions placed in the outpoint's pubkey script
 			script = byte_to_hex_string_little(block[nth_byte: nth_byte + script_size])
-			raw_tx_data += byte_to_hex_string_little(block[nth_byte: nth_byte + script_size])
 			nth_byte += script_size
 
 			# new output transaction
@@ -496,87 +588,231 @@ def parse_block(block, nth_byte):
 
 		# time (Unix epoch time) or block number
 		locktime = byte_to_hex_string_little(block[nth_byte: nth_byte + 4])
-		raw_tx_data += locktime
 		nth_byte += 4
 
 		# number of bytes of this raw transaction
-		tx_size = (start_tx_byte - nth_byte)
+		tx_size = (nth_byte - start_tx_byte)
 
-		# convert to binary
-		raw_tx_data_bin = raw_tx_data.decode('hex')
+		# raw transaction is the bytes just parsed, hashed without copying
+		raw_tx_data_bin = block[start_tx_byte: nth_byte]
 
 		# SHA256(SHA256(raw transaction))
 		tx_hash = hashlib.sha256(hashlib.sha256(raw_tx_data_bin).digest()).digest()
 
 		# little-endian hash
-		tx_hash_little = tx_hash.encode('hex_codec')
+		tx_hash_little = codec.to_hex(tx_hash)
 		#print(tx_hash_little)
 		tx_hashes += [tx_hash_little]
 
-		# each transaction hash is unique txid
-		# txid -> prev_hash of block header
-		txid_to_prev_hash[tx_hash_little] = prev_hash
-
 		# new transaction
 		tx = Transaction(tx_hash_little, tx_ver_num, input_tx_count, input_transactions,
-						output_tx_count, output_transactions, locktime)
+						output_tx_count, output_transactions, locktime, tx_size, tuple(output_values))
 		transactions += [tx]
 
 	# make sure the bytes transactions and header are parsed correctly
 	assert (nth_byte - start_block_byte == block_size)
 
 	# compute the Merkle root of all transactions
+	merkle_start = time.time()
 	merk_root_of_txs = get_merkle_root(tx_hashes)
 
 	# verify the merkle root hash in block header
 	assert (merk_hash == merk_root_of_txs)
+	stats.add("merkle", time.time() - merkle_start)
 
 	# create block
-	block = Block(ver_num, prev_hash, merk_hash, start_time, nBits, nonce, tx_count, transactions)
+	block = Block(ver_num, prev_hash, merk_hash, start_time, nBits, nonce, tx_count, transactions, block_size)
 
-	# prev_hash -> curr header
-	if prev_hash in prev_hash_to_blocks:
-		# another chain of blocks
-		prev_hash_to_blocks[prev_hash].append(block)
-	else:
-		prev_hash_to_blocks[prev_hash] = [block]
+	# totals of the block computed once, while its transactions are at hand
+	block.set_totals(transactions[0].get_output_value_int() if tx_count != 0 else 0,
+					sum([tx.get_output_value_int() for tx in transactions]),
+					sum([tx.get_input_count_int() for tx in transactions]))
 
-	# curr_hash -> prev_hash
-	curr_hash_to_prev_hash[block.get_curr_hash_little()] = prev_hash
+	# size(magic_num) + size(blocksize) + block_size
+	stats.add_block(4 + 4 + block_size, tx_count)
 
-	return block_size
+	return block, block_size
 
 
-def load_file(filename):
-	global block_count
+def read_file(filename, offset):
+	# bytes of file from byte offset, skipping blocks parsed by earlier loads
+	with open(filename, "rb") as file:
+		# kernel reads further ahead of a sequential reader
+		if hasattr(os, "posix_fadvise"):
+			os.posix_fadvise(file.fileno(), offset, 0, os.POSIX_FADV_SEQUENTIAL)
 
-	header_start = 0
+		file.seek(offset)
+		return file.read()
 
-	# open .dat file to load blocks
-	with open(filename, "rb") as file:
-		data = file.read()
-		# get the file size
-		file_end = os.stat(filename).st_size
-		
-		# parse every block
-		while True:
-			block_size = parse_block(data, header_start)
-
-			# track total block parsed
-			block_count += 1
-
-			# size(magic_num) + block_size + size(null padding)
-			header_start += (4 + block_size + 4)
-
-			# check if file ends
-			# size(magic_num) + size(blocksize) + size(header)
-			if (header_start + (4 + 4 + 80)) >= file_end:
+
+def prefetch_file(filename, offset):
+	# start reading file into the page cache in the background, where the platform allows
+	if not hasattr(os, "posix_fadvise"):
+		return
+
+	fd = os.open(filename, os.O_RDONLY)
+	try:
+		os.posix_fadvise(fd, offset, 0, os.POSIX_FADV_WILLNEED)
+	finally:
+		os.close(fd)
+	return
+
+
+def load_file(filename, offset, stats):
+	# read and parse blocks of file from byte offset, returns blocks, offset after last whole block and file report
+	read_start = stats.begin_phase("read")
+	data = read_file(filename, offset)
+	stats.end_phase("read", read_start)
+
+	return parse_file(filename, offset, data, time.time() - read_start, stats)
+
+
+def parse_file(filename, offset, data, read_seconds, stats):
+	# parse blocks of file read from byte offset, returns blocks, offset after last whole block and file report
+	header_start = 0
+	blocks = []
+	# blocks and transactions parsed before this file
+	blocks_before = stats.blocks_done
+	txs_before = stats.txs_done
+
+	# fields are sliced out of the view without copying the file
+	data = memoryview(data)
+
+	# merkle verification is timed separately from parsing
+	parse_start = stats.begin_phase("parse")
+	merkle_before = stats.phase_seconds.get("merkle", 0.0)
+
+	# parse every whole block
+	# size(magic_num) + size(blocksize)
+	while header_start + 4 + 4 <= len(data):
+		# files are preallocated with zero bytes past the last block written
+		if data[header_start: header_start + 4] == b'\x00\x00\x00\x00':
+			break
+
+		# block still being written, parse it on next load
+		block_size = struct.unpack("<I", data[header_start + 4: header_start + 8])[0]
+		if header_start + 4 + 4 + block_size > len(data):
+			break
+
+		# bytes of a block being flushed may still be zero, parse it on next load
+		try:
+			block, block_size = parse_block(data, header_start, stats)
+		except (AssertionError, struct.error):
+			print("Stopped at unparsable block at byte " + str(offset + header_start) + " of " + filename)
+			break
+
+		block.set_location(filename, offset + header_start)
+		blocks += [block]
+
+		# size(magic_num) + block_size + size(null padding)
+		header_start += (4 + block_size + 4)
+
+	parse_seconds = time.time() - parse_start
+	stats.add("parse", parse_seconds - (stats.phase_seconds.get("merkle", 0.0) - merkle_before))
+
+	# per file rates
+	report = stats.file_done(filename, header_start, stats.blocks_done - blocks_before,
+							stats.txs_done - txs_before, read_seconds, parse_seconds)
+
+	return blocks, offset + header_start, report
+
+
+def read_ahead(files, queue, stop, stats):
+	# reader stage of the load pipeline: (data, read seconds, error) of each (filename, offset) in order
+	# blocks while queue is full, so at most its size of files wait in memory
+	for i in range(0, len(files)):
+		filename, offset = files[i]
+
+		# disk fetches the next file while this one is read and the queue is full
+		if i + 1 < len(files):
+			prefetch_file(files[i + 1][0], files[i + 1][1])
+
+		read_start = time.time()
+		try:
+			item = (read_file(filename, offset), time.time() - read_start, None)
+		except (IOError, OSError) as error:
+			item = (None, 0.0, error)
+
+		# read time overlaps parsing, so it is recorded without changing the current phase
+		stats.add("read", item[1])
+
+		while not stop.is_set():
+			try:
+				queue.put(item, timeout=0.1)
 				break
+			except Full:
+				continue
 
-	file.close()
+		if item[2] is not None or stop.is_set():
+			return
 	return
 
 
+def iter_files(files, stats):
+	# (filename, offset, data, read seconds) of each (filename, offset), read ahead on a thread
+	# while the caller parses, so wall time approaches the larger of read and parse time
+	if read_ahead_files == 0 or len(files) < 2:
+		for filename, offset in files:
+			read_start = stats.begin_phase("read")
+			data = read_file(filename, offset)
+			stats.end_phase("read", read_start)
+			yield filename, offset, data, time.time() - read_start
+		return
+
+	queue = Queue(read_ahead_files)
+	stop = threading.Event()
+	reader = threading.Thread(target=read_ahead, args=(files, queue, stop, stats))
+	reader.daemon = True
+	reader.start()
+
+	try:
+		for filename, offset in files:
+			# time parser waits on the reader, zero when parsing is the slower stage
+			wait_start = stats.begin_phase("read_wait")
+			data, read_seconds, error = queue.get()
+			stats.end_phase("read_wait", wait_start)
+
+			if error is not None:
+				raise error
+
+			yield filename, offset, data, read_seconds
+	finally:
+		# release reader blocked on a full queue if parsing stopped early
+		stop.set()
+		try:
+			while True:
+				queue.get_nowait()
+		except Empty:
+			pass
+		reader.join()
+
+
+def load_transactions(block):
+	# transactions of a block dropped from memory, parsed again from its file
+	txs = transaction_cache.get(block.location)
+	if txs is not None:
+		return txs
+
+	filename, offset = block.location
+	with open(filename, "rb") as file:
+		file.seek(offset)
+		# size(magic_num) + size(blocksize)
+		data = file.read(4 + 4)
+		block_size = struct.unpack("<I", data[4: 8])[0]
+		data = memoryview(data + file.read(block_size))
+
+	txs = parse_block(data, 0, reload_stats)[0].get_transactions()
+
+	# input values resolved when the block was loaded
+	if block.input_values_start != -1:
+		input_values = current.tx_index.input_values.read(block.input_values_start, len(txs))
+		for tx_pos in range(0, len(txs)):
+			txs[tx_pos].set_input_value(input_values[tx_pos])
+	transaction_cache.put(block.location, txs, block_size * parsed_size_ratio)
+
+	return txs
+
+
 def get_filename(directory_path, nth_file):
 	# left padd zero strings
 	nth_file_string = str(nth_file).zfill(5)
@@ -584,383 +820,817 @@ def get_filename(directory_path, nth_file):
 	return directory_path + "blk" + nth_file_string + ".dat"
 
 
-def load_blockchain(directory_path):
+def get_filenames(directory_path):
 	nth_file = 0
-	# load all .dat files in given directory path
+	# all .dat files in given directory path
+	filenames = []
 	filename = get_filename(directory_path, nth_file)
 
-	# load every file
 	while os.path.isfile(filename):
-		load_file(filename)
+		filenames += [filename]
 
-		print ("Parsed " + filename)
-
-		# parse next file
+		# next file
 		nth_file += 1
 		filename = get_filename(directory_path, nth_file)
 
-	return
+	return filenames
+
+
+def load_blockchain(directory_path, stats, file_loaded):
+	# parse bytes appended to every file since last load, returns blocks and new file offsets
+	# file_loaded is called with the blocks of each file once it is parsed
+	blocks = []
+	offsets = {}
 
+	# (filename, offset) of files with bytes not parsed yet
+	files = []
+	filenames = get_filenames(directory_path)
+	for filename in filenames:
+		offset = file_offsets.get(filename, 0)
+
+		# blocks are only appended to the last file, earlier files are complete once loaded
+		if filename in file_offsets and filename != filenames[-1]:
+			continue
+
+		# skip files with nothing new
+		if os.stat(filename).st_size <= offset:
+			continue
 
-def compute_distances_bfs():
-	# start from source vertex
-	queue = [source_hash]
-	# mark all vertices not visited
-	distances = {source_hash: 0}
-	# track the longest distance to source
-	max_distance = -1
+		files += [(filename, offset)]
+
+	for filename, offset, data, read_seconds in iter_files(files, stats):
+		file_blocks, offsets[filename], report = parse_file(filename, offset, data, read_seconds, stats)
+		file_loaded(file_blocks)
+		blocks += file_blocks
+
+		if len(file_blocks) != 0:
+			print ("Parsed " + filename + " (%.1f MB/s, %.1f blocks/s, %.1f txs/s)" %
+				(report["bytes_per_second"] / 1e6, report["blocks_per_second"], report["txs_per_second"]))
+
+	return blocks, offsets
+
+
+def get_connected_roots(gen, blocks):
+	# (hash, height) of connected blocks that new blocks extend, source vertex has height -1
+	roots = {}
+	for block in blocks:
+		prev_hash = block.get_prev_hash_little()
+
+		if prev_hash == source_hash:
+			roots[prev_hash] = -1
+			continue
+
+		# previous block not loaded yet or itself not connected
+		prev_block = gen.get_block(prev_hash)
+		if prev_block is not None and prev_block.get_height() != -1:
+			roots[prev_hash] = prev_block.get_height()
+
+	return list(roots.items())
+
+
+def compute_distances_bfs(gen, roots):
+	# start from connected vertices
+	queue = collections.deque([curr_hash for curr_hash, height in roots])
+	# mark all other vertices not visited
+	heights = dict(roots)
+	# track the highest block reached
+	max_height = -1
 	max_hash = ""
 
 	# traverse all vertices
 	while len(queue) != 0:
-		# remove and return first element in list
-		curr_hash = queue.pop(0)
+		# remove and return first element
+		curr_hash = queue.popleft()
 
 		# skip vertex with no outgoing neighbor
-		if curr_hash not in prev_hash_to_blocks:
+		if curr_hash not in gen.prev_hash_to_blocks:
 			continue
 
 		# get all outgoing neighbors
-		blocks = prev_hash_to_blocks[curr_hash]
+		blocks = gen.prev_hash_to_blocks[curr_hash]
 
 		# traverse outgoing neighbors
 		for block in blocks:
 			# compute header hash
 			next_hash = block.get_curr_hash_little()
 
-			# add to stack if not visited
-			if next_hash not in distances:
-				# insert element to end of list
+			# add to queue if not visited
+			if next_hash not in heights:
+				# insert element to end of queue
 				queue.append(next_hash)
 
-				# compute distance to source
-				distances[next_hash] = distances[curr_hash] + 1
-				block.set_height(distances[next_hash] - 1)
+				# one block higher than its previous block
+				heights[next_hash] = heights[curr_hash] + 1
+				block.set_height(heights[next_hash])
 
 				# record longest chain
-				if distances[next_hash] > max_distance:
-					max_distance = distances[next_hash]
+				if heights[next_hash] > max_height:
+					max_height = heights[next_hash]
 					max_hash = next_hash
 
-	return max_hash, max_distance - 1
+	return max_hash, max_height
+
+
+def update_main_chain(gen, tip_hash):
+	# switch main chain to end at tip, returns height of first block that changed
+	chain = []
+
+	# walk back from tip until a block already in main chain
+	block = gen.get_block(tip_hash)
+	while block is not None and not gen.is_main_chain(block):
+		chain += [block]
+		block = gen.get_block(block.get_prev_hash_little())
+
+	# index main chain blocks by height
+	chain.reverse()
+	fork_height = chain[0].get_height()
+	main_chain_blocks = gen.main_chain_blocks.branch()
+	main_chain_blocks.truncate(fork_height)
+	for block in chain:
+		main_chain_blocks.append(block)
+	gen.main_chain_blocks = main_chain_blocks
+	gen.blockchain_height = len(gen.main_chain_blocks) - 1
+	gen.latest_block_little = tip_hash
+
+	return fork_height
+
+
+def compute_input_values(gen, txs):
+	# resolve input values of transactions from the prevout values, returns transactions left unresolved
+	# previous transactions are found through the txid index, so no per transaction map of values is kept
+	unresolved = []
+	for tx in txs:
+		if resolve_input_value(gen, tx) == -1:
+			unresolved += [tx]
+
+	return unresolved
+
+
+def store_input_values(gen, blocks, unresolved):
+	# resolve input values of blocks about to drop their transactions from memory and write them to
+	# the input value file, where transactions parsed again from the files read them back
+	# unresolved are (tx, block, value index) of earlier transactions spending outputs not loaded then,
+	# returns those still unresolved
+	input_values = gen.tx_index.input_values
+
+	still_unresolved = []
+	for tx, block, index in unresolved:
+		satoshi = resolve_input_value(gen, tx)
+		if satoshi == -1:
+			still_unresolved += [(tx, block, index)]
+			continue
+
+		input_values.resolve(index, satoshi)
+		# cached transactions were parsed with the value unknown
+		transaction_cache.discard(block.location)
+
+	for block in blocks:
+		txs = block.get_transactions()
+		block.input_values_start = input_values.append([resolve_input_value(gen, tx) for tx in txs])
+
+		for tx_pos in range(0, len(txs)):
+			if txs[tx_pos].get_input_value_int() == -1:
+				still_unresolved += [(txs[tx_pos], block, block.input_values_start + tx_pos)]
+
+	return still_unresolved
+
+
+def build_address_index(gen, disconnected_blocks, fork_height):
+	# inverted index from output script hash to main chain outputs
+
+	# drop postings of blocks no longer in main chain, postings are in height order
+	for block in disconnected_blocks:
+		for tx in block.get_transactions():
+			for output_tx in tx.get_outputs():
+				key = script.get_index_key(output_tx.get_script_little())
+				postings = gen.address_index.get_writable(key, copy_postings, ())
+				while len(postings) != 0 and postings[-3] >= fork_height:
+					del postings[-3:]
+
+	# add postings of blocks that joined main chain
+	for height in range(fork_height, len(gen.main_chain_blocks)):
+		txs = gen.main_chain_blocks[height].get_transactions()
+
+		for tx_pos in range(0, len(txs)):
+			output_txs = txs[tx_pos].get_outputs()
+
+			for vout in range(0, len(output_txs)):
+				key = script.get_index_key(output_txs[vout].get_script_little())
+
+				# posting list of (block height, tx position, vout)
+				gen.address_index.get_writable(key, copy_postings, ()).extend((height, tx_pos, vout))
+
+	return
+
+
+def resolve_input_value(gen, tx):
+	# input value of a transaction from the prevout values, -1 if any previous output is not loaded
+	if tx.is_coinbase():
+		tx.set_input_value(0)
+		return 0
+
+	satoshi = 0
+	for input_tx in tx.get_inputs():
+		prev_values = gen.get_output_values(input_tx.get_prev_hash_little())
+		prev_index = input_tx.get_prev_index_int()
+		if prev_values is None or prev_index >= len(prev_values):
+			return -1
+
+		satoshi += prev_values[prev_index]
+
+	# only ever changes from unknown to resolved, so readers of older generations stay correct
+	tx.set_input_value(satoshi)
+	return satoshi
+
 
+def copy_postings(postings):
+	return array.array("I", postings)
 
-def setup(directory_path):
-	global blockchain_height
-	global latest_block_little
 
-	# load all blocks
+def load_tx_index(gen, path):
+	# use packed index saved by an earlier run if its blocks are loaded in the same order
+	tx_index, last_block_hash = txindex.load(path)
+	if tx_index is None or tx_index.block_count == 0 or tx_index.block_count > gen.block_count:
+		return
+
+	if codec.to_hex(last_block_hash) != gen.blocks[tx_index.block_count - 1].get_curr_hash_little():
+		print("Ignored packed txid index of other blocks in " + path)
+		return
+
+	gen.tx_index = tx_index
+	print("Mapped packed txid index of " + str(tx_index.block_count) + " blocks from " + path)
+	return
+
+
+def save_tx_index(gen, path):
+	last_block = gen.blocks[gen.tx_index.block_count - 1]
+	gen.tx_index.save(path, codec.from_hex(last_block.get_curr_hash_little()))
+	return
+
+
+def setup(directory_path, profiler=None, profile_path="load_profile.txt", trace_memory=False):
+	# time every load phase, optionally under a profiler writing its report to profile_path
+	load_stats.start(get_filenames(directory_path), trace_memory)
+
+	loadstats.run_profiled(lambda: setup_blockchain(directory_path), profiler, profile_path)
+
+	load_stats.finish()
+	print(load_stats.report())
+	if profiler is not None:
+		print("Load profile written to " + profile_path)
+
+	return
+
+
+def setup_blockchain(directory_path):
+	global current
+
+	# first generation holds every block of the files
+	if disk_index_path is not None:
+		current = generation.IndexGeneration(tx_index=diskindex.open_index(disk_index_path))
+
 	print("Load blockchain files...")
-	load_blockchain(directory_path)
-
-	# breath first search to compute each vertex distance to source
-	print("Compute BFS distances from genesis block...")
-	longest_hash, longest_chain_height = compute_distances_bfs()
-	#print("Main Chain Height: " + str(longest_chain_height))
-	blockchain_height = longest_chain_height
-	latest_block_little = longest_hash
-
-	# get latest block hash
-	latest_block = latest_block_little.decode('hex')[::-1].encode('hex_codec')
-	#print("Latest Block Hash: " + latest_block)
-	
-	curr_hash = longest_hash
-	prev_hash = curr_hash_to_prev_hash[longest_hash]
-	# flag main chain blocks from the longest latest block to genesis block
-	while prev_hash != source_hash:
-		# get current block
-		blocks = prev_hash_to_blocks[prev_hash]
-		for block in blocks:
-			# set main chain flag
-			if block.get_curr_hash_little() == curr_hash:
-				#print(curr_hash)
-				block.set_main_chain()
-				break
-		
-		# flag previous block
-		curr_hash = prev_hash
-		prev_hash = curr_hash_to_prev_hash[prev_hash]
-
-	# get genesis block
-	blocks = prev_hash_to_blocks[source_hash]
-	# set main chain flag
-	blocks[0].set_main_chain()
-	
+	update_blockchain(directory_path, load_stats)
+
 	return
 
 
+def update(directory_path):
+	# load blocks appended to the files since the last load, returns number of new blocks
+	stats = loadstats.LoadStats()
+	stats.start(get_filenames(directory_path))
+
+	return update_blockchain(directory_path, stats)
+
+
+def update_blockchain(directory_path, stats):
+	global current
+	global unresolved_txs
+	global unresolved_values
+
+	with update_lock:
+		# new generation on top of the published one, invisible to readers until swapped in
+		previous = current
+		gen = generation.IndexGeneration(previous)
+		# transactions on disk left unresolved by this update so far
+		pending_values = list(unresolved_values)
+
+		def index_blocks(file_blocks):
+			phase_start = stats.begin_phase("index")
+			for block in file_blocks:
+				gen.add_block(block)
+			stats.end_phase("index", phase_start)
+
+			# transactions on disk are indexed file by file, so only one file of them is ever in memory
+			if not gen.tx_index.resident:
+				phase_start = stats.begin_phase("txindex")
+				gen.tx_index = gen.tx_index.extend(gen.blocks, gen.block_count)
+				stats.end_phase("txindex", phase_start)
+
+				# resolved before dropping transactions, so fees need no lookup of previous transactions
+				phase_start = stats.begin_phase("input_values")
+				pending_values[:] = store_input_values(gen, file_blocks, pending_values)
+				for block in file_blocks:
+					block.unload_transactions()
+				stats.end_phase("input_values", phase_start)
+			return
+
+		# load and index all new blocks
+		blocks, offsets = load_blockchain(directory_path, stats, index_blocks)
+		if len(blocks) == 0:
+			return 0
+
+		# pack txids of every block into a sorted array once recent ones are a large share of it
+		if gen.tx_index.resident:
+			print("Index transaction hashes...")
+			phase_start = stats.begin_phase("txindex")
+			if len(gen.tx_index) == 0 and txindex_path is not None:
+				load_tx_index(gen, txindex_path)
+			if gen.index_transactions(previous.block_count) and txindex_path is not None:
+				save_tx_index(gen, txindex_path)
+			stats.end_phase("txindex", phase_start)
+
+		# breath first search to compute distance to source of each newly connected vertex
+		print("Compute BFS distances from genesis block...")
+		phase_start = stats.begin_phase("bfs")
+		longest_hash, longest_chain_height = compute_distances_bfs(gen, get_connected_roots(gen, blocks))
+		stats.end_phase("bfs", phase_start)
+
+		# resolve input values once so fees need no lookup of previous transactions
+		# transactions on disk were resolved file by file instead
+		unresolved = []
+		if gen.tx_index.resident:
+			print("Resolve input values from prevout values...")
+			phase_start = stats.begin_phase("input_values")
+			txs = unresolved_txs + [tx for block in blocks for tx in block.get_transactions()]
+			unresolved = compute_input_values(gen, txs)
+			stats.end_phase("input_values", phase_start)
+
+		# longer chain becomes main chain, first block seen wins ties
+		if longest_hash != "" and (gen.latest_block_little == "" or longest_chain_height > gen.blockchain_height):
+			phase_start = stats.begin_phase("main_chain")
+			fork_height = update_main_chain(gen, longest_hash)
+			stats.end_phase("main_chain", phase_start)
+
+			# store main chain header fields column by column, on a branch readers do not see
+			print("Build header columns...")
+			phase_start = stats.begin_phase("header_store")
+			store = gen.header_store.branch()
+			store.truncate(fork_height - 1)
+			store.extend(gen.main_chain_blocks[fork_height:])
+			gen.header_store = store
+			stats.end_phase("header_store", phase_start)
+
+			# index main chain outputs by address, too large to keep when transactions are on disk
+			if gen.tx_index.resident:
+				print("Build address index...")
+				phase_start = stats.begin_phase("address_index")
+				build_address_index(gen, previous.main_chain_blocks[fork_height:], fork_height)
+				stats.end_phase("address_index", phase_start)
+
+		# merge small index layers so lookups stay within a few dicts
+		phase_start = stats.begin_phase("compact")
+		gen.compact()
+		stats.end_phase("compact", phase_start)
+
+		# publish with one reference swap, readers holding previous generation are unaffected
+		current = gen
+		file_offsets.update(offsets)
+		unresolved_txs = unresolved
+		unresolved_values = pending_values
+
+		# one broadcast to every thread waiting for a new latest block
+		with published:
+			published.notify_all()
+
+	return len(blocks)
+
+
 def get_block_header(block_hash_big):
 	# convert to little endian
-	block_hash_little = block_hash_big.decode('hex')[::-1].encode('hex_codec')
+	block_hash_little = codec.reverse_hex(block_hash_big)
 
-	# check if block hash exists
-	if block_hash_little not in curr_hash_to_prev_hash:
+	# get block, -1 if block hash not exists
+	block = current.get_block(block_hash_little)
+	if block is None:
 		return -1, "", "", -1, -1, -1
 
-	# previous block hash
-	prev_hash = curr_hash_to_prev_hash[block_hash_little]
-	blocks = prev_hash_to_blocks[prev_hash]
-	# get block
-	for block in blocks:
-		if block.get_curr_hash_little() == block_hash_little:
-
-			# get header fields
-			ver_num = block.get_version_int()
-			prev_hash = block.get_prev_hash_big()
-			merk_hash = block.get_merk_hash_big()
-			start_time = block.get_time_int()
-			nBits = block.get_nBits_int()
-			nonce = block.get_nonce_int()
-
-			return ver_num, prev_hash, merk_hash, start_time, nBits, nonce
+	# get header fields
+	ver_num = block.get_version_int()
+	prev_hash = block.get_prev_hash_big()
+	merk_hash = block.get_merk_hash_big()
+	start_time = block.get_time_int()
+	nBits = block.get_nBits_int()
+	nonce = block.get_nonce_int()
 
-	return -1, "", "", -1, -1, -1
+	return ver_num, prev_hash, merk_hash, start_time, nBits, nonce
 
 
 def get_block_height(block_hash_big):
 	# convert to little endian
-	block_hash_little = block_hash_big.decode('hex')[::-1].encode('hex_codec')
+	block_hash_little = codec.reverse_hex(block_hash_big)
 
-	# check if block hash exists
-	if block_hash_little not in curr_hash_to_prev_hash:
+	# get block, -1 if block hash not exists
+	block = current.get_block(block_hash_little)
+	if block is None:
 		return -1
 
-	# previous block hash
-	prev_hash = curr_hash_to_prev_hash[block_hash_little]
-	blocks = prev_hash_to_blocks[prev_hash]
-	# get block
-	for block in blocks:
-		if block.get_curr_hash_little() == block_hash_little:
-
-			return block.get_height()
-
-	return -1
+	# stale blocks keep the height they were connected at, a block whose previous block
+	# is not loaded yet reports 0 as it always has
+	return max(block.get_height(), 0)
 
 
 def get_main_chain(block_hash_big):
 	# convert to little endian
-	block_hash_little = block_hash_big.decode('hex')[::-1].encode('hex_codec')
+	block_hash_little = codec.reverse_hex(block_hash_big)
 
-	# check if block hash exists
-	if block_hash_little not in curr_hash_to_prev_hash:
-		return False
-
-	# previous block hash
-	prev_hash = curr_hash_to_prev_hash[block_hash_little]
-	blocks = prev_hash_to_blocks[prev_hash]
-	# get block
-	for block in blocks:
-		if block.get_curr_hash_little() == block_hash_little:
+	# one generation answers both lookups
+	gen = current
 
-			return block.get_main_chain()
+	# get block, False if block hash not exists
+	block = gen.get_block(block_hash_little)
+	if block is None:
+		return False
 
-	return False
+	return gen.is_main_chain(block)
 
 
 def get_latest_block():
 	# get latest block hash big endian
-	latest_block = latest_block_little.decode('hex')[::-1].encode('hex_codec')
+	latest_block = codec.reverse_hex(current.latest_block_little)
 
 	return latest_block
 
 
 def get_latest_height():
-	return blockchain_height
+	return current.blockchain_height
 
 
 def get_block_transactions(block_hash_big):
 	# convert to little endian
-	block_hash_little = block_hash_big.decode('hex')[::-1].encode('hex_codec')
+	block_hash_little = codec.reverse_hex(block_hash_big)
 
-	# check if block hash exists
-	if block_hash_little not in curr_hash_to_prev_hash:
+	# get block, -1 if block hash not exists
+	block = current.get_block(block_hash_little)
+	if block is None:
 		return -1, []
 
-	# previous block hash
-	prev_hash = curr_hash_to_prev_hash[block_hash_little]
-	blocks = prev_hash_to_blocks[prev_hash]
-
-	# get block
-	for block in blocks:
-		if block.get_curr_hash_little() == block_hash_little:
-
-			# number of transactions in this block
-			count = block.get_tx_count_int()
-			# list of transactions (Transaction)
-			txs = block.get_transactions()
-
-			parsed_txs = []
-			# traverse all transactions
-			for i in range(0, count):
-				tx = txs[i]
+	# number of transactions in this block
+	count = block.get_tx_count_int()
+	# list of transactions (Transaction)
+	txs = block.get_transactions()
 
-				# txid of the transaction
-				txid = tx.get_hash_big()
+	parsed_txs = []
+	# traverse all transactions
+	for i in range(0, count):
+		tx = txs[i]
 
-				# number of output transactions
-				output_count = tx.get_output_count_int()
-				# list of output transactions (OutputTransaction)
-				output_txs = tx.get_outputs()
+		# txid of the transaction
+		txid = tx.get_hash_big()
 
-				btc_amount = 0.0
-				# traverse all output transactions
-				for j in range(0, output_count):
-					output_tx = output_txs[j]
+		# number of output transactions
+		output_count = tx.get_output_count_int()
+		# list of output transactions (OutputTransaction)
+		output_txs = tx.get_outputs()
 
-					# 100000000 satoshi = 1 BTC
-					satoshi = output_tx.get_satoshi_int()
-					btc_amount += (satoshi / 100000000.0)
+		btc_amount = 0.0
+		# traverse all output transactions
+		for j in range(0, output_count):
+			output_tx = output_txs[j]
 
-				parsed_txs += [(txid, btc_amount)]
-			
-			return count, parsed_txs
+			# 100000000 satoshi = 1 BTC
+			satoshi = output_tx.get_satoshi_int()
+			btc_amount += (satoshi / 100000000.0)
 
-	return -1, []
+		parsed_txs += [(txid, btc_amount)]
+	
+	return count, parsed_txs
 
 
 def get_transaction_info(tx_hash_big):
 	# convert to little endian
-	tx_hash_little = tx_hash_big.decode('hex')[::-1].encode('hex_codec')
+	tx_hash_little = codec.reverse_hex(tx_hash_big)
+
+	gen = current
+
+	# get block containing the transaction, main chain one first, and other blocks containing it
+	block, position, alternates = gen.find_transaction_blocks(tx_hash_little)
 
 	# check if tx hash exists
-	if tx_hash_little not in txid_to_prev_hash:
-		return "", -1, -1, -1, 0.0, -1 
+	if block is None:
+		return "", -1, -1, -1, 0.0, -1, -1.0, -1.0, -1.0, []
 
-	# previous block hash
-	prev_hash = txid_to_prev_hash[tx_hash_little]
-	blocks = prev_hash_to_blocks[prev_hash]
+	alternate_hashes = [alternate.get_curr_hash_big() for alternate in alternates]
 
-	# get block
-	for block in blocks:
-		# number of transactions in this block
-		count = block.get_tx_count_int()
-		# list of transactions (Transaction)
-		txs = block.get_transactions()
+	return get_transaction_summary(gen, block, block.get_transactions()[position]) + (alternate_hashes,)
 
-		# traverse all transactions
-		for i in range(0, count):
-			tx = txs[i]
 
-			if tx.get_hash_little() == tx_hash_little:
-				# transaction version number
-				ver = tx.get_version_int()
+def get_transaction_summary(gen, block, tx):
+	# transaction version number
+	ver = tx.get_version_int()
 
-				# number of input transactions
-				input_count = tx.get_input_count_int()
+	# number of input transactions
+	input_count = tx.get_input_count_int()
 
-				# number of output transactions
-				output_count = tx.get_output_count_int()
+	# number of output transactions
+	output_count = tx.get_output_count_int()
 
-				# list of output transactions (OutputTransaction)
-				output_txs = tx.get_outputs()
+	# list of output transactions (OutputTransaction)
+	output_txs = tx.get_outputs()
 
-				btc_amount = 0.0
-				# traverse all output transactions
-				for j in range(0, output_count):
-					output_tx = output_txs[j]
+	btc_amount = 0.0
+	# traverse all output transactions
+	for j in range(0, output_count):
+		output_tx = output_txs[j]
 
-					# 100000000 satoshi = 1 BTC
-					satoshi = output_tx.get_satoshi_int()
-					btc_amount += (satoshi / 100000000.0)
+		# 100000000 satoshi = 1 BTC
+		satoshi = output_tx.get_satoshi_int()
+		btc_amount += (satoshi / 100000000.0)
 
-				# lock time
-				locktime = tx.get_locktime_int()
+	# lock time
+	locktime = tx.get_locktime_int()
 
-				return block.get_curr_hash_big(), ver, input_count, output_count, btc_amount, locktime
+	# input value resolved at load time, read back with the transactions if they are on disk
+	input_satoshi = tx.get_input_value_int()
+
+	# fee is unknown if any previous output was not loaded
+	if input_satoshi == -1:
+		input_btc = -1.0
+		fee_btc = -1.0
+		fee_rate = -1.0
+	elif tx.is_coinbase():
+		input_btc = 0.0
+		fee_btc = 0.0
+		fee_rate = 0.0
+	else:
+		fee_satoshi = input_satoshi - tx.get_output_value_int()
+		input_btc = input_satoshi / 100000000.0
+		fee_btc = fee_satoshi / 100000000.0
+		# satoshi per byte
+		fee_rate = fee_satoshi / float(tx.get_size_int())
 
-	return "", -1, -1, -1, 0.0, -1
+	return (block.get_curr_hash_big(), ver, input_count, output_count, btc_amount, locktime,
+			input_btc, fee_btc, fee_rate)
 
 
 def get_transaction_inputs(tx_hash_big):
 	# convert to little endian
-	tx_hash_little = tx_hash_big.decode('hex')[::-1].encode('hex_codec')
+	tx_hash_little = codec.reverse_hex(tx_hash_big)
+
+	# get block containing the transaction
+	block, position = current.find_transaction(tx_hash_little)
 
 	# check if tx hash exists
-	if tx_hash_little not in txid_to_prev_hash:
+	if block is None:
 		return -1, []
 
-	# previous block hash
-	prev_hash = txid_to_prev_hash[tx_hash_little]
-	blocks = prev_hash_to_blocks[prev_hash]
+	tx = block.get_transactions()[position]
 
-	# get block
-	for block in blocks:
-		# number of transactions in this block
-		count = block.get_tx_count_int()
-		# list of transactions (Transaction)
-		txs = block.get_transactions()
-
-		# traverse all transactions
-		for i in range(0, count):
-			tx = txs[i]
+	return tx.get_input_count_int(), get_input_details(tx)
 
-			if tx.get_hash_little() == tx_hash_little:
-				# number of input transactions
-				input_count = tx.get_input_count_int()
 
-				# list of input transactions (InputTransaction)
-				input_txs = tx.get_inputs()
+def get_input_details(tx):
+	# number of input transactions
+	input_count = tx.get_input_count_int()
 
-				parsed_input_txs = []
-				# traverse all input transactions
-				for j in range(0, input_count):
-					input_tx = input_txs[j]
+	# list of input transactions (InputTransaction)
+	input_txs = tx.get_inputs()
 
-					prev_txid = input_tx.get_prev_hash_big()
-					script = input_tx.get_script_big()
-					seq = input_tx.get_seq_int()
+	parsed_input_txs = []
+	# traverse all input transactions
+	for j in range(0, input_count):
+		input_tx = input_txs[j]
 
-					parsed_input_txs += [(prev_txid, script, seq)]
+		prev_txid = input_tx.get_prev_hash_big()
+		script = input_tx.get_script_big()
+		seq = input_tx.get_seq_int()
 
-				return input_count, parsed_input_txs
+		parsed_input_txs += [(prev_txid, script, seq)]
 
-	return -1, []
+	return parsed_input_txs
 
 
 def get_transaction_outputs(tx_hash_big):
 	# convert to little endian
-	tx_hash_little = tx_hash_big.decode('hex')[::-1].encode('hex_codec')
+	tx_hash_little = codec.reverse_hex(tx_hash_big)
+
+	# get block containing the transaction
+	block, position = current.find_transaction(tx_hash_little)
 
 	# check if tx hash exists
-	if tx_hash_little not in txid_to_prev_hash:
+	if block is None:
 		return -1, []
 
-	# previous block hash
-	prev_hash = txid_to_prev_hash[tx_hash_little]
-	blocks = prev_hash_to_blocks[prev_hash]
+	tx = block.get_transactions()[position]
 
-	# get block
-	for block in blocks:
-		# number of transactions in this block
-		count = block.get_tx_count_int()
-		# list of transactions (Transaction)
-		txs = block.get_transactions()
+	return tx.get_output_count_int(), get_output_details(tx)
 
-		# traverse all transactions
-		for i in range(0, count):
-			tx = txs[i]
 
-			if tx.get_hash_little() == tx_hash_little:
-				# number of output transactions
-				output_count = tx.get_output_count_int()
+def get_output_details(tx):
+	# number of output transactions
+	output_count = tx.get_output_count_int()
 
-				# list of output transactions (OutputTransaction)
-				output_txs = tx.get_outputs()
+	# list of output transactions (OutputTransaction)
+	output_txs = tx.get_outputs()
 
-				parsed_output_txs = []
-				# traverse all output transactions
-				for j in range(0, output_count):
-					output_tx = output_txs[j]
+	parsed_output_txs = []
+	# traverse all output transactions
+	for j in range(0, output_count):
+		output_tx = output_txs[j]
+
+		# 100000000 satoshi = 1 BTC
+		satoshi = output_tx.get_satoshi_int()
+		script_big = output_tx.get_script_big()
+
+		# script type and address it pays to
+		script_type, address = script.classify_script(output_tx.get_script_little())
+
+		parsed_output_txs += [(satoshi / 100000000.0, script_big, script_type, address)]
+
+	return parsed_output_txs
+
+
+def get_block_transaction_range(block_hash_big, start, count):
+	# summary, inputs and outputs of up to count transactions from position start of the block
+	# read from the block's transaction list, no transaction hash is looked up
+	# convert to little endian
+	block_hash_little = codec.reverse_hex(block_hash_big)
+
+	gen = current
+
+	# get block, -1 if block hash not exists
+	block = gen.get_block(block_hash_little)
+	if block is None:
+		return -1, []
+
+	txs = block.get_transactions()
+
+	parsed_txs = []
+	# traverse transactions of the range
+	for position in range(start, min(start + count, len(txs))):
+		tx = txs[position]
+		parsed_txs += [(tx.get_hash_big(), position, get_transaction_summary(gen, block, tx),
+						get_input_details(tx), get_output_details(tx))]
+
+	return block.get_tx_count_int(), parsed_txs
+
+
+def has_address_index():
+	# address index is not built when transactions are on disk
+	return current.tx_index.resident
+
+
+def get_address_outputs(address, page):
+	# look up by address or by 64 hex char script hash
+	if len(address) == 64 and all([c in string.hexdigits for c in address]):
+		script_hash = codec.from_hex(address)
+	else:
+		output_script = script.address_to_script(address)
+
+		# check if address is valid
+		if output_script == "":
+			return -1, []
+
+		script_hash = script.get_script_hash(output_script)
+
+	# postings and main chain blocks of one generation agree on heights
+	gen = current
+
+	# address never received main chain outputs
+	postings = gen.address_index.get(script_hash)
+	if postings is None:
+		return 0, []
+
+	# number of outputs paying to the address
+	count = len(postings) // 3
+
+	parsed_outputs = []
+	# traverse outputs of the requested page
+	start = page * address_page_size
+	end = min(start + address_page_size, count)
+	for i in range(start, end):
+		height = postings[i * 3]
+		tx_pos = postings[i * 3 + 1]
+		vout = postings[i * 3 + 2]
+
+		block = gen.main_chain_blocks[height]
+		tx = block.get_transactions()[tx_pos]
+		output_tx = tx.get_outputs()[vout]
+
+		# 100000000 satoshi = 1 BTC
+		btc_amount = output_tx.get_satoshi_int() / 100000000.0
+		script_type = script.classify_script(output_tx.get_script_little())[0]
+
+		parsed_outputs += [(height, block.get_curr_hash_big(), tx.get_hash_big(), vout, btc_amount, script_type)]
+
+	return count, parsed_outputs
+
+
+def get_range_stats(start_height, end_height):
+	header_store = current.header_store
+
+	# check if height range is in main chain
+	if start_height > end_height or end_height >= len(header_store):
+		return {}
+
+	return header_store.get_range_stats(start_height, end_height)
+
+
+def get_range_aggregates(start_height, end_height):
+	header_store = current.header_store
+
+	# check if height range is in main chain
+	if start_height > end_height or end_height >= len(header_store):
+		return {}
+
+	return header_store.get_range_aggregates(start_height, end_height)
+
+
+def get_blocks_between(start_time, end_time, page):
+	gen = current
+
+	# number of main chain blocks mined between the two times and heights of the requested page
+	count, heights = gen.header_store.get_time_range(start_time, end_time, page * blocks_page_size,
+													blocks_page_size)
+
+	parsed_blocks = []
+	# traverse blocks of the requested page
+	for height in heights:
+		parsed_blocks += [(height, gen.main_chain_blocks[height].get_curr_hash_big())]
+
+	return count, parsed_blocks
+
+
+def get_merkle_levels(block):
+	# merkle tree of the block from transaction hashes up to merkle root
+	block_hash_little = block.get_curr_hash_little()
+
+	levels = merkle_cache.get(block_hash_little)
+	if levels is not None:
+		return levels
+
+	# binary little endian transaction hashes
+	level = [codec.from_hex(tx.get_hash_little()) for tx in block.get_transactions()]
+	levels = [level]
+
+	# bottom-up merkle hashing
+	while len(level) > 1:
+		# pad the hashes with last hash if length is odd
+		if len(level) % 2 == 1:
+			level = level + [level[-1]]
+
+		# SHA256(SHA256(hash | hash))
+		level = [hashlib.sha256(hashlib.sha256(level[i] + level[i + 1]).digest()).digest()
+				for i in range(0, len(level), 2)]
+		levels += [level]
+
+	merkle_cache.put(block_hash_little, levels)
+
+	return levels
+
+
+def get_merkle_branch(levels, position):
+	# sibling hashes from transaction up to merkle root, big endian
+	branch = []
+	for level in levels[:-1]:
+		# odd last hash is paired with itself
+		sibling = position ^ 1
+		if sibling >= len(level):
+			sibling = position
+
+		branch += [codec.to_hex(level[sibling][::-1])]
+		position = position // 2
+
+	return branch
+
+
+def get_transaction_proofs(tx_hashes_big):
+	# merkle inclusion proof of each transaction, sharing tree levels per block
+	gen = current
+
+	parsed_proofs = []
+	for tx_hash_big in tx_hashes_big:
+		# convert to little endian
+		tx_hash_little = codec.reverse_hex(tx_hash_big)
+
+		block, position = gen.find_transaction(tx_hash_little)
+
+		# check if tx hash is invalid
+		if block is None:
+			parsed_proofs += [(tx_hash_big, "", "", -1, [])]
+			continue
 
-					# 100000000 satoshi = 1 BTC
-					satoshi = output_tx.get_satoshi_int()
-					script = output_tx.get_script_big()
+		levels = get_merkle_levels(block)
+		branch = get_merkle_branch(levels, position)
 
-					parsed_output_txs += [(satoshi / 100000000.0, script)]
+		parsed_proofs += [(tx_hash_big, block.get_curr_hash_big(), block.get_merk_hash_big(), position, branch)]
 
-				return output_count, parsed_output_txs
+	return parsed_proofs
 
-	return -1, []
 
+def get_transaction_proof(tx_hash_big):
+	return get_transaction_proofs([tx_hash_big])[0][1:]
 
 
+def get_load_progress():
+	return load_stats.get_progress()
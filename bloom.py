@@ -0,0 +1,55 @@
+# bloom.py
+# Bloom filter of 64 bit hash prefixes, answering most misses without a lookup
+
+# https://en.wikipedia.org/wiki/Bloom_filter#Optimal_number_of_hash_functions
+# https://www.eecs.harvard.edu/~michaelm/postscripts/rsa2008.pdf
+
+import math
+
+
+# share of absent keys reported as maybe present
+error_rate = 0.01
+
+
+class BloomFilter:
+	# bit array probed at positions derived from the key, no false negatives
+	# keys are prefixes of SHA256 hashes, uniform already, so probes are derived from the key
+	# itself by double hashing instead of hashing it again
+
+	def __init__(self, size, hashes, bits=None):
+		# number of bits, a power of two
+		assert (size & (size - 1) == 0)
+		self.size = size
+		# number of bits set per key
+		self.hashes = hashes
+		# bit i is bit i % 8 of byte i // 8
+		self.bits = bits if bits is not None else bytearray((size + 7) // 8)
+
+	def probes(self, key):
+		low = key & 0xFFFFFFFF
+		# an odd step is coprime with the power of two size, so the probes of a key never collide
+		step = (key >> 32) | 1
+		mask = self.size - 1
+		return [(low + i * step) & mask for i in range(0, self.hashes)]
+
+	def add(self, key):
+		for bit in self.probes(key):
+			self.bits[bit >> 3] |= 1 << (bit & 7)
+		return
+
+	def __contains__(self, key):
+		for bit in self.probes(key):
+			if not self.bits[bit >> 3] & (1 << (bit & 7)):
+				return False
+		return True
+
+
+def for_capacity(capacity):
+	# filter sized for capacity keys at error_rate or better, about 10 to 20 bits per key at 1%
+	optimal_size = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+	# rounded up to a power of two, so probes with an odd step are distinct
+	size = 64
+	while size < optimal_size:
+		size *= 2
+	hashes = max(1, int(round(size / float(max(capacity, 1)) * math.log(2))))
+	return BloomFilter(size, hashes)
@@ -0,0 +1,88 @@
+# cache.py
+# Bounded least recently used cache shared by request threads
+
+import threading
+import collections
+
+
+# every cache created, to report sizes and hit rates
+caches = []
+
+
+class LRUCache:
+
+	def __init__(self, name, capacity):
+		# name of the cache in reports
+		self.name = name
+		# maximum total size of entries, the number of entries unless they are put with a size
+		self.capacity = capacity
+		# key -> value, least recently used first
+		self.items = collections.OrderedDict()
+		# key -> size of entry, and their sum
+		self.sizes = {}
+		self.total_size = 0
+		# request threads share the cache
+		self.lock = threading.Lock()
+		# number of lookups found and not found
+		self.hits = 0
+		self.misses = 0
+
+		caches.append(self)
+
+	def __len__(self):
+		return len(self.items)
+
+	def __contains__(self, key):
+		return key in self.items
+
+	def get(self, key, default=None):
+		with self.lock:
+			if key not in self.items:
+				self.misses += 1
+				return default
+
+			# move to most recently used end
+			value = self.items.pop(key)
+			self.items[key] = value
+			self.hits += 1
+
+			return value
+
+	def put(self, key, value, size=1):
+		# an entry larger than the whole capacity is evicted at once
+		with self.lock:
+			if key in self.items:
+				self.items.pop(key)
+				self.total_size -= self.sizes.pop(key)
+			self.items[key] = value
+			self.sizes[key] = size
+			self.total_size += size
+
+			# evict least recently used entries
+			while self.total_size > self.capacity:
+				evicted = self.items.popitem(last=False)[0]
+				self.total_size -= self.sizes.pop(evicted)
+
+		return
+
+	def discard(self, key):
+		# drop entry if present
+		with self.lock:
+			if key in self.items:
+				self.items.pop(key)
+				self.total_size -= self.sizes.pop(key)
+		return
+
+	def clear(self):
+		with self.lock:
+			self.items.clear()
+			self.sizes.clear()
+			self.total_size = 0
+		return
+
+	def get_hit_rate(self):
+		lookups = self.hits + self.misses
+		if lookups == 0:
+			return 0.0
+
+		return self.hits / float(lookups)
@@ -0,0 +1,80 @@
+# chunked.py
+# Append only columns in fixed size chunks, shared by index generations
+
+# values per chunk, a reorg copies at most one chunk
+chunk_size = 4096
+
+
+class ChunkedColumn:
+	# values by main chain height, in chunks shared with the generations before this one
+	# a generation is only built from the latest one, so its appends land past the end of every
+	# published generation, and a truncation copies the chunk holding its new end before it is
+	# written again, so published generations never see a value change
+
+	def __init__(self, new_chunk, chunks=None, length=0):
+		# returns an empty chunk of chunk_size values, an array or a list
+		self.new_chunk = new_chunk
+		self.chunks = chunks if chunks is not None else []
+		# number of values of this column, chunks may hold more written by later generations
+		self.length = length
+
+	def branch(self):
+		# new column sharing every chunk of this one, for the next generation to append to
+		return ChunkedColumn(self.new_chunk, list(self.chunks), self.length)
+
+	def __len__(self):
+		return self.length
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			start, end, step = i.indices(self.length)
+			assert (step == 1)
+			return self.get_range(start, end)
+
+		if i < 0:
+			i += self.length
+		if i < 0 or i >= self.length:
+			raise IndexError(i)
+
+		return self.chunks[i // chunk_size][i % chunk_size]
+
+	def get_pieces(self, start, end):
+		# (chunk, first, last) slices holding values start to end - 1 in order
+		pieces = []
+		while start < end:
+			chunk = self.chunks[start // chunk_size]
+			first = start % chunk_size
+			last = min(chunk_size, first + end - start)
+			pieces.append((chunk, first, last))
+			start += last - first
+
+		return pieces
+
+	def get_range(self, start, end):
+		# values start to end - 1, an array or a list like the chunks
+		values = self.new_chunk()[:0]
+		for chunk, first, last in self.get_pieces(start, end):
+			values += chunk[first:last]
+
+		return values
+
+	def append(self, value):
+		if self.length == len(self.chunks) * chunk_size:
+			self.chunks.append(self.new_chunk())
+
+		self.chunks[-1][self.length % chunk_size] = value
+		self.length += 1
+		return
+
+	def truncate(self, length):
+		# keep the first length values
+		if length >= self.length:
+			return
+
+		self.chunks = self.chunks[:(length + chunk_size - 1) // chunk_size]
+		# published generations may still read the values past the new end
+		if length % chunk_size != 0:
+			self.chunks[-1] = self.chunks[-1][:]
+
+		self.length = length
+		return
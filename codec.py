@@ -0,0 +1,45 @@
+# codec.py
+# Hex string, byte order and integer conversions of raw block fields
+
+# https://docs.python.org/3/library/stdtypes.html#bytes.hex
+# https://docs.python.org/3/library/stdtypes.html#int.from_bytes
+
+import binascii
+
+
+# fields are kept as hex strings of raw (little endian) bytes, getters convert them on every lookup
+# Python 3 converts with bytes.hex and int.from_bytes without intermediate hex strings,
+# binascii.unhexlify parses hex faster than bytes.fromhex so both interpreters use it
+if hasattr(int, "from_bytes"):
+
+	def to_hex(data):
+		# bytes, bytearray or memoryview to hex str
+		return data.hex()
+
+	def from_hex(hex_string):
+		return binascii.unhexlify(hex_string)
+
+	def reverse_hex(hex_string):
+		# little endian hex to big endian hex, or back
+		return binascii.unhexlify(hex_string)[::-1].hex()
+
+	def hex_to_int(hex_string):
+		# little endian hex to unsigned int
+		return int.from_bytes(binascii.unhexlify(hex_string), "little")
+
+else:
+
+	def to_hex(data):
+		# str, bytearray or memoryview to hex str
+		return binascii.hexlify(data)
+
+	def from_hex(hex_string):
+		return binascii.unhexlify(hex_string)
+
+	def reverse_hex(hex_string):
+		# little endian hex to big endian hex, or back
+		return binascii.hexlify(binascii.unhexlify(hex_string)[::-1])
+
+	def hex_to_int(hex_string):
+		# little endian hex to unsigned int
+		return int(binascii.hexlify(binascii.unhexlify(hex_string)[::-1]), 16)
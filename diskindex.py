@@ -0,0 +1,330 @@
+# diskindex.py
+# Sorted runs of transaction hashes in files, read through a bounded page cache
+
+# https://en.wikipedia.org/wiki/Log-structured_merge-tree
+
+import os
+import sys
+import array
+import bisect
+import heapq
+import struct
+import itertools
+import threading
+import bloom
+import cache
+import txindex
+
+
+# bytes read from a run file at a time, a multiple of every column item size
+page_size = 4096
+
+# pages of every run file kept in memory, 256 MB
+page_cache = cache.LRUCache("index_pages", 65536)
+
+# runs kept before the newest run is merged into the one below it
+max_runs = 8
+
+# entries read or written per column at a time when streaming runs
+chunk_entries = 65536
+
+# file layout: header, prefixes, block ids, positions, fan-out table, Bloom filter bits
+# runs are scratch files of one process, arrays are in native byte order
+file_magic = b"TXRUN001"
+# magic, number of entries, number of blocks indexed, fan-out bits, Bloom filter bits and probes
+header_format = "<8sQQQQQ"
+header_size = struct.calcsize(header_format)
+
+# name of the next run file
+run_numbers = itertools.count()
+
+# file of input values of every transaction on disk, in block load order
+input_values_filename = "input-values.dat"
+
+# signed 64 bit array typecode, Python 2 has no "q" but "l" is 64 bit on LP64 platforms
+try:
+	array.array("q")
+	int64_typecode = "q"
+except ValueError:
+	int64_typecode = "l"
+
+
+class PagedFile:
+	# fixed size pages of a file, shared by request threads through page_cache
+
+	def __init__(self, path):
+		self.path = path
+		# kept open, so a run merged away and removed stays readable by older generations
+		self.file = open(path, "rb")
+		# one seek and read at a time
+		self.lock = threading.Lock()
+
+	def get_page(self, page_number):
+		key = (self.path, page_number)
+		page = page_cache.get(key)
+		if page is None:
+			with self.lock:
+				self.file.seek(page_number * page_size)
+				page = self.file.read(page_size)
+			page_cache.put(key, page)
+
+		return page
+
+
+class PagedColumn:
+	# read only array of a run file, every item read through page cache
+
+	def __init__(self, paged_file, offset, format_char, count):
+		self.paged_file = paged_file
+		self.offset = offset
+		self.count = count
+		# native byte order, standard size, as written by array
+		self.format = struct.Struct("=" + format_char)
+
+	def __len__(self):
+		return self.count
+
+	def __getitem__(self, i):
+		if i < 0 or i >= self.count:
+			raise IndexError(i)
+
+		# items never straddle pages, columns start at a multiple of their item size
+		page_number, start = divmod(self.offset + i * self.format.size, page_size)
+		return self.format.unpack_from(self.paged_file.get_page(page_number), start)[0]
+
+
+def get_fanout_bits(count):
+	# about 256 entries per bucket, at most as many buckets as the packed index
+	return min(txindex.fanout_bits, max(0, count.bit_length() - 8))
+
+
+def read_array(file, typecode, count):
+	column = array.array(typecode)
+	column.fromfile(file, count)
+	return column
+
+
+class TxRun:
+	# txid prefixes of a range of blocks in sorted order with block id and position of each transaction
+	# only the fan-out table and Bloom filter are in memory
+
+	def __init__(self, path):
+		self.path = path
+
+		with open(path, "rb") as file:
+			magic, count, block_count, bits, bloom_size, bloom_hashes = struct.unpack(header_format,
+																					file.read(header_size))
+			assert (magic == file_magic)
+
+			file.seek(header_size + 16 * count)
+			fanout = read_array(file, txindex.uint64_typecode, (1 << bits) + 1)
+			bloom_bits = bytearray(file.read((bloom_size + 7) // 8))
+
+		# number of entries
+		self.count = count
+		# blocks with ids below this are indexed, by this run or older ones
+		self.block_count = block_count
+		# start of each top bits bucket of prefixes
+		self.fanout_bits = bits
+		self.fanout = fanout
+		# prefixes of every entry, probed before any page is read
+		self.bloom = bloom.BloomFilter(bloom_size, bloom_hashes, bloom_bits)
+
+		paged_file = PagedFile(path)
+		self.prefixes = PagedColumn(paged_file, header_size, "Q", count)
+		self.block_ids = PagedColumn(paged_file, header_size + 8 * count, "I", count)
+		self.positions = PagedColumn(paged_file, header_size + 12 * count, "I", count)
+
+	def __len__(self):
+		return self.count
+
+	def find(self, prefix):
+		# (block id, position) of every transaction with the prefix, in load order
+		if prefix not in self.bloom:
+			return []
+
+		top = prefix >> (64 - self.fanout_bits)
+		end = self.fanout[top + 1]
+
+		candidates = []
+		i = bisect.bisect_left(self.prefixes, prefix, self.fanout[top], end)
+		while i < end and self.prefixes[i] == prefix:
+			candidates.append((self.block_ids[i], self.positions[i]))
+			i += 1
+
+		return candidates
+
+	def iter_entries(self):
+		# (prefix, block id, position) in sorted order, read sequentially past the page cache
+		with open(self.path, "rb") as file:
+			for start in range(0, self.count, chunk_entries):
+				count = min(chunk_entries, self.count - start)
+				columns = []
+				for offset, typecode in ((header_size + 8 * start, txindex.uint64_typecode),
+										(header_size + 8 * self.count + 4 * start, "I"),
+										(header_size + 12 * self.count + 4 * start, "I")):
+					file.seek(offset)
+					columns.append(read_array(file, typecode, count))
+
+				for entry in zip(*columns):
+					yield entry
+
+
+def write_run(path, entries, count, block_count):
+	# run file of count sorted (prefix, block id, position) entries, streamed so no column is in memory
+	bits = get_fanout_bits(count)
+	bloom_filter = bloom.for_capacity(count)
+	# entries per bucket, summed into bucket starts below
+	fanout = array.array(txindex.uint64_typecode, [0] * ((1 << bits) + 1))
+	shift = 64 - bits
+
+	with open(path, "wb") as file:
+		file.write(struct.pack(header_format, file_magic, count, block_count, bits, bloom_filter.size,
+								bloom_filter.hashes))
+		file.truncate(header_size + 16 * count)
+
+	# one handle per column, each written sequentially
+	files = [open(path, "r+b") for i in range(0, 3)]
+	for file, offset in zip(files, (header_size, header_size + 8 * count, header_size + 12 * count)):
+		file.seek(offset)
+
+	try:
+		entries = iter(entries)
+		while True:
+			chunk = list(itertools.islice(entries, chunk_entries))
+			if len(chunk) == 0:
+				break
+
+			prefixes = array.array(txindex.uint64_typecode, [entry[0] for entry in chunk])
+			for prefix in prefixes:
+				fanout[(prefix >> shift) + 1] += 1
+				bloom_filter.add(prefix)
+
+			prefixes.tofile(files[0])
+			array.array("I", [entry[1] for entry in chunk]).tofile(files[1])
+			array.array("I", [entry[2] for entry in chunk]).tofile(files[2])
+
+		for top in range(1, len(fanout)):
+			fanout[top] += fanout[top - 1]
+
+		files[2].seek(header_size + 16 * count)
+		fanout.tofile(files[2])
+		files[2].write(bytes(bloom_filter.bits))
+	finally:
+		for file in files:
+			file.close()
+
+	return TxRun(path)
+
+
+class InputValueFile:
+	# total satoshi amount spent by the inputs of each transaction whose block is dropped from memory,
+	# -1 until its previous outputs are loaded
+	# append only and shared by every generation, like the list of blocks
+
+	def __init__(self, path):
+		self.path = path
+		self.file = open(path, "w+b")
+		# number of values written
+		self.count = 0
+		# one seek and read or write at a time
+		self.lock = threading.Lock()
+
+	def append(self, values):
+		# write values after every earlier one, returns index of the first
+		with self.lock:
+			start = self.count
+			self.file.seek(8 * start)
+			array.array(int64_typecode, values).tofile(self.file)
+			self.count += len(values)
+		return start
+
+	def read(self, start, count):
+		with self.lock:
+			self.file.seek(8 * start)
+			return read_array(self.file, int64_typecode, count)
+
+	def resolve(self, index, value):
+		# only ever changes from unknown to resolved, so readers of older generations stay correct
+		with self.lock:
+			self.file.seek(8 * index)
+			array.array(int64_typecode, [value]).tofile(self.file)
+		return
+
+
+class DiskTxIndex:
+	# txid index of runs in files, oldest first, each covering the blocks after the one below it
+	# never modified once built, extending writes new runs and merges newest ones LSM-style
+
+	# transactions of indexed blocks are dropped from memory and parsed again when requested
+	resident = False
+
+	def __init__(self, directory_path, runs=None, block_count=0, input_values=None):
+		# directory of run files
+		self.directory_path = directory_path
+		self.runs = runs if runs is not None else []
+		# blocks with ids below this are indexed
+		self.block_count = block_count
+		# input values of transactions of every block, shared with the index this one extends
+		self.input_values = input_values
+
+	def __len__(self):
+		return sum([len(run) for run in self.runs])
+
+	def find(self, tx_hash_little):
+		# (block id, position) of every transaction with the prefix, in load order
+		# different txids may share a prefix, callers compare the full hash
+		prefix = txindex.get_prefix(tx_hash_little)
+
+		candidates = []
+		for run in self.runs:
+			candidates += run.find(prefix)
+
+		return candidates
+
+	def new_path(self):
+		return os.path.join(self.directory_path, "txrun-%08d.idx" % next(run_numbers))
+
+	def extend(self, blocks, block_count):
+		# new index with transactions of blocks from this one's block count up to block_count
+		if block_count == self.block_count:
+			return self
+
+		entries = []
+		for block_id in range(self.block_count, block_count):
+			txs = blocks[block_id].get_transactions()
+			for position in range(0, len(txs)):
+				entries.append((txindex.get_prefix(txs[position].get_hash_little()), block_id, position))
+		entries.sort()
+
+		runs = self.runs + [write_run(self.new_path(), entries, len(entries), block_count)]
+
+		# merge newest run down while it is at least half the size of the run below,
+		# so each entry is rewritten a logarithmic number of times as the index grows
+		while len(runs) > 1 and (len(runs[-1]) * 2 >= len(runs[-2]) or len(runs) > max_runs):
+			older, newer = runs[-2], runs[-1]
+			merged = write_run(self.new_path(), heapq.merge(older.iter_entries(), newer.iter_entries()),
+								len(older) + len(newer), newer.block_count)
+			runs = runs[:-2] + [merged]
+
+			# open handles keep merged away runs readable for generations still using them
+			if sys.platform != "win32":
+				os.remove(older.path)
+				os.remove(newer.path)
+
+		return DiskTxIndex(self.directory_path, runs, block_count, self.input_values)
+
+
+def open_index(directory_path):
+	# empty index writing runs to the directory, removing run files left by an earlier process
+	if not os.path.isdir(directory_path):
+		os.makedirs(directory_path)
+
+	for filename in os.listdir(directory_path):
+		if filename.startswith("txrun-") and filename.endswith(".idx"):
+			os.remove(os.path.join(directory_path, filename))
+
+	# rewritten from the first block, opening it truncates values of an earlier process
+	input_values = InputValueFile(os.path.join(directory_path, input_values_filename))
+
+	return DiskTxIndex(directory_path, input_values=input_values)
@@ -0,0 +1,316 @@
+# encoding.py
+# Negotiate response format and compression, and encode compact binary responses
+
+# https://github.com/msgpack/msgpack/blob/master/spec.md
+# https://www.rfc-editor.org/rfc/rfc8949
+# https://www.rfc-editor.org/rfc/rfc9110#section-12.5
+
+import json
+import zlib
+import struct
+import numbers
+import binascii
+import threading
+
+# zstandard is optional, gzip is always available
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+# reference MessagePack and CBOR encoders are optional, the encoders below are the fallback
+try:
+	import msgpack
+except ImportError:
+	msgpack = None
+
+try:
+	import cbor2
+except ImportError:
+	cbor2 = None
+
+# text and raw byte types of Python 2 and 3
+try:
+	text_types = (str, unicode)
+	binary_types = (bytearray,)
+except NameError:
+	text_types = (str,)
+	binary_types = (bytes, bytearray)
+
+
+# response formats
+json_format = "json"
+msgpack_format = "msgpack"
+cbor_format = "cbor"
+
+# content type of each response format
+content_types = {
+					json_format: "application/json; charset=utf-8",
+					msgpack_format: "application/msgpack",
+					cbor_format: "application/cbor"
+				}
+
+# media types clients may ask for, and the format each maps to
+media_types = {
+				"application/json": json_format,
+				"text/plain": json_format,
+				"application/msgpack": msgpack_format,
+				"application/x-msgpack": msgpack_format,
+				"application/vnd.msgpack": msgpack_format,
+				"application/cbor": cbor_format
+			}
+
+# content codings
+identity_encoding = "identity"
+gzip_encoding = "gzip"
+zstd_encoding = "zstd"
+
+# bodies shorter than this are sent uncompressed, the codec framing would eat the savings
+min_compress_size = 256
+
+# compression levels favouring speed, responses are compressed per request
+gzip_level = 5
+zstd_level = 3
+
+# response fields holding hex strings, sent as raw bytes in binary formats
+# hashes keep the big endian byte order of their hex form
+binary_fields = {
+					"hash", "prev_block", "mrkl_root", "prev_hash",
+					"block_hash", "tx_hash", "sig_script", "branch"
+				}
+
+# compressors are not safe to share between request threads
+local = threading.local()
+
+
+def parse_header_list(header):
+	# "a;q=0.5, b" -> [(a, 0.5), (b, 1.0)], lower case
+	items = []
+	for part in header.split(","):
+		fields = part.strip().split(";")
+		name = fields[0].strip().lower()
+		if name == "":
+			continue
+
+		quality = 1.0
+		for param in fields[1:]:
+			param = param.strip()
+			if param.startswith("q="):
+				try:
+					quality = float(param[2:])
+				except ValueError:
+					quality = 0.0
+
+		items.append((name, quality))
+
+	return items
+
+
+def choose_format(accept):
+	# format of highest quality media type the client accepts, JSON by default
+	best_format = json_format
+	best_quality = 0.0
+	for name, quality in parse_header_list(accept or ""):
+		# equal quality prefers the first listed
+		if name in media_types and quality > best_quality:
+			best_format = media_types[name]
+			best_quality = quality
+
+	return best_format
+
+
+def choose_encoding(accept_encoding):
+	# zstd if available and accepted, else gzip if accepted, else identity
+	qualities = dict(parse_header_list(accept_encoding or ""))
+	wildcard = qualities.get("*", 0.0)
+
+	if zstandard is not None and qualities.get(zstd_encoding, 0.0) > 0.0:
+		return zstd_encoding
+
+	if qualities.get(gzip_encoding, qualities.get("x-gzip", wildcard)) > 0.0:
+		return gzip_encoding
+
+	return identity_encoding
+
+
+def compress(body, encoding):
+	# returns body and coding actually applied
+	if encoding == identity_encoding or len(body) < min_compress_size:
+		return body, identity_encoding
+
+	if encoding == zstd_encoding:
+		compressor = getattr(local, "zstd", None)
+		if compressor is None:
+			compressor = zstandard.ZstdCompressor(level=zstd_level)
+			local.zstd = compressor
+		return compressor.compress(body), zstd_encoding
+
+	# gzip container around deflate stream
+	compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+	return compressor.compress(body) + compressor.flush(), gzip_encoding
+
+
+def to_binary(result):
+	# copy of result with hex string fields as raw bytes
+	# keys are inserted sorted, reference encoders keep insertion order where dicts do
+	if isinstance(result, dict):
+		converted = {}
+		for key in sorted(result):
+			value = result[key]
+			if key in binary_fields:
+				converted[key] = hex_to_bytes(value)
+			else:
+				converted[key] = to_binary(value)
+		return converted
+
+	if isinstance(result, list):
+		return [to_binary(value) for value in result]
+
+	return result
+
+
+def hex_to_bytes(value):
+	# hex string or list of hex strings to bytearray
+	if isinstance(value, list):
+		return [hex_to_bytes(item) for item in value]
+
+	return bytearray(binascii.unhexlify(value))
+
+
+def to_utf8(text):
+	# Python 2 str is already bytes
+	if isinstance(text, bytes):
+		return text
+
+	return text.encode("utf-8")
+
+
+def msgpack_head(length, fix_type, fix_limit, types):
+	# smallest header of a string, binary, array or map of length
+	# types are the 8, 16 and 32 bit length type bytes, None where the format has none
+	if fix_type is not None and length < fix_limit:
+		return struct.pack(">B", fix_type | length)
+	elif types[0] is not None and length <= 0xFF:
+		return struct.pack(">BB", types[0], length)
+	elif length <= 0xFFFF:
+		return struct.pack(">BH", types[1], length)
+
+	return struct.pack(">BI", types[2], length)
+
+
+def encode_msgpack(obj, out):
+	# append MessagePack encoding of obj to list of byte strings
+	if obj is None:
+		out.append(b"\xc0")
+	elif obj is True:
+		out.append(b"\xc3")
+	elif obj is False:
+		out.append(b"\xc2")
+	elif isinstance(obj, numbers.Integral):
+		obj = int(obj)
+		if 0 <= obj < 0x80:
+			# positive fixint
+			out.append(struct.pack(">B", obj))
+		elif -32 <= obj < 0:
+			# negative fixint
+			out.append(struct.pack(">b", obj))
+		elif 0 <= obj <= 0xFF:
+			out.append(struct.pack(">BB", 0xcc, obj))
+		elif 0 <= obj <= 0xFFFF:
+			out.append(struct.pack(">BH", 0xcd, obj))
+		elif 0 <= obj <= 0xFFFFFFFF:
+			out.append(struct.pack(">BI", 0xce, obj))
+		elif 0 <= obj:
+			out.append(struct.pack(">BQ", 0xcf, obj))
+		elif -0x80000000 <= obj:
+			out.append(struct.pack(">Bi", 0xd2, obj))
+		else:
+			out.append(struct.pack(">Bq", 0xd3, obj))
+	elif isinstance(obj, numbers.Real):
+		out.append(struct.pack(">Bd", 0xcb, float(obj)))
+	elif isinstance(obj, binary_types):
+		out.append(msgpack_head(len(obj), None, 0, (0xc4, 0xc5, 0xc6)) + bytes(obj))
+	elif isinstance(obj, text_types):
+		data = to_utf8(obj)
+		out.append(msgpack_head(len(data), 0xa0, 32, (0xd9, 0xda, 0xdb)) + data)
+	elif isinstance(obj, (list, tuple)):
+		out.append(msgpack_head(len(obj), 0x90, 16, (None, 0xdc, 0xdd)))
+		for item in obj:
+			encode_msgpack(item, out)
+	elif isinstance(obj, dict):
+		out.append(msgpack_head(len(obj), 0x80, 16, (None, 0xde, 0xdf)))
+		for key in sorted(obj):
+			encode_msgpack(key, out)
+			encode_msgpack(obj[key], out)
+	else:
+		raise TypeError("cannot encode " + repr(obj))
+
+	return out
+
+
+def cbor_head(major, length):
+	# initial byte of major type and argument, followed by argument if it does not fit
+	if length < 24:
+		return struct.pack(">B", (major << 5) | length)
+	elif length <= 0xFF:
+		return struct.pack(">BB", (major << 5) | 24, length)
+	elif length <= 0xFFFF:
+		return struct.pack(">BH", (major << 5) | 25, length)
+	elif length <= 0xFFFFFFFF:
+		return struct.pack(">BI", (major << 5) | 26, length)
+
+	return struct.pack(">BQ", (major << 5) | 27, length)
+
+
+def encode_cbor(obj, out):
+	# append CBOR encoding of obj to list of byte strings
+	if obj is None:
+		out.append(b"\xf6")
+	elif obj is True:
+		out.append(b"\xf5")
+	elif obj is False:
+		out.append(b"\xf4")
+	elif isinstance(obj, numbers.Integral):
+		obj = int(obj)
+		if obj >= 0:
+			out.append(cbor_head(0, obj))
+		else:
+			out.append(cbor_head(1, -1 - obj))
+	elif isinstance(obj, numbers.Real):
+		out.append(struct.pack(">Bd", 0xfb, float(obj)))
+	elif isinstance(obj, binary_types):
+		out.append(cbor_head(2, len(obj)) + bytes(obj))
+	elif isinstance(obj, text_types):
+		data = to_utf8(obj)
+		out.append(cbor_head(3, len(data)) + data)
+	elif isinstance(obj, (list, tuple)):
+		out.append(cbor_head(4, len(obj)))
+		for item in obj:
+			encode_cbor(item, out)
+	elif isinstance(obj, dict):
+		out.append(cbor_head(5, len(obj)))
+		for key in sorted(obj):
+			encode_cbor(key, out)
+			encode_cbor(obj[key], out)
+	else:
+		raise TypeError("cannot encode " + repr(obj))
+
+	return out
+
+
+def encode(result, response_format):
+	# content type and body of result in the response format
+	if response_format == msgpack_format:
+		if msgpack is not None:
+			body = msgpack.packb(to_binary(result), use_bin_type=True)
+		else:
+			body = b"".join(encode_msgpack(to_binary(result), []))
+	elif response_format == cbor_format:
+		if cbor2 is not None:
+			body = cbor2.dumps(to_binary(result))
+		else:
+			body = b"".join(encode_cbor(to_binary(result), []))
+	else:
+		body = json.dumps(result).encode("utf-8") + b"\n"
+
+	return content_types[response_format], body
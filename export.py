@@ -0,0 +1,274 @@
+# export.py
+# Stream the main chain as NDJSON, fixed width binary or Parquet files
+
+# https://github.com/ndjson/ndjson-spec
+# https://arrow.apache.org/docs/python/parquet.html
+
+import os
+import sys
+import json
+import struct
+import binascii
+import argparse
+import script
+
+# pyarrow is optional, only needed for Parquet files
+try:
+	import pyarrow
+	import pyarrow.parquet
+except ImportError:
+	pyarrow = None
+
+
+# output formats
+ndjson_format = "ndjson"
+binary_format = "binary"
+parquet_format = "parquet"
+
+# number of blocks per Parquet row group, bounds memory of one export
+parquet_batch_blocks = 1000
+
+# small integer of each output script type in binary files
+script_type_codes = {
+						script.p2pk_type: 0, script.p2pkh_type: 1, script.p2sh_type: 2,
+						script.p2wpkh_type: 3, script.p2wsh_type: 4, script.multisig_type: 5,
+						script.op_return_type: 6, script.nonstandard_type: 7
+					}
+
+# fixed width rows of binary files, little endian, hashes as 32 raw bytes in big endian order
+# scripts are stored in a separate heap file and referenced by offset and length
+binary_schemas = {
+	"blocks": ("<I32s32s32sIIIIII",
+				["height", "hash", "prev_block", "mrkl_root", "time", "bits", "nonce", "version",
+				"tx_count", "size"]),
+	"transactions": ("<II32sIIIIIqq",
+				["height", "position", "tx_hash", "version", "lock_time", "size", "input_count",
+				"output_count", "input_value", "output_value"]),
+	"inputs": ("<III32sIIQI",
+				["height", "position", "index", "prev_txid", "prev_vout", "seq_num",
+				"script_offset", "script_length"]),
+	"outputs": ("<IIIQBQI",
+				["height", "position", "vout", "value", "script_type", "script_offset", "script_length"])
+}
+
+
+def iter_records(gen, start_height, end_height):
+	# blocks, transactions, inputs and outputs of main chain from start to end height inclusive
+	# one generation is read throughout so export is consistent while the chain is updated
+	end_height = min(end_height, len(gen.main_chain_blocks) - 1)
+
+	for height in range(start_height, end_height + 1):
+		block = gen.main_chain_blocks[height]
+		txs = block.get_transactions()
+
+		yield {"type": "block", "height": height, "hash": block.get_curr_hash_big(),
+				"prev_block": block.get_prev_hash_big(), "mrkl_root": block.get_merk_hash_big(),
+				"time": block.get_time_int(), "bits": block.get_nBits_int(), "nonce": block.get_nonce_int(),
+				"version": block.get_version_int(), "tx_count": len(txs), "size": block.get_size_int()}
+
+		for position in range(0, len(txs)):
+			tx = txs[position]
+			tx_hash = tx.get_hash_big()
+
+			# satoshi, -1 if any previous output is not loaded
+			yield {"type": "tx", "height": height, "position": position, "tx_hash": tx_hash,
+					"version": tx.get_version_int(), "lock_time": tx.get_locktime_int(), "size": tx.get_size_int(),
+					"input_count": tx.get_input_count_int(), "output_count": tx.get_output_count_int(),
+					"input_value": tx.get_input_value_int(), "output_value": tx.get_output_value_int()}
+
+			input_txs = tx.get_inputs()
+			for index in range(0, len(input_txs)):
+				input_tx = input_txs[index]
+
+				# script hex in raw byte order
+				yield {"type": "input", "height": height, "position": position, "tx_hash": tx_hash,
+						"index": index, "prev_txid": input_tx.get_prev_hash_big(),
+						"prev_vout": input_tx.get_prev_index_int(), "seq_num": input_tx.get_seq_int(),
+						"script": input_tx.get_script_little()}
+
+			output_txs = tx.get_outputs()
+			output_values = tx.get_output_values()
+			for vout in range(0, len(output_txs)):
+				script_little = output_txs[vout].get_script_little()
+				script_type, address = script.classify_script(script_little)
+
+				yield {"type": "output", "height": height, "position": position, "tx_hash": tx_hash,
+						"vout": vout, "value": output_values[vout], "script": script_little,
+						"script_type": script_type, "address": address}
+
+
+def iter_ndjson(gen, start_height, end_height):
+	# one NDJSON chunk per block with all of its records
+	lines = []
+	for record in iter_records(gen, start_height, end_height):
+		# flush previous block
+		if record["type"] == "block" and len(lines) != 0:
+			yield b"".join(lines)
+			lines = []
+
+		lines.append(json.dumps(record, sort_keys=True).encode("utf-8") + b"\n")
+
+	if len(lines) != 0:
+		yield b"".join(lines)
+
+
+def write_ndjson(gen, start_height, end_height, out):
+	for chunk in iter_ndjson(gen, start_height, end_height):
+		out.write(chunk)
+	return
+
+
+class BinaryWriter:
+	# one fixed width file per record type, appended to when resuming
+
+	def __init__(self, directory_path):
+		self.files = {}
+		self.structs = {}
+		for name in binary_schemas:
+			self.files[name] = open(os.path.join(directory_path, name + ".bin"), "ab")
+			self.structs[name] = struct.Struct(binary_schemas[name][0])
+
+		# variable length scripts, rows hold offset into these
+		self.input_scripts = open(os.path.join(directory_path, "input_scripts.bin"), "ab")
+		self.output_scripts = open(os.path.join(directory_path, "output_scripts.bin"), "ab")
+		# tell() of a file just opened to append is 0 until the first write on Python 2
+		self.input_offset = os.path.getsize(self.input_scripts.name)
+		self.output_offset = os.path.getsize(self.output_scripts.name)
+
+		# describe rows for readers
+		schema = dict([(name, {"struct": binary_schemas[name][0], "columns": binary_schemas[name][1]})
+						for name in binary_schemas])
+		with open(os.path.join(directory_path, "schema.json"), "w") as schema_file:
+			json.dump(schema, schema_file, indent=2, sort_keys=True)
+
+	def write(self, record):
+		record_type = record["type"]
+
+		if record_type == "block":
+			self.files["blocks"].write(self.structs["blocks"].pack(
+				record["height"], unhex(record["hash"]), unhex(record["prev_block"]), unhex(record["mrkl_root"]),
+				record["time"], record["bits"], record["nonce"], record["version"], record["tx_count"],
+				record["size"]))
+
+		elif record_type == "tx":
+			self.files["transactions"].write(self.structs["transactions"].pack(
+				record["height"], record["position"], unhex(record["tx_hash"]), record["version"],
+				record["lock_time"], record["size"], record["input_count"], record["output_count"],
+				record["input_value"], record["output_value"]))
+
+		elif record_type == "input":
+			script_bin = unhex(record["script"])
+			self.input_scripts.write(script_bin)
+			self.files["inputs"].write(self.structs["inputs"].pack(
+				record["height"], record["position"], record["index"], unhex(record["prev_txid"]),
+				record["prev_vout"], record["seq_num"], self.input_offset, len(script_bin)))
+			self.input_offset += len(script_bin)
+
+		elif record_type == "output":
+			script_bin = unhex(record["script"])
+			self.output_scripts.write(script_bin)
+			self.files["outputs"].write(self.structs["outputs"].pack(
+				record["height"], record["position"], record["vout"], record["value"],
+				script_type_codes[record["script_type"]], self.output_offset, len(script_bin)))
+			self.output_offset += len(script_bin)
+
+		return
+
+	def close(self):
+		for name in self.files:
+			self.files[name].close()
+		self.input_scripts.close()
+		self.output_scripts.close()
+		return
+
+
+def unhex(hex_string):
+	return binascii.unhexlify(hex_string)
+
+
+def write_binary(gen, start_height, end_height, directory_path):
+	writer = BinaryWriter(directory_path)
+	try:
+		for record in iter_records(gen, start_height, end_height):
+			writer.write(record)
+	finally:
+		writer.close()
+	return
+
+
+def write_parquet(gen, start_height, end_height, directory_path):
+	# one Parquet file per record type, named by start height so resumed exports add files
+	writers = {}
+	rows = {}
+	blocks = 0
+
+	def flush():
+		for record_type in rows:
+			if len(rows[record_type]) == 0:
+				continue
+
+			table = pyarrow.Table.from_pylist(rows[record_type])
+			if record_type not in writers:
+				path = os.path.join(directory_path, "%s-%08d.parquet" % (record_type, start_height))
+				writers[record_type] = pyarrow.parquet.ParquetWriter(path, table.schema)
+			writers[record_type].write_table(table)
+			rows[record_type] = []
+		return
+
+	try:
+		for record in iter_records(gen, start_height, end_height):
+			record_type = record.pop("type")
+
+			# write a row group every batch of blocks
+			if record_type == "block":
+				blocks += 1
+				if blocks % parquet_batch_blocks == 0:
+					flush()
+
+			rows.setdefault(record_type, []).append(record)
+		flush()
+	finally:
+		for record_type in writers:
+			writers[record_type].close()
+
+	return
+
+
+if __name__ == "__main__":
+	import blockchain
+
+	parser = argparse.ArgumentParser(description="Export main chain blocks, transactions, inputs and outputs")
+	parser.add_argument("--data-dir", default="", help="directory of blkNNNNN.dat files, with trailing slash")
+	parser.add_argument("--from", dest="start", type=int, default=0, help="first block height, to resume an export")
+	parser.add_argument("--to", dest="end", type=int, default=-1, help="last block height, -1 for latest")
+	parser.add_argument("--format", choices=[ndjson_format, binary_format, parquet_format], default=ndjson_format)
+	parser.add_argument("--output", default="-", help="NDJSON file (- for stdout) or directory of columnar files")
+	args = parser.parse_args()
+
+	if args.format == parquet_format and pyarrow is None:
+		parser.error("Parquet export needs pyarrow")
+
+	# progress goes to stderr so NDJSON can go to stdout
+	stdout = sys.stdout
+	sys.stdout = sys.stderr
+	blockchain.setup(args.data_dir)
+	sys.stdout = stdout
+
+	gen = blockchain.current
+	end = args.end if args.end >= 0 else gen.blockchain_height
+
+	if args.format == ndjson_format:
+		if args.output == "-":
+			write_ndjson(gen, args.start, end, getattr(sys.stdout, "buffer", sys.stdout))
+		else:
+			# resumed exports append
+			with open(args.output, "ab") as out:
+				write_ndjson(gen, args.start, end, out)
+	else:
+		if not os.path.isdir(args.output):
+			os.makedirs(args.output)
+
+		if args.format == binary_format:
+			write_binary(gen, args.start, end, args.output)
+		else:
+			write_parquet(gen, args.start, end, args.output)
@@ -0,0 +1,68 @@
+# fragments.py
+# Pre-rendered JSON of block headers and transaction summaries
+
+import json
+import cache
+import blockchain
+
+
+# fragments kept per kind, 0 disables pre-rendering
+fragment_cache_size = 65536
+
+# block hash (big endian, as requested) -> Fragment of block header
+# headers never change once parsed, so fragments stay valid across updates
+header_fragments = cache.LRUCache("header_json", fragment_cache_size)
+
+# tx hash (big endian, as requested) -> (generation number, Fragment of transaction summary)
+# input value is resolved and containing block may change in later generations
+transaction_fragments = cache.LRUCache("transaction_json", fragment_cache_size)
+
+
+class Fragment:
+	# response body encoded once as JSON, sent as is to every JSON client
+
+	def __init__(self, body):
+		self.body = body
+
+
+def set_capacity(capacity):
+	header_fragments.capacity = capacity
+	transaction_fragments.capacity = capacity
+	return
+
+
+def is_enabled():
+	return header_fragments.capacity > 0
+
+
+def render(result):
+	# same bytes the encode phase gives a JSON client for the result
+	return Fragment(json.dumps(result).encode("utf-8") + b"\n")
+
+
+def get_header(block_hash_big):
+	# Fragment of block header, None if not rendered yet
+	return header_fragments.get(block_hash_big)
+
+
+def put_header(block_hash_big, result):
+	fragment = render(result)
+	header_fragments.put(block_hash_big, fragment)
+	return fragment
+
+
+def get_transaction(tx_hash_big):
+	# Fragment of transaction summary rendered from the current generation, None otherwise
+	entry = transaction_fragments.get(tx_hash_big)
+	if entry is None or entry[0] != blockchain.current.number:
+		return None
+
+	return entry[1]
+
+
+def put_transaction(tx_hash_big, gen, result):
+	# gen is the generation published before the summary was looked up, a newer one
+	# published meanwhile only makes the fragment miss earlier
+	fragment = render(result)
+	transaction_fragments.put(tx_hash_big, (gen.number, fragment))
+	return fragment
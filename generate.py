@@ -0,0 +1,301 @@
+# generate.py
+# Generate synthetic blkNNNNN.dat files for benchmarking
+
+# https://en.bitcoin.it/wiki/Block
+# https://en.bitcoin.it/wiki/Protocol_documentation#tx
+
+import os
+import random
+import struct
+import hashlib
+import argparse
+
+
+# magic number 0xD9B4BEF9 (little endian on disk)
+magic_bytes = struct.pack("<I", 0xD9B4BEF9)
+
+# previous block hash of genesis block of bitcoin blockchain
+source_hash_bin = b"\x00" * 32
+
+# outpoint index of a coinbase input
+coinbase_index = 0xFFFFFFFF
+
+# first block time of the synthetic chain (bitcoin genesis block time)
+genesis_time = 1231006505
+
+# easiest difficulty target
+genesis_nBits = 0x1d00ffff
+
+
+def double_sha256(data):
+	# SHA256(SHA256(data))
+	return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def var_len_int(n):
+	# variable length integer: 1, 3, 5, or 9 bytes
+	if n < 0xFD:
+		return struct.pack("<B", n)
+	elif n <= 0xFFFF:
+		return b"\xfd" + struct.pack("<H", n)
+	elif n <= 0xFFFFFFFF:
+		return b"\xfe" + struct.pack("<I", n)
+	else:
+		return b"\xff" + struct.pack("<Q", n)
+
+
+def merkle_root(tx_hashes):
+	# bottom-up merkle hashing of binary little endian hashes
+	level = list(tx_hashes)
+	while len(level) > 1:
+		# pad the hashes with last hash if length is odd
+		if len(level) % 2 == 1:
+			level.append(level[-1])
+
+		level = [double_sha256(level[i] + level[i + 1]) for i in range(0, len(level), 2)]
+
+	return level[0]
+
+
+def random_bytes(rng, n):
+	return bytes(bytearray(rng.getrandbits(8) for i in range(n)))
+
+
+def output_script(rng, script_size):
+	# pick one of the standard output script templates
+	kind = rng.randint(0, 6)
+
+	if kind == 0:
+		# P2PKH: OP_DUP OP_HASH160 <20 bytes> OP_EQUALVERIFY OP_CHECKSIG
+		return b"\x76\xa9\x14" + random_bytes(rng, 20) + b"\x88\xac"
+	elif kind == 1:
+		# P2SH: OP_HASH160 <20 bytes> OP_EQUAL
+		return b"\xa9\x14" + random_bytes(rng, 20) + b"\x87"
+	elif kind == 2:
+		# P2PK: <33 byte compressed pubkey> OP_CHECKSIG
+		return b"\x21\x02" + random_bytes(rng, 32) + b"\xac"
+	elif kind == 3:
+		# P2WPKH: OP_0 <20 bytes>
+		return b"\x00\x14" + random_bytes(rng, 20)
+	elif kind == 4:
+		# P2WSH: OP_0 <32 bytes>
+		return b"\x00\x20" + random_bytes(rng, 32)
+	elif kind == 5:
+		# 1-of-2 multisig: OP_1 <pubkey> <pubkey> OP_2 OP_CHECKMULTISIG
+		return (b"\x51" + b"\x21\x03" + random_bytes(rng, 32) +
+			b"\x21\x02" + random_bytes(rng, 32) + b"\x52\xae")
+	else:
+		# OP_RETURN <data>
+		size = min(max(script_size, 1), 75)
+		return b"\x6a" + struct.pack("<B", size) + random_bytes(rng, size)
+
+
+def serialize_tx(version, inputs, outputs, locktime):
+	# inputs: list of (prev_txid, prev_index, script, seq_num)
+	# outputs: list of (satoshi, script)
+	raw = struct.pack("<I", version)
+
+	raw += var_len_int(len(inputs))
+	for prev_txid, prev_index, script, seq_num in inputs:
+		raw += prev_txid + struct.pack("<I", prev_index)
+		raw += var_len_int(len(script)) + script
+		raw += struct.pack("<I", seq_num)
+
+	raw += var_len_int(len(outputs))
+	for satoshi, script in outputs:
+		raw += struct.pack("<Q", satoshi)
+		raw += var_len_int(len(script)) + script
+
+	raw += struct.pack("<I", locktime)
+
+	return raw
+
+
+class ChainGenerator:
+
+	def __init__(self, seed=0, txs_per_block=10, inputs_per_tx=2, outputs_per_tx=2,
+				script_size=25, fork_rate=0.0):
+		self.rng = random.Random(seed)
+		# number of transactions in each block, including coinbase
+		self.txs_per_block = txs_per_block
+		# number of inputs of each non-coinbase transaction
+		self.inputs_per_tx = inputs_per_tx
+		# number of outputs of each transaction
+		self.outputs_per_tx = outputs_per_tx
+		# size in bytes of input signature scripts
+		self.script_size = script_size
+		# probability that a block gets a stale sibling
+		self.fork_rate = fork_rate
+		# spendable outputs (txid, index, satoshi) of the main chain
+		self.utxos = []
+
+	def make_coinbase(self, height, salt):
+		# coinbase input spends the null outpoint
+		script = struct.pack("<I", height) + struct.pack("<I", salt)
+		inputs = [(source_hash_bin, coinbase_index, script, 0xFFFFFFFF)]
+
+		reward = 50 * 100000000
+		outputs = []
+		for i in range(0, self.outputs_per_tx):
+			outputs.append((reward // self.outputs_per_tx, output_script(self.rng, self.script_size)))
+
+		return serialize_tx(1, inputs, outputs, 0), outputs
+
+	def make_tx(self, utxos):
+		# spend up to inputs_per_tx random outputs
+		inputs = []
+		total = 0
+		for i in range(0, self.inputs_per_tx):
+			if len(utxos) == 0:
+				break
+			j = self.rng.randrange(len(utxos))
+			utxos[j], utxos[-1] = utxos[-1], utxos[j]
+			txid, index, satoshi = utxos.pop()
+
+			sig = random_bytes(self.rng, self.script_size)
+			inputs.append((txid, index, sig, 0xFFFFFFFF))
+			total += satoshi
+
+		if len(inputs) == 0:
+			return None, None
+
+		# leave a small fee to the miner
+		fee = min(total // 100, 10000)
+		value = total - fee
+		outputs = []
+		for i in range(0, self.outputs_per_tx):
+			share = value // self.outputs_per_tx
+			if i == 0:
+				share += value % self.outputs_per_tx
+			outputs.append((share, output_script(self.rng, self.script_size)))
+
+		return serialize_tx(1, inputs, outputs, 0), outputs
+
+	def make_block(self, prev_hash, height, block_time, salt, utxos):
+		# build transactions, spending from the given utxo set
+		raw_txs = []
+		tx_hashes = []
+		new_utxos = []
+
+		coinbase, outputs = self.make_coinbase(height, salt)
+		raw_txs.append(coinbase)
+		txid = double_sha256(coinbase)
+		tx_hashes.append(txid)
+		for i in range(0, len(outputs)):
+			new_utxos.append((txid, i, outputs[i][0]))
+
+		for n in range(1, self.txs_per_block):
+			raw_tx, outputs = self.make_tx(utxos)
+			if raw_tx is None:
+				break
+			raw_txs.append(raw_tx)
+			txid = double_sha256(raw_tx)
+			tx_hashes.append(txid)
+			for i in range(0, len(outputs)):
+				new_utxos.append((txid, i, outputs[i][0]))
+
+		# version 0x20000000 with a random version bit signalled
+		version = 0x20000000 | (1 << self.rng.randint(0, 3))
+		nonce = self.rng.getrandbits(32)
+
+		header = (struct.pack("<I", version) + prev_hash + merkle_root(tx_hashes) +
+			struct.pack("<I", block_time) + struct.pack("<I", genesis_nBits) + struct.pack("<I", nonce))
+		body = header + var_len_int(len(raw_txs)) + b"".join(raw_txs)
+
+		return double_sha256(header), body, new_utxos
+
+	def generate(self, num_blocks):
+		# yield (height, raw block) for the main chain and stale forks
+		prev_hash = source_hash_bin
+		block_time = genesis_time
+
+		for height in range(0, num_blocks):
+			# block times drift forward but are not monotonic
+			block_time += 600 + self.rng.randint(-300, 300)
+
+			# stale sibling spending from a copy of the utxo set
+			if height > 0 and self.rng.random() < self.fork_rate:
+				fork_utxos = list(self.utxos)
+				fork_hash, fork_body, fork_outputs = self.make_block(prev_hash, height, block_time,
+																self.rng.getrandbits(32), fork_utxos)
+				yield height, fork_body
+
+			block_hash, body, new_utxos = self.make_block(prev_hash, height, block_time, 0, self.utxos)
+			self.utxos += new_utxos
+			prev_hash = block_hash
+
+			yield height, body
+
+
+class FileWriter:
+	# append framed blocks to blkNNNNN.dat files, starting a new file when full
+
+	def __init__(self, directory_path, max_file_size):
+		self.directory_path = directory_path
+		self.max_file_size = max_file_size
+		self.nth_file = 0
+		self.file_size = 0
+		self.out = None
+		self.filenames = []
+
+	def write(self, body):
+		if self.out is None or self.file_size + len(body) + 8 > self.max_file_size:
+			self.close()
+			filename = os.path.join(self.directory_path, "blk" + str(self.nth_file).zfill(5) + ".dat")
+			self.filenames.append(filename)
+			self.out = open(filename, "wb")
+			self.nth_file += 1
+			self.file_size = 0
+
+		# magic number | block size | block
+		self.out.write(magic_bytes + struct.pack("<I", len(body)) + body)
+		self.file_size += len(body) + 8
+		return
+
+	def close(self):
+		if self.out is not None:
+			self.out.close()
+			self.out = None
+		return
+
+
+def write_files(generator, num_blocks, directory_path, max_file_size=128 * 1024 * 1024, shuffle_window=0):
+	# write generated blocks into blkNNNNN.dat files
+	writer = FileWriter(directory_path, max_file_size)
+	rng = random.Random(0)
+	pending = []
+
+	for height, body in generator.generate(num_blocks):
+		pending.append(body)
+
+		# out-of-order placement within a sliding window
+		if len(pending) > shuffle_window:
+			writer.write(pending.pop(rng.randrange(len(pending))))
+
+	# flush blocks still held back by the shuffle window
+	while len(pending) != 0:
+		writer.write(pending.pop(rng.randrange(len(pending))))
+
+	writer.close()
+
+	return writer.filenames
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Generate synthetic blkNNNNN.dat files")
+	parser.add_argument("--out-dir", default=".", help="directory to write blk files to")
+	parser.add_argument("--blocks", type=int, default=1000, help="main chain length")
+	parser.add_argument("--txs", type=int, default=10, help="transactions per block, including coinbase")
+	parser.add_argument("--inputs", type=int, default=2, help="inputs per transaction")
+	parser.add_argument("--outputs", type=int, default=2, help="outputs per transaction")
+	parser.add_argument("--script-size", type=int, default=72, help="bytes of each input signature script")
+	parser.add_argument("--fork-rate", type=float, default=0.0, help="probability of a stale sibling block")
+	parser.add_argument("--shuffle-window", type=int, default=0, help="blocks written out of order within window")
+	parser.add_argument("--max-file-size", type=int, default=128 * 1024 * 1024, help="bytes per blk file")
+	parser.add_argument("--seed", type=int, default=0, help="random seed")
+	args = parser.parse_args()
+
+	generator = ChainGenerator(args.seed, args.txs, args.inputs, args.outputs, args.script_size, args.fork_rate)
+	filenames = write_files(generator, args.blocks, args.out_dir, args.max_file_size, args.shuffle_window)
+
+	for filename in filenames:
+		print("Wrote " + filename)
@@ -0,0 +1,239 @@
+# generation.py
+# Immutable generations of blockchain indexes, published by reference swap
+
+import chunked
+import headerstore
+import txindex
+
+
+# layers kept before the top layer is merged into the one below it
+max_layers = 8
+
+
+class LayeredDict:
+	# union of dict layers, newest first
+	# only the top layer of an unpublished generation is ever written, so readers of a
+	# published generation see the same contents for as long as they hold it
+
+	def __init__(self, layers=None):
+		# new writable layer over the layers of previous generation
+		self.layers = [{}] + (layers if layers is not None else [])
+		# number of distinct keys
+		self.size = 0
+
+	def extend(self):
+		# new dict sharing every layer of this one below a fresh top layer
+		layered = LayeredDict(self.layers)
+		layered.size = self.size
+		return layered
+
+	def __contains__(self, key):
+		for layer in self.layers:
+			if key in layer:
+				return True
+		return False
+
+	def __getitem__(self, key):
+		for layer in self.layers:
+			if key in layer:
+				return layer[key]
+		raise KeyError(key)
+
+	def get(self, key, default=None):
+		for layer in self.layers:
+			if key in layer:
+				return layer[key]
+		return default
+
+	def __setitem__(self, key, value):
+		# write to top layer, values in lower layers are shadowed not modified
+		if key not in self:
+			self.size += 1
+		self.layers[0][key] = value
+		return
+
+	def get_writable(self, key, copy, default):
+		# value of key in top layer that may be modified in place, a value from a lower
+		# layer is copied up first so published generations keep the original
+		top = self.layers[0]
+		if key not in top:
+			self[key] = copy(self.get(key, default))
+		return top[key]
+
+	def __len__(self):
+		return self.size
+
+	def compact(self):
+		# merge top layer down while it is at least half the size of the layer below,
+		# so each key is copied a logarithmic number of times as the index grows
+		while len(self.layers) > 1 and (len(self.layers[0]) * 2 >= len(self.layers[1]) or
+										len(self.layers) > max_layers):
+			# lower layer may be shared with published generations, merge into a copy
+			merged = dict(self.layers[1])
+			merged.update(self.layers[0])
+			self.layers = [merged] + self.layers[2:]
+		return
+
+
+class IndexGeneration:
+	# consistent snapshot of every index, never modified once published
+
+	def __init__(self, previous=None, tx_index=None):
+		# tx_index starts an empty first generation on another packed index, such as one on disk
+		if previous is None:
+			# previous block header hash (little endian) to blocks
+			# prev_hash -> [block, ...]
+			self.prev_hash_to_blocks = LayeredDict()
+			# current block header hash (little endian) to previous block header hash (little endian)
+			# curr_hash -> prev_hash
+			self.curr_hash_to_prev_hash = LayeredDict()
+			# every block in load order, the index of a block is its block id
+			# append only and shared by all generations, each only uses ids below its block_count
+			self.blocks = []
+			# transaction hashes of blocks indexed by block id and tx position, packed and sorted
+			self.tx_index = tx_index if tx_index is not None else txindex.TxIndex()
+			# transaction hash (little endian) to block id and tx position of blocks not in tx_index yet
+			# every block holding the txid in load order, a stale block and its replacement may share it
+			# txid -> ((block_id, tx_pos), ...)
+			self.txid_locations = LayeredDict()
+			# SHA256 of output script to flattened (block height, tx position, vout) triples
+			# script_hash -> array([height, tx_pos, vout, ...])
+			self.address_index = LayeredDict()
+			# total number of blocks
+			self.block_count = 0
+			# number of blocks in longest chain
+			self.blockchain_height = 0
+			# block hash of latest block (little endian)
+			self.latest_block_little = ""
+			# blocks of the longest chain indexed by block height
+			self.main_chain_blocks = chunked.ChunkedColumn(lambda: [None] * chunked.chunk_size)
+			# header fields of main chain blocks stored column by column
+			self.header_store = headerstore.HeaderStore()
+			# sequence number, one more than the generation this one was built from
+			self.number = 0
+			return
+
+		# share every index of previous generation below a new top layer
+		self.prev_hash_to_blocks = previous.prev_hash_to_blocks.extend()
+		self.curr_hash_to_prev_hash = previous.curr_hash_to_prev_hash.extend()
+		self.blocks = previous.blocks
+		self.tx_index = previous.tx_index
+		self.txid_locations = previous.txid_locations.extend()
+		self.address_index = previous.address_index.extend()
+		self.block_count = previous.block_count
+		self.blockchain_height = previous.blockchain_height
+		self.latest_block_little = previous.latest_block_little
+		# replaced by a branch rather than modified when main chain changes
+		self.main_chain_blocks = previous.main_chain_blocks
+		self.header_store = previous.header_store
+		self.number = previous.number + 1
+
+	def add_block(self, block):
+		# index a newly parsed block, only before this generation is published
+		prev_hash = block.get_prev_hash_little()
+
+		# prev_hash -> curr header, a fork gets a new list so previous generation keeps its own
+		self.prev_hash_to_blocks[prev_hash] = self.prev_hash_to_blocks.get(prev_hash, []) + [block]
+
+		# curr_hash -> prev_hash
+		self.curr_hash_to_prev_hash[block.get_curr_hash_little()] = prev_hash
+
+		# drop blocks an update that failed before publishing left past the published ones
+		del self.blocks[self.block_count:]
+		self.blocks.append(block)
+
+		self.block_count += 1
+		return
+
+	def index_transactions(self, first_block_id):
+		# index transactions of blocks added since first_block_id
+		# recent transactions go to the top dict layer until they are a large share of the
+		# packed index, then every block is packed into a new one and the dict starts over
+		# returns whether a new packed index was built
+		first_block_id = max(first_block_id, self.tx_index.block_count)
+		recent = len(self.txid_locations) + sum([self.blocks[block_id].get_tx_count_int()
+												for block_id in range(first_block_id, self.block_count)])
+		if recent > len(self.tx_index) * txindex.rebuild_ratio:
+			self.tx_index = self.tx_index.extend(self.blocks, self.block_count)
+			self.txid_locations = LayeredDict()
+			return True
+
+		for block_id in range(first_block_id, self.block_count):
+			txs = self.blocks[block_id].get_transactions()
+			for tx_pos in range(0, len(txs)):
+				# keep earlier blocks with the same txid, a new tuple so previous generation keeps its own
+				tx_hash = txs[tx_pos].get_hash_little()
+				self.txid_locations[tx_hash] = self.txid_locations.get(tx_hash, ()) + ((block_id, tx_pos),)
+
+		return False
+
+	def compact(self):
+		for index in (self.prev_hash_to_blocks, self.curr_hash_to_prev_hash, self.txid_locations,
+					self.address_index):
+			index.compact()
+		return
+
+	def get_block(self, block_hash_little):
+		# return block with the header hash, or None
+		prev_hash = self.curr_hash_to_prev_hash.get(block_hash_little)
+		if prev_hash is None:
+			return None
+
+		# get block among the children of its previous block
+		for block in self.prev_hash_to_blocks[prev_hash]:
+			if block.get_curr_hash_little() == block_hash_little:
+				return block
+
+		return None
+
+	def find_transaction(self, tx_hash_little):
+		# return block containing the transaction and its position, or None and -1
+		block, tx_pos, alternates = self.find_transaction_blocks(tx_hash_little)
+		return block, tx_pos
+
+	def find_transaction_blocks(self, tx_hash_little):
+		# return block containing the transaction, its position and every other block containing it,
+		# or None, -1 and []
+		# main chain block wins for duplicate txids, the latest loaded one if none is on the main chain
+		locations = []
+
+		# only prefixes are packed, compare full hash of each candidate
+		for block_id, tx_pos in self.tx_index.find(tx_hash_little):
+			block = self.blocks[block_id]
+			if block.get_transactions()[tx_pos].get_hash_little() == tx_hash_little:
+				locations.append((block, tx_pos))
+
+		# blocks not in tx_index yet were loaded after every packed one
+		for block_id, tx_pos in self.txid_locations.get(tx_hash_little, ()):
+			locations.append((self.blocks[block_id], tx_pos))
+
+		if len(locations) == 0:
+			return None, -1, []
+
+		block, tx_pos = locations[-1]
+		for location in locations:
+			if self.is_main_chain(location[0]):
+				block, tx_pos = location
+
+		return block, tx_pos, [location[0] for location in locations if location[0] is not block]
+
+	def get_output_values(self, tx_hash_little):
+		# satoshi amount of each output of the transaction, or None if it is not loaded
+		# every block holding a txid holds the same transaction, so the first one found answers
+		locations = self.txid_locations.get(tx_hash_little)
+		if locations is not None:
+			block_id, tx_pos = locations[0]
+			return self.blocks[block_id].get_transactions()[tx_pos].get_output_values()
+
+		# only prefixes are packed, compare full hash of each candidate
+		for block_id, tx_pos in self.tx_index.find(tx_hash_little):
+			tx = self.blocks[block_id].get_transactions()[tx_pos]
+			if tx.get_hash_little() == tx_hash_little:
+				return tx.get_output_values()
+
+		return None
+
+	def is_main_chain(self, block):
+		# main chain of this generation, unaffected by later reorgs
+		height = block.get_height()
+		return 0 <= height < len(self.main_chain_blocks) and self.main_chain_blocks[height] is block
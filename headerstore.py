@@ -0,0 +1,285 @@
+# headerstore.py
+# Columnar store of main chain block headers for range analytics
+
+# https://en.bitcoin.it/wiki/Difficulty
+# https://github.com/bitcoin/bips/blob/master/bip-0009.mediawiki
+
+import array
+import bisect
+import chunked
+import txindex
+
+# NumPy is optional, columns are plain arrays viewed as NumPy arrays when present
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+# target threshold of difficulty 1 (nBits 0x1d00ffff)
+difficulty_1_target = 0xffff * 2 ** (8 * (0x1d - 3))
+
+# top 3 bits of version signal BIP9 version bits
+version_bits_mask = 0xE0000000
+version_bits_top = 0x20000000
+# number of BIP9 version bits
+version_bits_count = 29
+
+# number of previous blocks in median time past
+median_time_span = 11
+
+# satoshi subsidy of the first blocks, halved every interval
+initial_subsidy = 50 * 100000000
+subsidy_halving_interval = 210000
+
+
+def nBits_to_target(nBits):
+	# compact target: 1 byte exponent and 3 bytes mantissa
+	exponent = nBits >> 24
+	mantissa = nBits & 0xffffff
+
+	if exponent <= 3:
+		return mantissa >> (8 * (3 - exponent))
+
+	return mantissa << (8 * (exponent - 3))
+
+
+def nBits_to_work(nBits):
+	# expected number of hashes to find a block: 2^256 / (target + 1)
+	return float(2 ** 256 // (nBits_to_target(nBits) + 1))
+
+
+def get_block_subsidy(height):
+	# newly issued satoshi a block at the height may claim, zero once halved 64 times
+	halvings = height // subsidy_halving_interval
+	if halvings >= 64:
+		return 0
+
+	return initial_subsidy >> halvings
+
+
+def nBits_to_difficulty(nBits):
+	target = nBits_to_target(nBits)
+	if target == 0:
+		return 0.0
+
+	return difficulty_1_target / float(target)
+
+
+def new_column(typecode):
+	# chunks are never resized, so NumPy views of them stay valid while the tip moves
+	return chunked.ChunkedColumn(lambda: array.array(typecode, [0]) * chunked.chunk_size)
+
+
+class HeaderStore:
+
+	def __init__(self):
+		# one chunked array per header field, indexed by main chain height
+		self.height = new_column("I")
+		self.time = new_column("I")
+		self.nBits = new_column("I")
+		self.nonce = new_column("I")
+		self.version = new_column("I")
+		self.tx_count = new_column("I")
+		self.size = new_column("I")
+		# cumulative expected number of hashes up to and including the block
+		self.chainwork = new_column("d")
+		# running maximum of block time, non-decreasing
+		self.max_time = new_column("I")
+		# median time of the last 11 blocks, non-decreasing by consensus
+		self.median_time = new_column("I")
+		# totals of every block up to and including the block, a range total is the difference of two
+		self.total_txs = new_column(txindex.uint64_typecode)
+		self.total_inputs = new_column(txindex.uint64_typecode)
+		# satoshi of all outputs and of coinbase outputs
+		self.total_output_value = new_column(txindex.uint64_typecode)
+		self.total_coinbase_value = new_column(txindex.uint64_typecode)
+		# satoshi newly issued, coinbase value up to the subsidy, and fees claimed by coinbase beyond it
+		self.total_issued = new_column(txindex.uint64_typecode)
+		self.total_fees = new_column(txindex.uint64_typecode)
+
+	def __len__(self):
+		return len(self.height)
+
+	def append(self, block):
+		# add next main chain block at the tip
+		self.height.append(len(self.height))
+		self.time.append(block.get_time_int())
+		self.nBits.append(block.get_nBits_int())
+		self.nonce.append(block.get_nonce_int())
+		self.version.append(block.get_version_int())
+		self.tx_count.append(block.get_tx_count_int())
+		self.size.append(block.get_size_int())
+
+		previous_work = self.chainwork[-1] if len(self.chainwork) != 0 else 0.0
+		self.chainwork.append(previous_work + nBits_to_work(block.get_nBits_int()))
+
+		# time index columns
+		block_time = self.time[-1]
+		self.max_time.append(max(self.max_time[-1], block_time) if len(self.max_time) != 0 else block_time)
+		recent_times = sorted(self.time[-median_time_span:])
+		self.median_time.append(recent_times[len(recent_times) // 2])
+
+		# aggregate columns, computed from the block totals without decoding any transaction
+		coinbase_value = block.get_coinbase_value_int()
+		issued = min(coinbase_value, get_block_subsidy(self.height[-1]))
+		for column, value in ((self.total_txs, block.get_tx_count_int()),
+							(self.total_inputs, block.get_input_count_int()),
+							(self.total_output_value, block.get_output_value_int()),
+							(self.total_coinbase_value, coinbase_value),
+							(self.total_issued, issued),
+							(self.total_fees, coinbase_value - issued)):
+			column.append((column[-1] if len(column) != 0 else 0) + value)
+		return
+
+	def extend(self, blocks):
+		for block in blocks:
+			self.append(block)
+		return
+
+	def columns(self):
+		return (self.height, self.time, self.nBits, self.nonce, self.version,
+				self.tx_count, self.size, self.chainwork, self.max_time, self.median_time,
+				self.total_txs, self.total_inputs, self.total_output_value, self.total_coinbase_value,
+				self.total_issued, self.total_fees)
+
+	def truncate(self, height):
+		# drop blocks above height when the tip moves to another chain
+		for column in self.columns():
+			column.truncate(height + 1)
+		return
+
+	def branch(self):
+		# new generations modify a store sharing the chunks of this one, so a tip update
+		# costs the new blocks and a reorg copies at most one chunk per column
+		store = HeaderStore()
+		(store.height, store.time, store.nBits, store.nonce, store.version, store.tx_count,
+			store.size, store.chainwork, store.max_time, store.median_time,
+			store.total_txs, store.total_inputs, store.total_output_value, store.total_coinbase_value,
+			store.total_issued, store.total_fees) = [column.branch() for column in self.columns()]
+		return store
+
+	def column(self, column, start, end):
+		# slice [start, end) of a column, as a zero copy NumPy view when it lies in one chunk
+		if numpy is not None:
+			views = [numpy.frombuffer(chunk, dtype=chunk.typecode)[first:last]
+					for chunk, first, last in column.get_pieces(start, end)]
+			return views[0] if len(views) == 1 else numpy.concatenate(views)
+
+		return column[start:end]
+
+	def get_range_stats(self, start, end):
+		# statistics of main chain blocks from height start to end inclusive
+		times = self.column(self.time, start, end + 1)
+		nBits = self.column(self.nBits, start, end + 1)
+		versions = self.column(self.version, start, end + 1)
+		tx_counts = self.column(self.tx_count, start, end + 1)
+		sizes = self.column(self.size, start, end + 1)
+
+		block_count = end - start + 1
+		# seconds between first and last block
+		time_span = int(times[-1]) - int(times[0])
+
+		if numpy is not None:
+			# difficulty = difficulty 1 target / target, per block
+			exponents = (nBits >> 24).astype("int64")
+			mantissas = (nBits & 0xffffff).astype("float64")
+			difficulties = numpy.ldexp(0xffff / mantissas, 8 * (0x1d - exponents))
+
+			tx_total = int(tx_counts.sum(dtype="int64"))
+			size_total = int(sizes.sum(dtype="int64"))
+			min_difficulty = float(difficulties.min())
+			max_difficulty = float(difficulties.max())
+			mean_difficulty = float(difficulties.mean())
+
+			# count of BIP9 blocks setting each version bit
+			bip9 = versions[(versions & version_bits_mask) == version_bits_top]
+			bit_counts = [int(((bip9 >> bit) & 1).sum()) for bit in range(0, version_bits_count)]
+
+		else:
+			difficulties = [nBits_to_difficulty(bits) for bits in nBits]
+
+			tx_total = sum(tx_counts)
+			size_total = sum(sizes)
+			min_difficulty = min(difficulties)
+			max_difficulty = max(difficulties)
+			mean_difficulty = sum(difficulties) / block_count
+
+			bip9 = [version for version in versions if (version & version_bits_mask) == version_bits_top]
+			bit_counts = [0] * version_bits_count
+			for version in bip9:
+				for bit in range(0, version_bits_count):
+					if (version >> bit) & 1:
+						bit_counts[bit] += 1
+
+		# expected number of hashes done by the blocks in range
+		previous_work = self.chainwork[start - 1] if start > 0 else 0.0
+		work = self.chainwork[end] - previous_work
+
+		stats = {}
+		stats["block_count"] = block_count
+		stats["min_difficulty"] = min_difficulty
+		stats["max_difficulty"] = max_difficulty
+		stats["mean_difficulty"] = mean_difficulty
+		stats["avg_block_interval"] = time_span / float(block_count - 1) if block_count > 1 else 0.0
+		stats["tx_count"] = tx_total
+		stats["avg_tx_per_block"] = tx_total / float(block_count)
+		stats["tx_per_second"] = tx_total / float(time_span) if time_span > 0 else 0.0
+		stats["avg_block_size"] = size_total / float(block_count)
+		stats["work"] = work
+		stats["chainwork"] = self.chainwork[end]
+		stats["version_bits_blocks"] = len(bip9)
+		stats["version_bits"] = dict([(str(bit), bit_counts[bit])
+									for bit in range(0, version_bits_count) if bit_counts[bit] != 0])
+
+		return stats
+
+	def get_range_aggregates(self, start, end):
+		# totals of main chain blocks from height start to end inclusive, each from two entries
+		def total(column):
+			return column[end] - (column[start - 1] if start > 0 else 0)
+
+		aggregates = {}
+		aggregates["block_count"] = end - start + 1
+		aggregates["tx_count"] = total(self.total_txs)
+		aggregates["input_count"] = total(self.total_inputs)
+		# 100000000 satoshi = 1 BTC
+		aggregates["output_value"] = total(self.total_output_value) / 100000000.0
+		aggregates["coinbase_value"] = total(self.total_coinbase_value) / 100000000.0
+		aggregates["issued"] = total(self.total_issued) / 100000000.0
+		aggregates["fees"] = total(self.total_fees) / 100000000.0
+
+		return aggregates
+
+	def get_time_range(self, start_time, end_time, offset, limit):
+		# number of blocks with start_time <= time <= end_time, and heights of up to limit of them
+		# after skipping offset, in height order
+		# every earlier block has time < start_time once the running maximum is below it
+		start = bisect.bisect_left(self.max_time, start_time)
+		# block time must be greater than median time past of its previous block,
+		# so every block after the median time reaches end_time is later than end_time
+		end = min(bisect.bisect_left(self.median_time, end_time) + 1, len(self.time))
+
+		if start >= end:
+			return 0, []
+
+		# by the same rule every block after the median time reaches start_time is in range,
+		# and so is every block up to where the running maximum passes end_time
+		inner_start = min(max(bisect.bisect_left(self.median_time, start_time) + 1, start), end)
+		inner_end = max(min(bisect.bisect_right(self.max_time, end_time), end), inner_start)
+
+		# only candidates outside the inner bounds are filtered by time, a few blocks at either end
+		head = [i for i in range(start, inner_start) if start_time <= self.time[i] <= end_time]
+		tail = [i for i in range(inner_end, end) if start_time <= self.time[i] <= end_time]
+		count = len(head) + (inner_end - inner_start) + len(tail)
+
+		# page through head, inner bounds and tail without listing heights outside it
+		heights = head[offset: offset + limit]
+		offset = max(0, offset - len(head))
+		first = inner_start + offset
+		last = min(inner_end, first + limit - len(heights))
+		heights += list(range(first, max(first, last)))
+		offset = max(0, offset - (inner_end - inner_start))
+		heights += tail[offset: offset + limit - len(heights)]
+
+		return count, heights
@@ -14,6 +14,12 @@ pip install pipenv
 # install python requests
 pipenv install requests
 
+# optional, vectorizes header stats and txid index builds, pure python is used without it
+pipenv install numpy
+
+# optional, reference MessagePack and CBOR encoders, encoding.py has its own without them
+pipenv install msgpack cbor2
+
 # install bitcoin core to run full node
 wget https://bitcoin.org/bin/bitcoin-core-0.16.1/bitcoin-0.16.1-x86_64-linux-gnu.tar.gz
 tar -xzf bitcoin-0.16.1-x86_64-linux-gnu.tar.gz
@@ -0,0 +1,278 @@
+# loadstats.py
+# Time load phases, report rates and memory, and profile blockchain setup
+
+# https://docs.python.org/3/library/profile.html
+# https://docs.python.org/3/library/tracemalloc.html
+
+import os
+import sys
+import time
+import threading
+import collections
+
+# resource is only available on Unix
+try:
+	import resource
+except ImportError:
+	resource = None
+
+# tracemalloc is only available on Python 3.4+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+
+# profilers that can wrap the load
+cprofile_profiler = "cprofile"
+sampling_profiler = "sample"
+
+# seconds between stack samples of the sampling profiler
+sample_interval = 0.005
+
+
+class LoadStats:
+
+	def __init__(self):
+		# guards phase_seconds while progress is read by request threads
+		self.lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		# current load phase
+		self.phase = "idle"
+		# load phase -> seconds spent
+		self.phase_seconds = collections.OrderedDict()
+		# wall clock start and end of setup
+		self.start_time = 0.0
+		self.end_time = 0.0
+		# files and bytes to parse
+		self.files_total = 0
+		self.bytes_total = 0
+		# files, bytes, blocks and transactions parsed so far
+		self.files_done = 0
+		self.bytes_done = 0
+		self.blocks_done = 0
+		self.txs_done = 0
+		# one report per parsed file
+		self.file_reports = []
+		# whether memory allocations are traced
+		self.trace_memory = False
+		return
+
+	def start(self, filenames, trace_memory=False):
+		# reset for a new load of the given files
+		self.reset()
+		self.start_time = time.time()
+		self.files_total = len(filenames)
+		self.bytes_total = sum([os.stat(filename).st_size for filename in filenames])
+
+		if trace_memory and tracemalloc is not None:
+			tracemalloc.start()
+			self.trace_memory = True
+		return
+
+	def finish(self):
+		self.end_time = time.time()
+		self.phase = "done"
+		return
+
+	def begin_phase(self, phase):
+		# start a named phase, returns its start time
+		self.phase = phase
+		with self.lock:
+			if phase not in self.phase_seconds:
+				self.phase_seconds[phase] = 0.0
+		return time.time()
+
+	def end_phase(self, phase, start):
+		self.add(phase, time.time() - start)
+		return
+
+	def add(self, phase, seconds):
+		# accumulate time of a phase
+		with self.lock:
+			self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.0) + seconds
+		return
+
+	def add_block(self, block_bytes, tx_count):
+		self.blocks_done += 1
+		self.txs_done += tx_count
+		self.bytes_done += block_bytes
+		return
+
+	def file_done(self, filename, file_bytes, blocks, txs, read_seconds, parse_seconds):
+		self.files_done += 1
+
+		# rates of this file
+		seconds = max(read_seconds + parse_seconds, 1e-9)
+		report = collections.OrderedDict()
+		report["file"] = filename
+		report["bytes"] = file_bytes
+		report["blocks"] = blocks
+		report["txs"] = txs
+		report["read_seconds"] = read_seconds
+		report["parse_seconds"] = parse_seconds
+		report["read_bytes_per_second"] = file_bytes / max(read_seconds, 1e-9)
+		report["bytes_per_second"] = file_bytes / seconds
+		report["blocks_per_second"] = blocks / seconds
+		report["txs_per_second"] = txs / seconds
+		self.file_reports.append(report)
+
+		return report
+
+	def get_peak_memory(self):
+		# peak memory in bytes, traced allocations when enabled otherwise peak RSS
+		if self.trace_memory:
+			return tracemalloc.get_traced_memory()[1]
+
+		if resource is not None:
+			# ru_maxrss is kilobytes on Linux and bytes on macOS
+			peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+			return peak if sys.platform == "darwin" else peak * 1024
+
+		return -1
+
+	def get_progress(self):
+		# snapshot of load progress for orchestration
+		end = self.end_time if self.end_time != 0.0 else time.time()
+		elapsed = end - self.start_time if self.start_time != 0.0 else 0.0
+
+		progress = collections.OrderedDict()
+		progress["phase"] = self.phase
+		progress["files_done"] = self.files_done
+		progress["files_total"] = self.files_total
+		progress["bytes_done"] = self.bytes_done
+		progress["bytes_total"] = self.bytes_total
+		progress["blocks_done"] = self.blocks_done
+		progress["txs_done"] = self.txs_done
+		progress["elapsed_seconds"] = elapsed
+
+		# bytes per second while parsing files, reads ahead of the parser only count while it waits on them
+		load_seconds = self.phase_seconds.get("read_wait", self.phase_seconds.get("read", 0.0)) + \
+			self.phase_seconds.get("parse", 0.0)
+		rate = self.bytes_done / load_seconds if load_seconds > 0 else 0.0
+		progress["bytes_per_second"] = rate
+		progress["blocks_per_second"] = self.blocks_done / load_seconds if load_seconds > 0 else 0.0
+		progress["txs_per_second"] = self.txs_done / load_seconds if load_seconds > 0 else 0.0
+
+		# estimated seconds until all files are parsed, -1 if unknown
+		if self.phase == "done":
+			progress["percent"] = 100.0
+			progress["eta_seconds"] = 0.0
+		elif self.bytes_total > 0:
+			progress["percent"] = 100.0 * self.bytes_done / self.bytes_total
+			progress["eta_seconds"] = (self.bytes_total - self.bytes_done) / rate if rate > 0 else -1.0
+		else:
+			progress["percent"] = 0.0
+			progress["eta_seconds"] = -1.0
+
+		with self.lock:
+			progress["phase_seconds"] = collections.OrderedDict(self.phase_seconds)
+		progress["peak_memory_bytes"] = self.get_peak_memory()
+
+		return progress
+
+	def report(self):
+		# human readable summary printed at the end of setup
+		lines = ["Load summary:"]
+		for phase in self.phase_seconds:
+			lines.append("  %-16s %10.3f s" % (phase, self.phase_seconds[phase]))
+
+		progress = self.get_progress()
+		lines.append("  %-16s %10.3f s" % ("total", progress["elapsed_seconds"]))
+		lines.append("  %d files, %d bytes, %d blocks, %d txs" %
+					(self.files_done, self.bytes_done, self.blocks_done, self.txs_done))
+		lines.append("  %.1f MB/s, %.1f blocks/s, %.1f txs/s" %
+					(progress["bytes_per_second"] / 1e6, progress["blocks_per_second"], progress["txs_per_second"]))
+		lines.append("  peak memory %.1f MB" % (progress["peak_memory_bytes"] / 1e6))
+
+		return "\n".join(lines)
+
+
+class SamplingProfiler:
+	# samples the stack of one thread at a fixed interval
+
+	def __init__(self, thread_id, interval=sample_interval):
+		self.thread_id = thread_id
+		self.interval = interval
+		# (filename, line, function) -> number of samples on top of stack
+		self.self_counts = collections.Counter()
+		# (filename, line, function) -> number of samples anywhere in stack
+		self.total_counts = collections.Counter()
+		self.samples = 0
+		self.running = False
+		self.thread = None
+
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+		return
+
+	def stop(self):
+		self.running = False
+		self.thread.join()
+		return
+
+	def run(self):
+		while self.running:
+			frame = sys._current_frames().get(self.thread_id)
+			if frame is not None:
+				self.samples += 1
+				code = frame.f_code
+				self.self_counts[(code.co_filename, code.co_firstlineno, code.co_name)] += 1
+
+				# count each function once per sample
+				seen = set()
+				while frame is not None:
+					code = frame.f_code
+					key = (code.co_filename, code.co_firstlineno, code.co_name)
+					if key not in seen:
+						self.total_counts[key] += 1
+						seen.add(key)
+					frame = frame.f_back
+
+			time.sleep(self.interval)
+		return
+
+	def write_report(self, path):
+		with open(path, "w") as out:
+			out.write("%d samples every %.3f s\n\n" % (self.samples, self.interval))
+			out.write("%8s %8s  %s\n" % ("self%", "total%", "function"))
+			for key, count in self.total_counts.most_common():
+				filename, line, name = key
+				out.write("%7.2f%% %7.2f%%  %s (%s:%d)\n" %
+						(100.0 * self.self_counts[key] / max(self.samples, 1),
+						100.0 * count / max(self.samples, 1), name, os.path.basename(filename), line))
+		return
+
+
+def run_profiled(function, profiler, path):
+	# run function under the named profiler and write the report to path
+	if profiler == cprofile_profiler:
+		import cProfile
+		import pstats
+
+		profile = cProfile.Profile()
+		result = profile.runcall(function)
+
+		with open(path, "w") as out:
+			stats = pstats.Stats(profile, stream=out)
+			stats.sort_stats("cumulative").print_stats(50)
+
+		return result
+
+	elif profiler == sampling_profiler:
+		sampler = SamplingProfiler(threading.current_thread().ident)
+		sampler.start()
+		try:
+			result = function()
+		finally:
+			sampler.stop()
+			sampler.write_report(path)
+
+		return result
+
+	return function()
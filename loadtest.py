@@ -0,0 +1,440 @@
+# loadtest.py
+# Drive the Query API endpoints on localhost and report latency percentiles
+
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import argparse
+import collections
+
+try:
+	from httplib import HTTPConnection, HTTPException
+	from Queue import Queue, Empty
+except ImportError:
+	from http.client import HTTPConnection, HTTPException
+	from queue import Queue, Empty
+
+
+# only a local server instance may be load tested
+local_hosts = ("localhost", "127.0.0.1", "::1")
+
+# endpoints and their default share of requests
+default_mix = collections.OrderedDict([
+	("blockheader", 20), ("blockheight", 15), ("mainchain", 10),
+	("latestblock", 10), ("latestheight", 10), ("blocktransactions", 5),
+	("transactioninfo", 15), ("transactioninputs", 8), ("transactionoutputs", 7)])
+
+# endpoints taking a block hash, a transaction hash or no parameter
+block_endpoints = ("blockheader", "blockheight", "mainchain", "blocktransactions")
+tx_endpoints = ("transactioninfo", "transactioninputs", "transactionoutputs")
+
+# invalid request kinds mixed in by --invalid-rate
+invalid_kinds = ("malformed", "unknown_hash", "unknown_path")
+
+# latency percentiles reported
+percentiles = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999))
+
+
+def parse_mix(mix):
+	# "blockheader=5,latestheight=1" -> ordered weights
+	weights = collections.OrderedDict()
+	for item in mix.split(","):
+		name, weight = item.split("=")
+		if name not in default_mix:
+			raise ValueError("unknown endpoint " + name)
+		weights[name] = float(weight)
+
+	return weights
+
+
+def sample_from_server(host, port, count):
+	# walk back from the latest block to sample block and transaction hashes
+	connection = HTTPConnection(host, port)
+
+	def get(path):
+		connection.request("GET", path)
+		response = connection.getresponse()
+		body = response.read()
+		if response.getheader("Connection", "").lower() == "close" or response.version == 10:
+			connection.close()
+		return json.loads(body.decode("utf-8"))
+
+	block_hashes = []
+	tx_hashes = []
+	block_hash = get("/latestblock")["hash"]
+	while len(block_hashes) < count and block_hash != "0" * 64:
+		block_hashes.append(block_hash)
+		tx_hashes += [tx["tx_hash"] for tx in get("/blocktransactions?" + block_hash)["transactions"]]
+		block_hash = get("/blockheader?" + block_hash)["prev_block"]
+
+	connection.close()
+
+	return block_hashes, tx_hashes
+
+
+def sample_from_index(count, rng):
+	# block and transaction hashes of the chain loaded in this process
+	import blockchain
+
+	blocks = [rng.choice(blockchain.current.main_chain_blocks) for i in range(0, count)]
+	block_hashes = [block.get_curr_hash_big() for block in blocks]
+	tx_hashes = [rng.choice(block.get_transactions()).get_hash_big() for block in blocks]
+
+	return block_hashes, tx_hashes
+
+
+class RequestMaker:
+	# pick endpoint by weight and build its path
+
+	def __init__(self, weights, block_hashes, tx_hashes, invalid_rate):
+		self.names = list(weights.keys())
+		self.cumulative = []
+		total = 0.0
+		for name in self.names:
+			total += weights[name]
+			self.cumulative.append(total)
+		self.total = total
+		self.block_hashes = block_hashes
+		self.tx_hashes = tx_hashes
+		self.invalid_rate = invalid_rate
+
+	def make(self, rng):
+		# return (label, path)
+		if rng.random() < self.invalid_rate:
+			kind = rng.choice(invalid_kinds)
+			if kind == "malformed":
+				# 400 Bad Request
+				return "invalid_malformed", "/blockheader?" + "zz" * 32
+			elif kind == "unknown_hash":
+				# 200 with error message
+				return "invalid_unknown_hash", "/transactioninfo?%064x" % rng.getrandbits(256)
+			else:
+				# 404 Not Found
+				return "invalid_unknown_path", "/nosuchendpoint"
+
+		point = rng.random() * self.total
+		for i in range(0, len(self.names)):
+			if point < self.cumulative[i]:
+				break
+		name = self.names[i]
+
+		if name in block_endpoints:
+			return name, "/" + name + "?" + rng.choice(self.block_hashes)
+		elif name in tx_endpoints:
+			return name, "/" + name + "?" + rng.choice(self.tx_hashes)
+
+		return name, "/" + name
+
+
+class Client:
+	# one HTTP client, a new connection per request as the server closes each after its response
+
+	def __init__(self, host, port, timeout, headers):
+		self.host = host
+		self.port = port
+		self.timeout = timeout
+		# extra request headers, such as Accept and Accept-Encoding
+		self.headers = headers
+		self.connection = None
+
+	def get(self, path):
+		# return status code, -1 on connection error
+		self.connection = HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+		try:
+			headers = dict(self.headers)
+			headers["Connection"] = "close"
+			self.connection.request("GET", path, headers=headers)
+			response = self.connection.getresponse()
+			body = response.read()
+			status = response.status
+
+			# error message in a 200 response, only seen in uncompressed JSON
+			if status == 200 and body.startswith(b'{"error"'):
+				return 200, True
+
+			return status, False
+
+		except (socket.error, HTTPException):
+			return -1, False
+
+		finally:
+			self.close()
+
+	def close(self):
+		if self.connection is not None:
+			self.connection.close()
+			self.connection = None
+		return
+
+
+class Results:
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		# label -> list of latencies in seconds
+		self.latencies = collections.defaultdict(list)
+		# label -> status -> count
+		self.statuses = collections.defaultdict(collections.Counter)
+		# label -> number of 200 responses carrying an error message
+		self.error_bodies = collections.Counter()
+
+	def merge(self, latencies, statuses, error_bodies):
+		with self.lock:
+			for label in latencies:
+				self.latencies[label].extend(latencies[label])
+			for label in statuses:
+				self.statuses[label].update(statuses[label])
+			self.error_bodies.update(error_bodies)
+		return
+
+	def summary(self, seconds):
+		# per endpoint throughput, percentiles and error rates
+		report = collections.OrderedDict()
+		all_latencies = []
+		all_statuses = collections.Counter()
+
+		for label in sorted(self.latencies):
+			latencies = sorted(self.latencies[label])
+			all_latencies += latencies
+			all_statuses.update(self.statuses[label])
+			report[label] = summarize(latencies, self.statuses[label], self.error_bodies[label], seconds)
+
+		all_latencies.sort()
+		report["all"] = summarize(all_latencies, all_statuses, sum(self.error_bodies.values()), seconds)
+
+		return report
+
+
+def summarize(latencies, statuses, error_bodies, seconds):
+	count = len(latencies)
+	result = collections.OrderedDict()
+	result["requests"] = count
+	result["requests_per_second"] = count / seconds if seconds > 0 else 0.0
+
+	for name, fraction in percentiles:
+		index = min(int(fraction * count), count - 1)
+		result[name + "_ms"] = 1e3 * latencies[index] if count > 0 else 0.0
+
+	# error rates by kind
+	result["status"] = dict([(str(status), statuses[status]) for status in statuses])
+	failed = count - statuses[200]
+	result["error_rate"] = failed / float(count) if count > 0 else 0.0
+	result["error_body_rate"] = error_bodies / float(count) if count > 0 else 0.0
+
+	return result
+
+
+def run_closed_loop(maker, args, results, deadline, max_requests):
+	# each client sends its next request when the previous one completes
+	sent = [0]
+	sent_lock = threading.Lock()
+
+	def worker(seed):
+		rng = random.Random(seed)
+		client = Client(args.host, args.port, args.timeout, get_headers(args))
+		latencies = collections.defaultdict(list)
+		statuses = collections.defaultdict(collections.Counter)
+		error_bodies = collections.Counter()
+
+		while time.time() < deadline:
+			if max_requests > 0:
+				with sent_lock:
+					if sent[0] >= max_requests:
+						break
+					sent[0] += 1
+
+			label, path = maker.make(rng)
+			start = time.time()
+			status, error_body = client.get(path)
+			latencies[label].append(time.time() - start)
+			statuses[label][status] += 1
+			if error_body:
+				error_bodies[label] += 1
+
+		client.close()
+		results.merge(latencies, statuses, error_bodies)
+		return
+
+	return [threading.Thread(target=worker, args=(args.seed + i,)) for i in range(0, args.concurrency)]
+
+
+def run_open_loop(maker, args, results, deadline, max_requests):
+	# requests are scheduled at a fixed rate regardless of completions, and latency
+	# is measured from the scheduled time so queueing delay is not hidden
+	schedule = Queue()
+
+	def dispatcher():
+		rng = random.Random(args.seed)
+		interval = 1.0 / args.rate
+		next_time = time.time()
+		count = 0
+		while next_time < deadline and (max_requests <= 0 or count < max_requests):
+			schedule.put((next_time, maker.make(rng)))
+			count += 1
+			next_time += interval
+
+			# stay a little ahead of the schedule
+			delay = next_time - time.time() - 0.05
+			if delay > 0:
+				time.sleep(delay)
+
+		for i in range(0, args.concurrency):
+			schedule.put(None)
+		return
+
+	def worker():
+		client = Client(args.host, args.port, args.timeout, get_headers(args))
+		latencies = collections.defaultdict(list)
+		statuses = collections.defaultdict(collections.Counter)
+		error_bodies = collections.Counter()
+
+		while True:
+			item = schedule.get()
+			if item is None:
+				break
+
+			scheduled, (label, path) = item
+			delay = scheduled - time.time()
+			if delay > 0:
+				time.sleep(delay)
+
+			status, error_body = client.get(path)
+			latencies[label].append(time.time() - scheduled)
+			statuses[label][status] += 1
+			if error_body:
+				error_bodies[label] += 1
+
+		client.close()
+		results.merge(latencies, statuses, error_bodies)
+		return
+
+	threads = [threading.Thread(target=dispatcher)]
+	threads += [threading.Thread(target=worker) for i in range(0, args.concurrency)]
+
+	return threads
+
+
+def get_headers(args):
+	headers = {}
+	if args.accept is not None:
+		headers["Accept"] = args.accept
+	if args.accept_encoding is not None:
+		headers["Accept-Encoding"] = args.accept_encoding
+	return headers
+
+
+def print_report(report):
+	print("%-24s %9s %9s %9s %9s %9s %9s %8s %8s" %
+		("endpoint", "requests", "req/s", "p50 ms", "p95 ms", "p99 ms", "p999 ms", "errors", "err body"))
+	for label in report:
+		row = report[label]
+		print("%-24s %9d %9.1f %9.2f %9.2f %9.2f %9.2f %7.2f%% %7.2f%%" %
+			(label, row["requests"], row["requests_per_second"], row["p50_ms"], row["p95_ms"],
+			row["p99_ms"], row["p999_ms"], 100.0 * row["error_rate"], 100.0 * row["error_body_rate"]))
+	return
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Load test the Query API on localhost")
+	parser.add_argument("--host", default="localhost", help="local server address")
+	parser.add_argument("--port", type=int, default=9000, help="local server port")
+	parser.add_argument("--spawn", action="store_true", help="start a server in this process on a free port")
+	parser.add_argument("--data-dir", default=None, help="load blk files here to sample hashes (and serve with --spawn)")
+	parser.add_argument("--synthetic", type=int, default=0, help="generate a chain of this many blocks instead")
+	parser.add_argument("--samples", type=int, default=500, help="number of blocks to sample hashes from")
+	parser.add_argument("--mix", default=None, help="endpoint weights, e.g. blockheader=5,latestheight=1")
+	parser.add_argument("--invalid-rate", type=float, default=0.0, help="fraction of 400/404/unknown hash requests")
+	parser.add_argument("--concurrency", type=int, default=8, help="number of client threads")
+	parser.add_argument("--rate", type=float, default=0.0, help="open loop requests per second, 0 for closed loop")
+	parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+	parser.add_argument("--requests", type=int, default=0, help="stop after this many requests, 0 for no limit")
+	parser.add_argument("--accept", default=None, help="Accept header, e.g. application/msgpack")
+	parser.add_argument("--accept-encoding", default=None, help="Accept-Encoding header, e.g. gzip")
+	parser.add_argument("--timeout", type=float, default=10.0, help="seconds before a request fails")
+	parser.add_argument("--seed", type=int, default=0, help="random seed")
+	parser.add_argument("--json", default=None, help="file to write JSON report to")
+	args = parser.parse_args()
+
+	if args.host not in local_hosts:
+		parser.error("load tests only run against a local server instance")
+
+	rng = random.Random(args.seed)
+	weights = parse_mix(args.mix) if args.mix is not None else default_mix
+
+	# load blocks in this process when hashes are sampled from the index
+	temp_dir = None
+	if args.synthetic > 0 or args.data_dir is not None:
+		import blockchain
+		import generate
+
+		directory_path = args.data_dir
+		if args.synthetic > 0:
+			temp_dir = tempfile.mkdtemp(prefix="blkload")
+			directory_path = temp_dir + os.sep
+			generate.write_files(generate.ChainGenerator(args.seed), args.synthetic, temp_dir)
+
+		blockchain.setup(directory_path)
+
+	# serve the loaded chain from this process
+	httpd = None
+	if args.spawn:
+		import server
+
+		server.Handler.log_message = lambda self, *log_args: None
+		httpd = server.create_server((args.host, 0))
+		server_thread = threading.Thread(target=httpd.serve_forever)
+		server_thread.daemon = True
+		server_thread.start()
+		args.port = httpd.server_address[1]
+
+	try:
+		if temp_dir is not None or args.data_dir is not None:
+			block_hashes, tx_hashes = sample_from_index(args.samples, rng)
+		else:
+			block_hashes, tx_hashes = sample_from_server(args.host, args.port, args.samples)
+
+		maker = RequestMaker(weights, block_hashes, tx_hashes, args.invalid_rate)
+		results = Results()
+		deadline = time.time() + args.duration
+
+		if args.rate > 0:
+			threads = run_open_loop(maker, args, results, deadline, args.requests)
+		else:
+			threads = run_closed_loop(maker, args, results, deadline, args.requests)
+
+		# silence request logging of the spawned server
+		stdout = sys.stdout
+		if httpd is not None:
+			sys.stdout = open(os.devnull, "w")
+
+		start = time.time()
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		seconds = time.time() - start
+
+		if httpd is not None:
+			sys.stdout.close()
+			sys.stdout = stdout
+
+		report = results.summary(seconds)
+		print_report(report)
+
+		if args.json is not None:
+			with open(args.json, "w") as out:
+				json.dump(report, out, indent=2)
+
+	finally:
+		if httpd is not None:
+			httpd.shutdown()
+			httpd.server_close()
+		if temp_dir is not None:
+			shutil.rmtree(temp_dir)
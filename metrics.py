@@ -0,0 +1,215 @@
+# metrics.py
+# Record request metrics and render them in Prometheus text format
+
+# https://prometheus.io/docs/instrumenting/exposition_formats/
+
+import time
+import threading
+import cache
+
+
+# upper bounds of latency histogram buckets in seconds
+latency_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+					0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# number of independently locked shards, request threads rarely share one
+num_shards = 16
+
+# content type of the Prometheus text format
+content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Shard:
+
+	def __init__(self):
+		# only threads mapped to this shard contend on its lock
+		self.lock = threading.Lock()
+		# (name, labels) -> value
+		self.counters = {}
+		# (name, labels) -> [count per bucket..., count, sum]
+		self.histograms = {}
+
+
+class Registry:
+
+	def __init__(self):
+		self.shards = [Shard() for i in range(0, num_shards)]
+		# name -> (help text, type)
+		self.descriptions = {}
+		# name -> (help text, function returning list of (labels, value))
+		self.gauges = {}
+		self.lock = threading.Lock()
+
+	def get_shard(self):
+		# each thread records into the shard of its thread id
+		return self.shards[threading.current_thread().ident % num_shards]
+
+	def describe(self, name, help_text, metric_type):
+		self.descriptions[name] = (help_text, metric_type)
+		return
+
+	def inc(self, name, labels=(), amount=1):
+		# add to counter, labels is a tuple of (label, value) pairs
+		shard = self.get_shard()
+		key = (name, labels)
+		with shard.lock:
+			shard.counters[key] = shard.counters.get(key, 0) + amount
+		return
+
+	def observe(self, name, labels, seconds):
+		# add observation to histogram
+		shard = self.get_shard()
+		key = (name, labels)
+		with shard.lock:
+			buckets = shard.histograms.get(key)
+			if buckets is None:
+				buckets = [0] * (len(latency_buckets) + 2)
+				shard.histograms[key] = buckets
+
+			# count in first bucket whose bound is not exceeded, cumulated at render
+			for i in range(0, len(latency_buckets)):
+				if seconds <= latency_buckets[i]:
+					buckets[i] += 1
+					break
+
+			buckets[-2] += 1
+			buckets[-1] += seconds
+		return
+
+	def register_gauge(self, name, help_text, function):
+		# function is called at render time and returns list of (labels, value)
+		with self.lock:
+			self.gauges[name] = (help_text, function)
+		return
+
+	def collect(self):
+		# merge every shard into one snapshot
+		counters = {}
+		histograms = {}
+		for shard in self.shards:
+			with shard.lock:
+				for key in shard.counters:
+					counters[key] = counters.get(key, 0) + shard.counters[key]
+
+				for key in shard.histograms:
+					if key not in histograms:
+						histograms[key] = [0] * (len(latency_buckets) + 2)
+					merged = histograms[key]
+					buckets = shard.histograms[key]
+					for i in range(0, len(buckets)):
+						merged[i] += buckets[i]
+
+		return counters, histograms
+
+	def render(self):
+		# Prometheus text exposition format
+		counters, histograms = self.collect()
+		lines = []
+
+		# counters grouped by name
+		names = sorted(set([name for name, labels in counters]))
+		for name in names:
+			write_header(lines, name, self.descriptions.get(name, ("", "counter")))
+			for key in sorted([key for key in counters if key[0] == name]):
+				lines.append(name + format_labels(key[1]) + " " + format_value(counters[key]))
+
+		# histograms grouped by name
+		names = sorted(set([name for name, labels in histograms]))
+		for name in names:
+			write_header(lines, name, self.descriptions.get(name, ("", "histogram")))
+			for key in sorted([key for key in histograms if key[0] == name]):
+				labels = key[1]
+				buckets = histograms[key]
+
+				cumulative = 0
+				for i in range(0, len(latency_buckets)):
+					cumulative += buckets[i]
+					lines.append(name + "_bucket" + format_labels(labels + (("le", repr(latency_buckets[i])),)) +
+								" " + str(cumulative))
+				lines.append(name + "_bucket" + format_labels(labels + (("le", "+Inf"),)) + " " + str(buckets[-2]))
+				lines.append(name + "_count" + format_labels(labels) + " " + str(buckets[-2]))
+				lines.append(name + "_sum" + format_labels(labels) + " " + format_value(buckets[-1]))
+
+		# gauges evaluated now
+		with self.lock:
+			gauges = sorted(self.gauges.items())
+		for name, (help_text, function) in gauges:
+			write_header(lines, name, (help_text, "gauge"))
+			for labels, value in function():
+				lines.append(name + format_labels(labels) + " " + format_value(value))
+
+		return "\n".join(lines) + "\n"
+
+
+def write_header(lines, name, description):
+	help_text, metric_type = description
+	if help_text != "":
+		lines.append("# HELP " + name + " " + help_text)
+	lines.append("# TYPE " + name + " " + metric_type)
+	return
+
+
+def format_labels(labels):
+	if len(labels) == 0:
+		return ""
+
+	pairs = []
+	for label, value in labels:
+		value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+		pairs.append(label + "=\"" + value + "\"")
+
+	return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value):
+	if isinstance(value, float):
+		return repr(value)
+
+	return str(value)
+
+
+def get_cache_sizes():
+	return [((("cache", c.name),), len(c)) for c in cache.caches]
+
+
+def get_cache_hit_rates():
+	return [((("cache", c.name),), c.get_hit_rate()) for c in cache.caches]
+
+
+# process wide registry
+registry = Registry()
+
+registry.describe("http_requests_total", "Number of HTTP requests by endpoint and status code", "counter")
+registry.describe("http_request_duration_seconds", "Latency of HTTP requests by endpoint", "histogram")
+registry.describe("http_request_phase_seconds", "Latency of lookup, encode and write phases", "histogram")
+registry.describe("http_requests_in_flight", "Number of HTTP requests being handled", "gauge")
+registry.describe("http_response_bytes_total", "Bytes of response bodies sent by content coding", "counter")
+
+registry.register_gauge("cache_entries", "Number of entries in each cache", get_cache_sizes)
+registry.register_gauge("cache_hit_ratio", "Ratio of cache lookups that hit", get_cache_hit_rates)
+
+
+class RequestTimer:
+	# times one request and its phases
+
+	def __init__(self):
+		self.start = time.time()
+		self.phase_start = self.start
+		# endpoint label, unknown paths share one label
+		self.endpoint = "other"
+		registry.inc("http_requests_in_flight")
+
+	def phase(self, name):
+		# end current phase and start the next one
+		now = time.time()
+		registry.observe("http_request_phase_seconds", (("endpoint", self.endpoint), ("phase", name)),
+						now - self.phase_start)
+		self.phase_start = now
+		return
+
+	def finish(self, status):
+		registry.inc("http_requests_in_flight", (), -1)
+		registry.inc("http_requests_total", (("endpoint", self.endpoint), ("code", str(status))))
+		registry.observe("http_request_duration_seconds", (("endpoint", self.endpoint),),
+						time.time() - self.start)
+		return
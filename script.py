@@ -0,0 +1,406 @@
+# script.py
+# Classify output scripts and derive Bitcoin addresses
+
+# https://en.bitcoin.it/wiki/Script
+# https://en.bitcoin.it/wiki/Base58Check_encoding
+# https://github.com/bitcoin/bips/blob/master/bip-0173.mediawiki
+
+import struct
+import binascii
+import hashlib
+
+
+# script types
+p2pk_type = "p2pk"
+p2pkh_type = "p2pkh"
+p2sh_type = "p2sh"
+p2wpkh_type = "p2wpkh"
+p2wsh_type = "p2wsh"
+multisig_type = "multisig"
+op_return_type = "op_return"
+nonstandard_type = "nonstandard"
+
+# opcodes used by the standard script templates
+OP_0 = 0x00
+OP_PUSHDATA1 = 0x4c
+OP_PUSHDATA2 = 0x4d
+OP_PUSHDATA4 = 0x4e
+OP_1 = 0x51
+OP_16 = 0x60
+OP_RETURN = 0x6a
+OP_DUP = 0x76
+OP_EQUAL = 0x87
+OP_EQUALVERIFY = 0x88
+OP_HASH160 = 0xa9
+OP_CHECKSIG = 0xac
+OP_CHECKMULTISIG = 0xae
+
+# mainnet address version bytes
+p2pkh_version = 0x00
+p2sh_version = 0x05
+
+# mainnet bech32 human readable part
+bech32_hrp = "bc"
+
+base58_alphabet = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+bech32_alphabet = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+
+
+# RIPEMD-160 round constants for the pure Python fallback
+# https://homes.esat.kuleuven.be/~bosselae/ripemd160.html
+ripemd_ml = [
+	0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15,
+	7, 4, 13, 1, 10, 6, 15, 3, 12, 0, 9, 5, 2, 14, 11, 8,
+	3, 10, 14, 4, 9, 15, 8, 1, 2, 7, 0, 6, 13, 11, 5, 12,
+	1, 9, 11, 10, 0, 8, 12, 4, 13, 3, 7, 15, 14, 5, 6, 2,
+	4, 0, 5, 9, 7, 12, 2, 10, 14, 1, 3, 8, 11, 6, 15, 13]
+ripemd_mr = [
+	5, 14, 7, 0, 9, 2, 11, 4, 13, 6, 15, 8, 1, 10, 3, 12,
+	6, 11, 3, 7, 0, 13, 5, 10, 14, 15, 8, 12, 4, 9, 1, 2,
+	15, 5, 1, 3, 7, 14, 6, 9, 11, 8, 12, 2, 10, 0, 4, 13,
+	8, 6, 4, 1, 3, 11, 15, 0, 5, 12, 2, 13, 9, 7, 10, 14,
+	12, 15, 10, 4, 1, 5, 8, 7, 6, 2, 13, 14, 0, 3, 9, 11]
+ripemd_rl = [
+	11, 14, 15, 12, 5, 8, 7, 9, 11, 13, 14, 15, 6, 7, 9, 8,
+	7, 6, 8, 13, 11, 9, 7, 15, 7, 12, 15, 9, 11, 7, 13, 12,
+	11, 13, 6, 7, 14, 9, 13, 15, 14, 8, 13, 6, 5, 12, 7, 5,
+	11, 12, 14, 15, 14, 15, 9, 8, 9, 14, 5, 6, 8, 6, 5, 12,
+	9, 15, 5, 11, 6, 8, 13, 12, 5, 12, 13, 14, 11, 8, 5, 6]
+ripemd_rr = [
+	8, 9, 9, 11, 13, 15, 15, 5, 7, 7, 8, 11, 14, 14, 12, 6,
+	9, 13, 15, 7, 12, 8, 9, 11, 7, 7, 12, 7, 6, 15, 13, 11,
+	9, 7, 15, 11, 8, 6, 6, 14, 12, 13, 5, 14, 13, 13, 7, 5,
+	15, 5, 8, 11, 14, 14, 6, 14, 6, 9, 12, 9, 12, 5, 15, 8,
+	8, 5, 12, 9, 12, 5, 14, 6, 8, 13, 6, 5, 15, 13, 11, 11]
+ripemd_kl = [0x00000000, 0x5a827999, 0x6ed9eba1, 0x8f1bbcdc, 0xa953fd4e]
+ripemd_kr = [0x50a28be6, 0x5c4dd124, 0x6d703ef3, 0x7a6d76e9, 0x00000000]
+
+
+def ripemd_f(x, y, z, i):
+	# nonlinear function of each round
+	if i == 0:
+		return x ^ y ^ z
+	elif i == 1:
+		return (x & y) | (~x & z)
+	elif i == 2:
+		return (x | ~y) ^ z
+	elif i == 3:
+		return (x & z) | (y & ~z)
+	else:
+		return x ^ (y | ~z)
+
+
+def ripemd_rol(x, i):
+	# rotate 32 bit word left
+	return ((x << i) | ((x & 0xffffffff) >> (32 - i))) & 0xffffffff
+
+
+def ripemd_compress(state, chunk):
+	# process one 64 byte chunk
+	x = struct.unpack("<16I", chunk)
+	h0, h1, h2, h3, h4 = state
+	al, bl, cl, dl, el = state
+	ar, br, cr, dr, er = state
+
+	for j in range(0, 80):
+		rnd = j >> 4
+		al = ripemd_rol(al + ripemd_f(bl, cl, dl, rnd) + x[ripemd_ml[j]] + ripemd_kl[rnd], ripemd_rl[j]) + el
+		al, bl, cl, dl, el = el, al, bl, ripemd_rol(cl, 10), dl
+		ar = ripemd_rol(ar + ripemd_f(br, cr, dr, 4 - rnd) + x[ripemd_mr[j]] + ripemd_kr[rnd], ripemd_rr[j]) + er
+		ar, br, cr, dr, er = er, ar, br, ripemd_rol(cr, 10), dr
+
+	return ((h1 + cl + dr) & 0xffffffff, (h2 + dl + er) & 0xffffffff, (h3 + el + ar) & 0xffffffff,
+			(h4 + al + br) & 0xffffffff, (h0 + bl + cr) & 0xffffffff)
+
+
+def ripemd160(data):
+	# prefer the OpenSSL implementation when it is available
+	try:
+		return hashlib.new("ripemd160", data).digest()
+	except ValueError:
+		pass
+
+	state = (0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476, 0xc3d2e1f0)
+
+	# full chunks of the message
+	full = len(data) - (len(data) % 64)
+	for i in range(0, full, 64):
+		state = ripemd_compress(state, data[i: i + 64])
+
+	# pad the last chunk with 0x80, zeros and the bit length
+	tail = data[full:] + b"\x80" + b"\x00" * ((119 - len(data)) % 64) + struct.pack("<Q", 8 * len(data))
+	for i in range(0, len(tail), 64):
+		state = ripemd_compress(state, tail[i: i + 64])
+
+	return struct.pack("<5I", *state)
+
+
+def hash160(data):
+	# RIPEMD160(SHA256(data))
+	return ripemd160(hashlib.sha256(data).digest())
+
+
+def double_sha256(data):
+	# SHA256(SHA256(data))
+	return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def base58check_encode(version, payload):
+	# version byte | payload | first 4 bytes of checksum
+	data = struct.pack("<B", version) + payload
+	data += double_sha256(data)[:4]
+
+	# big integer in base 58
+	num = int(binascii.hexlify(data), 16)
+	encoded = ""
+	while num > 0:
+		num, rem = divmod(num, 58)
+		encoded = base58_alphabet[rem] + encoded
+
+	# each leading zero byte is encoded as '1'
+	for byte in bytearray(data):
+		if byte != 0:
+			break
+		encoded = "1" + encoded
+
+	return encoded
+
+
+def base58check_decode(address):
+	# return version byte and payload, or -1 and "" if malformed
+	num = 0
+	for char in address:
+		if char not in base58_alphabet:
+			return -1, b""
+		num = num * 58 + base58_alphabet.index(char)
+
+	# leading '1' characters are zero bytes
+	num_zeros = len(address) - len(address.lstrip("1"))
+	hex_string = "%x" % num if num > 0 else ""
+	if len(hex_string) % 2 == 1:
+		hex_string = "0" + hex_string
+	data = b"\x00" * num_zeros + binascii.unhexlify(hex_string)
+
+	# version byte, payload and 4 byte checksum
+	if len(data) < 5:
+		return -1, b""
+	if double_sha256(data[:-4])[:4] != data[-4:]:
+		return -1, b""
+
+	return bytearray(data[:1])[0], data[1:-4]
+
+
+def bech32_polymod(values):
+	# BCH checksum of bech32
+	generator = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+	chk = 1
+	for value in values:
+		top = chk >> 25
+		chk = (chk & 0x1ffffff) << 5 ^ value
+		for i in range(0, 5):
+			chk ^= generator[i] if ((top >> i) & 1) else 0
+
+	return chk
+
+
+def bech32_hrp_expand(hrp):
+	return [ord(x) >> 5 for x in hrp] + [0] + [ord(x) & 31 for x in hrp]
+
+
+def convert_bits(data, from_bits, to_bits, pad):
+	# regroup a list of from_bits integers into to_bits integers
+	acc = 0
+	bits = 0
+	result = []
+	maxv = (1 << to_bits) - 1
+	for value in data:
+		if value < 0 or (value >> from_bits):
+			return None
+		acc = (acc << from_bits) | value
+		bits += from_bits
+		while bits >= to_bits:
+			bits -= to_bits
+			result.append((acc >> bits) & maxv)
+
+	if pad:
+		if bits:
+			result.append((acc << (to_bits - bits)) & maxv)
+	elif bits >= from_bits or ((acc << (to_bits - bits)) & maxv):
+		return None
+
+	return result
+
+
+def segwit_encode(witness_version, program):
+	# bech32 address of a witness program
+	data = [witness_version] + convert_bits(bytearray(program), 8, 5, True)
+	values = bech32_hrp_expand(bech32_hrp) + data
+	polymod = bech32_polymod(values + [0, 0, 0, 0, 0, 0]) ^ 1
+	checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(0, 6)]
+
+	return bech32_hrp + "1" + "".join([bech32_alphabet[d] for d in data + checksum])
+
+
+def segwit_decode(address):
+	# return witness version and program, or -1 and "" if malformed
+	if address.lower() != address and address.upper() != address:
+		return -1, b""
+	address = address.lower()
+
+	pos = address.rfind("1")
+	if address[:pos] != bech32_hrp or pos + 7 > len(address) or len(address) > 90:
+		return -1, b""
+
+	data = []
+	for char in address[pos + 1:]:
+		if char not in bech32_alphabet:
+			return -1, b""
+		data.append(bech32_alphabet.index(char))
+
+	# verify checksum of bech32 (witness version 0)
+	if bech32_polymod(bech32_hrp_expand(bech32_hrp) + data) != 1:
+		return -1, b""
+
+	program = convert_bits(data[1:-6], 5, 8, False)
+	if program is None or data[0] != 0 or len(program) not in (20, 32):
+		return -1, b""
+
+	return data[0], bytes(bytearray(program))
+
+
+def parse_pushes(script):
+	# split script into (opcode, pushed data) pairs, or None if malformed
+	ops = []
+	nth_byte = 0
+	while nth_byte < len(script):
+		opcode = script[nth_byte]
+		nth_byte += 1
+
+		# direct push of 1 to 75 bytes
+		if 0 < opcode < OP_PUSHDATA1:
+			size = opcode
+		elif opcode == OP_PUSHDATA1:
+			if nth_byte + 1 > len(script):
+				return None
+			size = script[nth_byte]
+			nth_byte += 1
+		elif opcode == OP_PUSHDATA2:
+			if nth_byte + 2 > len(script):
+				return None
+			size = struct.unpack("<H", bytes(script[nth_byte: nth_byte + 2]))[0]
+			nth_byte += 2
+		elif opcode == OP_PUSHDATA4:
+			if nth_byte + 4 > len(script):
+				return None
+			size = struct.unpack("<I", bytes(script[nth_byte: nth_byte + 4]))[0]
+			nth_byte += 4
+		else:
+			ops.append((opcode, None))
+			continue
+
+		if nth_byte + size > len(script):
+			return None
+		ops.append((opcode, bytes(script[nth_byte: nth_byte + size])))
+		nth_byte += size
+
+	return ops
+
+
+def is_pubkey(data):
+	# compressed or uncompressed public key
+	if data is None:
+		return False
+	if len(data) == 33 and bytearray(data)[0] in (0x02, 0x03):
+		return True
+	if len(data) == 65 and bytearray(data)[0] == 0x04:
+		return True
+
+	return False
+
+
+def classify_script(script_hex):
+	# classify output script (hex in raw byte order) and derive its address
+	# return script type and address ("" if the script has no address)
+	script = bytearray(binascii.unhexlify(script_hex))
+
+	# P2PKH: OP_DUP OP_HASH160 <20 bytes> OP_EQUALVERIFY OP_CHECKSIG
+	if (len(script) == 25 and script[0] == OP_DUP and script[1] == OP_HASH160 and
+		script[2] == 20 and script[23] == OP_EQUALVERIFY and script[24] == OP_CHECKSIG):
+		return p2pkh_type, base58check_encode(p2pkh_version, bytes(script[3:23]))
+
+	# P2SH: OP_HASH160 <20 bytes> OP_EQUAL
+	if len(script) == 23 and script[0] == OP_HASH160 and script[1] == 20 and script[22] == OP_EQUAL:
+		return p2sh_type, base58check_encode(p2sh_version, bytes(script[2:22]))
+
+	# P2WPKH: OP_0 <20 bytes>
+	if len(script) == 22 and script[0] == OP_0 and script[1] == 20:
+		return p2wpkh_type, segwit_encode(0, bytes(script[2:22]))
+
+	# P2WSH: OP_0 <32 bytes>
+	if len(script) == 34 and script[0] == OP_0 and script[1] == 32:
+		return p2wsh_type, segwit_encode(0, bytes(script[2:34]))
+
+	# OP_RETURN <data>
+	if len(script) > 0 and script[0] == OP_RETURN:
+		return op_return_type, ""
+
+	ops = parse_pushes(script)
+	if ops is None:
+		return nonstandard_type, ""
+
+	# P2PK: <pubkey> OP_CHECKSIG, addressed by the hash of its public key
+	if len(ops) == 2 and is_pubkey(ops[0][1]) and ops[1][0] == OP_CHECKSIG:
+		return p2pk_type, base58check_encode(p2pkh_version, hash160(ops[0][1]))
+
+	# bare multisig: OP_m <pubkey>... OP_n OP_CHECKMULTISIG
+	if (len(ops) >= 4 and ops[-1][0] == OP_CHECKMULTISIG and
+		OP_1 <= ops[0][0] <= OP_16 and OP_1 <= ops[-2][0] <= OP_16):
+		required = ops[0][0] - OP_1 + 1
+		total = ops[-2][0] - OP_1 + 1
+		pubkeys = ops[1:-2]
+		if (len(pubkeys) == total and required <= total and
+			all([is_pubkey(data) for opcode, data in pubkeys])):
+			return multisig_type, ""
+
+	return nonstandard_type, ""
+
+
+def address_to_script(address):
+	# output script (hex in raw byte order) paying to address, "" if invalid
+	if address.lower().startswith(bech32_hrp + "1"):
+		witness_version, program = segwit_decode(address)
+		if witness_version == -1:
+			return ""
+
+		# OP_0 <program>
+		return binascii.hexlify(b"\x00" + struct.pack("<B", len(program)) + program).decode("ascii")
+
+	version, payload = base58check_decode(address)
+	if len(payload) != 20:
+		return ""
+
+	if version == p2pkh_version:
+		return binascii.hexlify(b"\x76\xa9\x14" + payload + b"\x88\xac").decode("ascii")
+	elif version == p2sh_version:
+		return binascii.hexlify(b"\xa9\x14" + payload + b"\x87").decode("ascii")
+
+	return ""
+
+
+def get_script_hash(script_hex):
+	# SHA256 of the output script used as address index key
+	return hashlib.sha256(binascii.unhexlify(script_hex)).digest()
+
+
+def get_index_key(script_hex):
+	# outputs to the same address share one key, so P2PK outputs are
+	# indexed under the P2PKH script of their derived address
+	script = binascii.unhexlify(script_hex)
+	data = bytearray(script)
+
+	# P2PK: <33 or 65 byte pubkey> OP_CHECKSIG
+	if (len(data) in (35, 67) and data[0] == len(data) - 2 and data[-1] == OP_CHECKSIG and
+		is_pubkey(script[1:-1])):
+		script = b"\x76\xa9\x14" + hash160(script[1:-1]) + b"\x88\xac"
+
+	return hashlib.sha256(script).digest()
@@ -12,11 +12,26 @@ import json
 import time
 import socket
 import threading
-from SocketServer import ThreadingMixIn
-from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
-from urlparse import urlparse
+import argparse
+import metrics
+import loadstats
+import admission
+import encoding
+import export
+import fragments
+import diskindex
+import warmup
+import tipwait
+import codec
 import blockchain
 
+try:
+	from BaseHTTPServer import BaseHTTPRequestHandler
+	from urlparse import urlparse
+except ImportError:
+	from http.server import BaseHTTPRequestHandler
+	from urllib.parse import urlparse
+
 
 # sample http GET url for blockchain query request
 # http://127.0.0.1:9000/blockheight?000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f
@@ -41,19 +56,231 @@ transactioninfo_endpoint = "/transactioninfo"
 transactioninputs_endpoint = "/transactioninputs"
 # API endpoint to get output transactions of the transaction
 transactionoutputs_endpoint = "/transactionoutputs"
+# API endpoint to get the transaction at a position of the block
+tx_endpoint = "/tx"
+# API endpoint to get consecutive transactions of the block
+txrange_endpoint = "/txrange"
+# API endpoint to get main chain outputs paying to the address
+address_endpoint = "/address"
+# API endpoint to get statistics of a main chain height range
+stats_endpoint = "/stats"
+# API endpoint to get value and count totals of a main chain height range
+aggregate_endpoint = "/aggregate"
+# API endpoint to get main chain blocks mined in a time range
+blocksbetween_endpoint = "/blocksbetween"
+# API endpoint to get merkle inclusion proof of the transaction
+txproof_endpoint = "/txproof"
+# API endpoint to get merkle inclusion proofs of several transactions
+txproofs_endpoint = "/txproofs"
+# API endpoint to stream main chain blocks, transactions, inputs and outputs as NDJSON
+export_endpoint = "/export"
+
+# API endpoint to get request and index metrics in Prometheus text format
+metrics_endpoint = "/metrics"
+# API endpoint to get progress of loading blockchain files
+loadprogress_endpoint = "/loadprogress"
+# API endpoint to wait for a latest block other than the known one
+waittip_endpoint = "/waittip"
+# API endpoint to stream every new latest block as Server-Sent Events
+tipevents_endpoint = "/tipevents"
+
+# maximum number of transactions proven by one request
+max_batch_proofs = 1000
+
+# maximum number of transactions of one range request
+max_range_txs = 1000
+
+# endpoints answered from a single lookup, served in the priority lane so health
+# probes and header lookups are not queued behind heavy requests
+cheap_endpoints = {
+					blockheight_endpoint, mainchain_endpoint,
+					blockheader_endpoint, latestblock_endpoint,
+					latestheight_endpoint, aggregate_endpoint,
+					metrics_endpoint, loadprogress_endpoint,
+					waittip_endpoint, tipevents_endpoint
+				}
+
+# seconds a client may take to send its request before its worker is released
+request_timeout = 5
+
+# endpoints whose first parameter is a block hash or a tx hash, recorded to warm caches after a restart
+block_hash_endpoints = {
+						blockheight_endpoint, mainchain_endpoint,
+						blockheader_endpoint, blocktransactions_endpoint,
+						tx_endpoint, txrange_endpoint
+					}
+tx_hash_endpoints = {
+						transactioninfo_endpoint, transactioninputs_endpoint,
+						transactionoutputs_endpoint, txproof_endpoint
+					}
+
+# counts requested hashes when --warmup-file is given, None otherwise
+recorder = None
+
+# long-poll requests and event streams parked until a new latest block is published
+tip_waiters = tipwait.TipWaiters()
 
 API_endpoints = {
 					blockheight_endpoint, mainchain_endpoint,
 					blockheader_endpoint, latestblock_endpoint,
 					latestheight_endpoint, blocktransactions_endpoint,
 					transactioninfo_endpoint, transactioninputs_endpoint,
-					transactionoutputs_endpoint
+					transactionoutputs_endpoint, tx_endpoint,
+					txrange_endpoint, address_endpoint,
+					stats_endpoint, aggregate_endpoint, blocksbetween_endpoint,
+					txproof_endpoint, txproofs_endpoint,
+					export_endpoint,
+					metrics_endpoint, loadprogress_endpoint,
+					waittip_endpoint, tipevents_endpoint
 				}
 
 
+def get_index_sizes():
+	# number of entries in each blockchain index
+	gen = blockchain.current
+	return [((("index", "blocks"),), gen.block_count),
+			((("index", "main_chain"),), len(gen.main_chain_blocks)),
+			((("index", "stale_blocks"),), gen.block_count - len(gen.main_chain_blocks)),
+			((("index", "txids"),), len(gen.tx_index) + len(gen.txid_locations)),
+			((("index", "address_scripts"),), len(gen.address_index))]
+
+
+metrics.registry.register_gauge("index_entries", "Number of entries in each blockchain index", get_index_sizes)
+metrics.registry.register_gauge("tip_waiters", "Number of connections parked until a new latest block",
+								tip_waiters.get_counts)
+
+
+def get_block_header_result(block_hash_big, use_fragments):
+	# header JSON rendered by an earlier request
+	result = fragments.get_header(block_hash_big) if use_fragments else None
+	if result is not None:
+		return result
+
+	# get block header fields
+	ver_num, prev_hash, merk_hash, start_time, nBits, nonce = \
+		blockchain.get_block_header(block_hash_big)
+
+	# check if block hash is invalid
+	if ver_num == -1:
+		return {"error": "Invalid Block Hash"}
+
+	result = {"version": ver_num, "prev_block": prev_hash,
+				"mrkl_root": merk_hash, "time": start_time, 
+				"bits": nBits, "nonce": nonce}
+
+	# render once for every later JSON request of the header
+	if use_fragments:
+		result = fragments.put_header(block_hash_big, result)
+
+	return result
+
+
+def get_transaction_info_result(tx_hash_big, use_fragments):
+	# summary JSON rendered by an earlier request against the same generation
+	result = fragments.get_transaction(tx_hash_big) if use_fragments else None
+	if result is not None:
+		return result
+
+	# generation the summary is at least as new as
+	gen = blockchain.current
+
+	# get transaction info
+	block_hash, ver, input_count, output_count, btc_amount, locktime, input_btc, fee, fee_rate, \
+		alternate_blocks = blockchain.get_transaction_info(tx_hash_big)
+
+	# check if tx hash is invalid
+	if ver == -1:
+		return {"error": "Invalid Transaction Hash"}
+
+	result = {"block_hash": block_hash, "version": ver,
+				"input_tx_count": input_count,
+				"output_tx_count": output_count,
+				"value": btc_amount, "lock_time": locktime,
+				"input_value": input_btc, "fee": fee,
+				"fee_rate": fee_rate, "alternate_blocks": alternate_blocks}
+
+	# render once for every later JSON request until the next update
+	if use_fragments:
+		result = fragments.put_transaction(tx_hash_big, gen, result)
+
+	return result
+
+
+def warm_block(block_hash_big):
+	# pre-render header and decode transactions of a block hot before restart
+	get_block_header_result(block_hash_big, fragments.is_enabled())
+	blockchain.get_block_transactions(block_hash_big)
+	return
+
+
+def warm_transaction(tx_hash_big):
+	# pre-render summary of a transaction hot before restart, reading its block and index pages
+	get_transaction_info_result(tx_hash_big, fragments.is_enabled())
+	return
+
+
+def run_warmup(interval):
+	# replay hashes hot before restart, then keep saving the hot hashes of this run
+	warmup.replay(recorder.path, warm_block, warm_transaction)
+	recorder.run(interval)
+	return
+
+
+def format_transaction(tx_hash, position, summary, input_transactions, output_transactions):
+	# full details of a transaction of the block, same fields as the transaction endpoints
+	block_hash, ver, input_count, output_count, btc_amount, locktime, input_btc, fee, fee_rate = summary
+
+	input_txs = []
+	# traverse all input transactions
+	for i in range(0, len(input_transactions)):
+		prev_txid, script, seq = input_transactions[i]
+		input_txs += [{"prev_hash": prev_txid, "sig_script": script, "seq_num": seq}]
+
+	output_txs = []
+	# traverse all output transactions
+	for i in range(0, len(output_transactions)):
+		satoshi, script, script_type, address = output_transactions[i]
+		output_txs += [{"value": satoshi, "sig_script": script, "type": script_type, "address": address}]
+
+	return {"tx_hash": tx_hash, "position": position, "block_hash": block_hash, "version": ver,
+			"input_tx_count": input_count, "output_tx_count": output_count,
+			"value": btc_amount, "lock_time": locktime,
+			"input_value": input_btc, "fee": fee, "fee_rate": fee_rate,
+			"input_transactions": input_txs, "output_transactions": output_txs}
+
+
+def get_lane(path):
+	# cost class of the endpoint, unknown paths only cost a 404
+	if path in cheap_endpoints or path not in API_endpoints:
+		return admission.cheap_lane
+
+	return admission.heavy_lane
+
+
 class Handler(BaseHTTPRequestHandler):
+	# headers and body are separate small writes, do not let them wait on delayed acks
+	disable_nagle_algorithm = True
+	# release worker of a slow or silent client, connections are closed after each response
+	timeout = request_timeout
+
 	# handle http GET requests
 	def do_GET(self):
+		# time request and its phases
+		self.timer = metrics.RequestTimer()
+		# status code sent to client
+		self.status_code = 0
+
+		try:
+			self.handle_GET()
+		finally:
+			self.timer.finish(self.status_code)
+
+	def send_response(self, code, message=None):
+		# record status code of every response including errors
+		self.status_code = code
+		BaseHTTPRequestHandler.send_response(self, code, message)
+
+	def handle_GET(self):
 		print("GET: " + self.path)
 
 		# parse url path
@@ -65,6 +292,18 @@ class Handler(BaseHTTPRequestHandler):
 			self.send_error(404)
 			return
 
+		self.timer.endpoint = endpoint
+
+		# a worker of the cheap lane never runs a heavy request, whatever its connection was classified as
+		if not self.server.admits(endpoint):
+			metrics.registry.inc("http_requests_rejected_total",
+								(("lane", admission.cheap_lane), ("reason", "wrong_lane")))
+			self.send_response(503)
+			self.send_header("Retry-After", str(admission.retry_after))
+			self.send_header("Content-Length", "0")
+			self.end_headers()
+			return
+
 		# parse query
 		hash_big_endian = parsed_path.query
 
@@ -75,7 +314,8 @@ class Handler(BaseHTTPRequestHandler):
 			endpoint == blocktransactions_endpoint or
 			endpoint == transactioninfo_endpoint or
 			endpoint == transactioninputs_endpoint or
-			endpoint == transactionoutputs_endpoint):
+			endpoint == transactionoutputs_endpoint or
+			endpoint == txproof_endpoint):
 
 			# check if string length is 64
 			if len(hash_big_endian) != 64:
@@ -89,12 +329,123 @@ class Handler(BaseHTTPRequestHandler):
 				self.send_error(400)
 				return
 
+		elif endpoint == tx_endpoint or endpoint == txrange_endpoint:
+			# block hash and position, or block hash, first position and number of transactions
+			params = hash_big_endian.split("&")
+
+			# check if parameters have proper format
+			if (len(params) != (2 if endpoint == tx_endpoint else 3) or len(params[0]) != 64 or
+				not all([param.isdigit() for param in params[1:]])):
+				self.send_error(400)
+				return
+
+			# check if it is proper hex string
+			try:
+				int(params[0], 16)
+			except ValueError:
+				self.send_error(400)
+				return
+
+			# check if number of transactions is bounded
+			if endpoint == txrange_endpoint and int(params[2]) > max_range_txs:
+				self.send_error(400)
+				return
+
+		elif endpoint == address_endpoint:
+			# address and optional page number
+			params = hash_big_endian.split("&")
+
+			# check if parameters have proper format
+			if (len(params) > 2 or params[0] == "" or not params[0].isalnum() or
+				(len(params) == 2 and not params[1].isdigit())):
+				self.send_error(400)
+				return
+
+		elif endpoint == stats_endpoint or endpoint == aggregate_endpoint:
+			# first and last block height
+			params = hash_big_endian.split("&")
+
+			# check if parameters have proper format
+			if len(params) != 2 or not params[0].isdigit() or not params[1].isdigit():
+				self.send_error(400)
+				return
+
+		elif endpoint == blocksbetween_endpoint:
+			# first and last Unix epoch time and optional page number
+			params = hash_big_endian.split("&")
+
+			# check if parameters have proper format
+			if (len(params) < 2 or len(params) > 3 or
+				not all([param.isdigit() for param in params])):
+				self.send_error(400)
+				return
+
+		elif endpoint == export_endpoint:
+			# first and optional last block height
+			params = hash_big_endian.split("&")
+
+			# check if parameters have proper format
+			if len(params) > 2 or not all([param.isdigit() for param in params]):
+				self.send_error(400)
+				return
+
+		elif endpoint == waittip_endpoint:
+			# latest block hash the client knows and optional seconds to wait
+			params = hash_big_endian.split("&")
+
+			# check if parameters have proper format
+			if (len(params) > 2 or len(params[0]) != 64 or
+				(len(params) == 2 and not params[1].isdigit())):
+				self.send_error(400)
+				return
+
+			# check if it is proper hex string
+			try:
+				int(params[0], 16)
+			except ValueError:
+				self.send_error(400)
+				return
+
+		elif endpoint == txproofs_endpoint:
+			# list of transaction hashes
+			params = hash_big_endian.split("&")
+
+			# check if number of hashes is bounded
+			if len(params) > max_batch_proofs:
+				self.send_error(400)
+				return
+
+			# check if every hash has proper format
+			for param in params:
+				if len(param) != 64:
+					self.send_error(400)
+					return
+
+				try:
+					int(param, 16)
+				except ValueError:
+					self.send_error(400)
+					return
+
 		else:
 			# other endpoints do not have parameter
 			if hash_big_endian != "":
 				self.send_error(400)
 				return
 
+		# remember hot hashes to replay after a restart
+		if recorder is not None:
+			if endpoint in block_hash_endpoints:
+				recorder.record_block(hash_big_endian.split("&")[0])
+			elif endpoint in tx_hash_endpoints:
+				recorder.record_transaction(hash_big_endian)
+
+		# format of the response the client accepts
+		response_format = encoding.choose_format(self.headers.get("Accept"))
+		# pre-rendered JSON can only answer JSON clients
+		use_fragments = response_format == encoding.json_format and fragments.is_enabled()
+
+		self.timer.phase("parse")
 
 		if endpoint == blockheight_endpoint:
 			# get block height
@@ -102,40 +453,30 @@ class Handler(BaseHTTPRequestHandler):
 
 			# check if block hash is invalid
 			if blockheight == -1:
-				message = json.dumps({"error": "Invalid Block Hash"})
+				result = {"error": "Invalid Block Hash"}
 			else:
-				message = json.dumps({"height": blockheight})
+				result = {"height": blockheight}
 
 		elif endpoint == mainchain_endpoint:
 			# check if block is in main chain (longest blockchain)
 			mainchain = blockchain.get_main_chain(hash_big_endian)
 
-			message = json.dumps({"main_chain": mainchain})
+			result = {"main_chain": mainchain}
 
 		elif endpoint == blockheader_endpoint:
-			# get block header fields
-			ver_num, prev_hash, merk_hash, start_time, nBits, nonce = \
-				blockchain.get_block_header(hash_big_endian)
-
-			# check if block hash is invalid
-			if ver_num == -1:
-				message = json.dumps({"error": "Invalid Block Hash"})
-			else:
-				message = json.dumps({"version": ver_num, "prev_block": prev_hash,
-									"mrkl_root": merk_hash, "time": start_time, 
-									"bits": nBits, "nonce": nonce})
+			result = get_block_header_result(hash_big_endian, use_fragments)
 
 		elif endpoint == latestblock_endpoint:
 			# get the latest block of main chain
 			latestblock = blockchain.get_latest_block()
 
-			message = json.dumps({"hash": latestblock})
+			result = {"hash": latestblock}
 
 		elif endpoint == latestheight_endpoint:
 			# get the latest block height of main chain
 			latestheight = blockchain.get_latest_height()
 
-			message = json.dumps({"height": latestheight})
+			result = {"height": latestheight}
 
 		elif endpoint == blocktransactions_endpoint:
 			# get block transactions
@@ -143,7 +484,7 @@ class Handler(BaseHTTPRequestHandler):
 
 			# check if block hash is invalid
 			if count == -1:
-				message = json.dumps({"error": "Invalid Block Hash"})
+				result = {"error": "Invalid Block Hash"}
 			else:
 				txs = []
 				# traverse all transactions
@@ -151,21 +492,10 @@ class Handler(BaseHTTPRequestHandler):
 					txid, btc_amount = transactions[i]
 					txs += [{"tx_hash": txid, "value": btc_amount}]
 
-				message = json.dumps({"tx_count": count, "transactions": txs})
+				result = {"tx_count": count, "transactions": txs}
 
 		elif endpoint == transactioninfo_endpoint:
-			# get transaction info
-			block_hash, ver, input_count, output_count, btc_amount, locktime  = \
-				blockchain.get_transaction_info(hash_big_endian)
-
-			# check if tx hash is invalid
-			if ver == -1:
-				message = json.dumps({"error": "Invalid Transaction Hash"})
-			else:
-				message = json.dumps({"block_hash": block_hash, "version": ver,
-									"input_tx_count": input_count,
-									"output_tx_count": output_count,
-									"value": btc_amount, "lock_time": locktime})
+			result = get_transaction_info_result(hash_big_endian, use_fragments)
 
 		elif endpoint == transactioninputs_endpoint:
 			# get input transactions
@@ -173,7 +503,7 @@ class Handler(BaseHTTPRequestHandler):
 
 			# check if tx hash is invalid
 			if count == -1:
-				message = json.dumps({"error": "Invalid Transaction Hash"})
+				result = {"error": "Invalid Transaction Hash"}
 			else:
 				input_txs = []
 				# traverse all input transactions
@@ -181,7 +511,7 @@ class Handler(BaseHTTPRequestHandler):
 					prev_txid, script, seq = input_transactions[i]
 					input_txs += [{"prev_hash": prev_txid, "sig_script": script, "seq_num": seq}]
 
-				message = json.dumps({"input_tx_count": count, "input_transactions": input_txs})
+				result = {"input_tx_count": count, "input_transactions": input_txs}
 
 		elif endpoint == transactionoutputs_endpoint:
 			# get output transactions
@@ -189,37 +519,320 @@ class Handler(BaseHTTPRequestHandler):
 
 			# check if tx hash is invalid
 			if count == -1:
-				message = json.dumps({"error": "Invalid Transaction Hash"})
+				result = {"error": "Invalid Transaction Hash"}
 			else:
 				output_txs = []
 				# traverse all input transactions
 				for i in range(0, count):
-					satoshi, script = output_transactions[i]
-					output_txs += [{"value": satoshi, "sig_script": script}]
+					satoshi, script, script_type, address = output_transactions[i]
+					output_txs += [{"value": satoshi, "sig_script": script,
+									"type": script_type, "address": address}]
+
+				result = {"output_tx_count": count, "output_transactions": output_txs}
+
+		elif endpoint == tx_endpoint:
+			position = int(params[1])
 
-				message = json.dumps({"output_tx_count": count, "output_transactions": output_txs})
+			# get transaction at the position of the block
+			count, transactions = blockchain.get_block_transaction_range(params[0], position, 1)
+
+			# check if block hash or position is invalid
+			if count == -1:
+				result = {"error": "Invalid Block Hash"}
+			elif len(transactions) == 0:
+				result = {"error": "Invalid Transaction Position"}
+			else:
+				result = format_transaction(*transactions[0])
+
+		elif endpoint == txrange_endpoint:
+			start = int(params[1])
+
+			# get consecutive transactions of the block
+			count, transactions = blockchain.get_block_transaction_range(params[0], start, int(params[2]))
+
+			# check if block hash is invalid
+			if count == -1:
+				result = {"error": "Invalid Block Hash"}
+			else:
+				txs = []
+				# traverse transactions of the range
+				for i in range(0, len(transactions)):
+					txs += [format_transaction(*transactions[i])]
+
+				result = {"block_hash": params[0], "tx_count": count, "start": start, "transactions": txs}
+
+		elif endpoint == address_endpoint:
+			address = params[0]
+			page = int(params[1]) if len(params) == 2 else 0
+
+			# get outputs paying to the address
+			count, outputs = blockchain.get_address_outputs(address, page)
+
+			# check if address index is built and address is valid
+			if not blockchain.has_address_index():
+				result = {"error": "Address Index Not Built"}
+			elif count == -1:
+				result = {"error": "Invalid Address"}
+			else:
+				output_txs = []
+				# traverse outputs of the page
+				for i in range(0, len(outputs)):
+					height, block_hash, tx_hash, vout, btc_amount, script_type = outputs[i]
+					output_txs += [{"height": height, "block_hash": block_hash, "tx_hash": tx_hash,
+									"vout": vout, "value": btc_amount, "type": script_type}]
+
+				result = {"address": address, "output_count": count, "page": page,
+							"page_size": blockchain.address_page_size, "outputs": output_txs}
+
+		elif endpoint == stats_endpoint:
+			# get statistics of blocks between the two heights
+			stats = blockchain.get_range_stats(int(params[0]), int(params[1]))
+
+			# check if height range is invalid
+			if len(stats) == 0:
+				result = {"error": "Invalid Height Range"}
+			else:
+				result = stats
+
+		elif endpoint == aggregate_endpoint:
+			# get totals of blocks between the two heights from prefix sums
+			aggregates = blockchain.get_range_aggregates(int(params[0]), int(params[1]))
+
+			# check if height range is invalid
+			if len(aggregates) == 0:
+				result = {"error": "Invalid Height Range"}
+			else:
+				result = aggregates
+
+		elif endpoint == blocksbetween_endpoint:
+			page = int(params[2]) if len(params) == 3 else 0
+
+			# get blocks mined between the two times
+			count, blocks = blockchain.get_blocks_between(int(params[0]), int(params[1]), page)
+
+			parsed_blocks = []
+			# traverse blocks of the page
+			for i in range(0, len(blocks)):
+				height, block_hash = blocks[i]
+				parsed_blocks += [{"height": height, "hash": block_hash}]
+
+			result = {"block_count": count, "page": page,
+						"page_size": blockchain.blocks_page_size, "blocks": parsed_blocks}
+
+		elif endpoint == txproof_endpoint:
+			# get merkle inclusion proof
+			block_hash, merk_hash, position, branch = blockchain.get_transaction_proof(hash_big_endian)
+
+			# check if tx hash is invalid
+			if position == -1:
+				result = {"error": "Invalid Transaction Hash"}
+			else:
+				result = {"block_hash": block_hash, "mrkl_root": merk_hash,
+							"position": position, "branch": branch}
+
+		elif endpoint == txproofs_endpoint:
+			# get merkle inclusion proofs sharing tree levels of each block
+			proofs = blockchain.get_transaction_proofs(params)
+
+			parsed_proofs = []
+			# traverse all proofs
+			for i in range(0, len(proofs)):
+				tx_hash, block_hash, merk_hash, position, branch = proofs[i]
+
+				# check if tx hash is invalid
+				if position == -1:
+					parsed_proofs += [{"tx_hash": tx_hash, "error": "Invalid Transaction Hash"}]
+				else:
+					parsed_proofs += [{"tx_hash": tx_hash, "block_hash": block_hash, "mrkl_root": merk_hash,
+										"position": position, "branch": branch}]
+
+			result = {"proofs": parsed_proofs}
+
+		elif endpoint == export_endpoint:
+			# one generation for the whole stream, so updates during export do not tear it
+			gen = blockchain.current
+			start_height = int(params[0])
+			end_height = int(params[1]) if len(params) == 2 else gen.blockchain_height
+
+			# check if height range is in main chain
+			if start_height > end_height or start_height >= len(gen.main_chain_blocks):
+				result = {"error": "Invalid Height Range"}
+			else:
+				self.timer.phase("lookup")
+				self.stream_export(gen, start_height, end_height)
+				self.timer.phase("write")
+				return
+
+		elif endpoint == waittip_endpoint or endpoint == tipevents_endpoint:
+			# parked connections are bounded, so idle clients cannot exhaust file descriptors
+			if tip_waiters.is_full():
+				self.send_error(503)
+				return
+
+			if endpoint == tipevents_endpoint:
+				self.timer.phase("lookup")
+				self.stream_tip_events()
+				self.timer.phase("write")
+				return
+
+			# wait for a latest block other than the known one
+			timeout = min(int(params[1]), tipwait.max_timeout) if len(params) == 2 else tipwait.default_timeout
+			if timeout > 0 and tip_waiters.park(self.request, params[0], timeout, response_format):
+				# answered and closed by the waiter thread, this worker moves on to other connections
+				self.server.detach(self.request)
+				self.close_connection = True
+				self.status_code = 200
+				self.timer.phase("lookup")
+				return
+
+			# latest block already moved past the known one
+			result = tipwait.get_tip_result(blockchain.current, codec.reverse_hex(params[0].lower()))
+
+		elif endpoint == loadprogress_endpoint:
+			# get load phase, counts, rates and estimated time left
+			result = blockchain.get_load_progress()
+
+		elif endpoint == metrics_endpoint:
+			# render request and index metrics
+			result = metrics.registry.render()
 
 		else:
 			# should not get here
-			message = json.dumps({"error": "Invalid Request"})
+			result = {"error": "Invalid Request"}
+
+		self.timer.phase("lookup")
+
+		# encode response in the format and content coding the client accepts
+		if endpoint == metrics_endpoint:
+			content_type = metrics.content_type
+			message = result.encode('utf-8')
+		elif isinstance(result, fragments.Fragment):
+			# already JSON, only built for JSON clients
+			content_type = encoding.content_types[encoding.json_format]
+			message = result.body
+		else:
+			content_type, message = encoding.encode(result, response_format)
+
+		message, content_encoding = encoding.compress(message,
+								encoding.choose_encoding(self.headers.get("Accept-Encoding")))
+		metrics.registry.inc("http_response_bytes_total", (("encoding", content_encoding),), len(message))
+
+		self.timer.phase("encode")
 
 		self.send_response(200)
-		self.send_header("Content-Type", "text/plain; charset=utf-8")
+		self.send_header("Content-Type", content_type)
+		if content_encoding != encoding.identity_encoding:
+			self.send_header("Content-Encoding", content_encoding)
+		# caches must key responses on the negotiated headers
+		self.send_header("Vary", "Accept, Accept-Encoding")
+		# length lets clients find end of response without waiting for the close
+		self.send_header("Content-Length", str(len(message)))
 		self.end_headers()
 
-		self.wfile.write(message.encode('utf-8'))
-		self.wfile.write(b'\n')
+		self.wfile.write(message)
+
+		self.timer.phase("write")
+
+	def stream_export(self, gen, start_height, end_height):
+		# NDJSON written block by block as it is generated, memory does not grow with the range
+		chunked = self.protocol_version == "HTTP/1.1" and self.request_version == "HTTP/1.1"
+
+		self.send_response(200)
+		self.send_header("Content-Type", "application/x-ndjson")
+		if chunked:
+			self.send_header("Transfer-Encoding", "chunked")
+		else:
+			# end of body is marked by closing the connection
+			self.send_header("Connection", "close")
+		self.end_headers()
 
+		for chunk in export.iter_ndjson(gen, start_height, end_height):
+			if chunked:
+				chunk = ("%x\r\n" % len(chunk)).encode("ascii") + chunk + b"\r\n"
+			self.wfile.write(chunk)
+			metrics.registry.inc("http_response_bytes_total", (("encoding", encoding.identity_encoding),), len(chunk))
 
-class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
-	pass
+		# last chunk
+		if chunked:
+			self.wfile.write(b"0\r\n\r\n")
+
+	def stream_tip_events(self):
+		# event stream of every new latest block, written by the waiter thread from now on
+		self.send_response(200)
+		self.send_header("Content-Type", "text/event-stream")
+		self.send_header("Cache-Control", "no-cache")
+		# end of stream is marked by closing the connection
+		self.send_header("Connection", "close")
+		self.end_headers()
+		self.wfile.flush()
+
+		tip_waiters.subscribe(self.request)
+		self.server.detach(self.request)
+		return
+
+
+def create_server(address, cheap_workers=4, heavy_workers=8, queue_size=64, queue_timeout=2.0):
+	# bounded worker pool per lane, connections beyond the queues get 503
+	lanes = [admission.Lane(admission.cheap_lane, cheap_workers, queue_size, queue_timeout),
+			admission.Lane(admission.heavy_lane, heavy_workers, queue_size, queue_timeout)]
+
+	server = admission.PooledHTTPServer(address, Handler, get_lane, lanes)
+
+	# answers parked connections once a new latest block is published
+	tip_waiters.start()
+
+	return server
 
 
 if __name__ == "__main__":
-	HOST, PORT = "localhost", 9000
+	parser = argparse.ArgumentParser(description="Bitcoin blockchain Query API server")
+	parser.add_argument("--host", default="localhost", help="address to listen on")
+	parser.add_argument("--port", type=int, default=9000, help="port to listen on")
+	parser.add_argument("--data-dir", default="", help="directory of blkNNNNN.dat files, with trailing slash")
+	parser.add_argument("--profile", choices=[loadstats.cprofile_profiler, loadstats.sampling_profiler],
+						help="profile blockchain setup")
+	parser.add_argument("--profile-output", default="load_profile.txt", help="file to write profile report to")
+	parser.add_argument("--trace-memory", action="store_true", help="trace peak memory with tracemalloc")
+	parser.add_argument("--cheap-workers", type=int, default=4, help="worker threads of cheap endpoint lane")
+	parser.add_argument("--heavy-workers", type=int, default=8, help="worker threads of heavy endpoint lane")
+	parser.add_argument("--queue-size", type=int, default=64, help="connections queued per lane before 503")
+	parser.add_argument("--queue-timeout", type=float, default=2.0, help="seconds queued before 503")
+	parser.add_argument("--update-interval", type=float, default=10.0,
+						help="seconds between loads of newly appended blocks, 0 to disable")
+	parser.add_argument("--fragment-cache", type=int, default=fragments.fragment_cache_size,
+						help="pre-rendered JSON headers and transaction summaries kept, 0 to disable")
+	parser.add_argument("--txindex-file", default=None,
+						help="file to save the packed txid index to and map it from on restart")
+	parser.add_argument("--read-ahead", type=int, default=blockchain.read_ahead_files,
+						help="blk files read ahead of the one being parsed, 0 reads and parses in turn")
+	parser.add_argument("--warmup-file", default=None,
+						help="file hot block and tx hashes are saved to and replayed from on restart")
+	parser.add_argument("--warmup-interval", type=float, default=warmup.save_interval,
+						help="seconds between saves of hot hashes")
+	parser.add_argument("--disk-index", default=None,
+						help="directory of on-disk txid index, transactions are read from the files when requested")
+	parser.add_argument("--page-cache", type=int, default=diskindex.page_cache.capacity,
+						help="4 KB pages of on-disk txid index kept in memory")
+	parser.add_argument("--transaction-cache", type=int,
+						default=blockchain.transaction_cache.capacity // (1024 * 1024),
+						help="MB of parsed transactions kept of blocks read again from the files")
+	args = parser.parse_args()
+
+	fragments.set_capacity(args.fragment_cache)
+	blockchain.txindex_path = args.txindex_file
+	blockchain.disk_index_path = args.disk_index
+	blockchain.read_ahead_files = args.read_ahead
+	diskindex.page_cache.capacity = args.page_cache
+	blockchain.transaction_cache.capacity = args.transaction_cache * 1024 * 1024
+
+	# count requested hashes from the first request on
+	if args.warmup_file is not None:
+		recorder = warmup.AccessRecorder(args.warmup_file)
+
+	HOST, PORT = args.host, args.port
 	# create server
-	server = ThreadedHTTPServer((HOST, PORT), Handler)
-	# start server thread to handle requests and server thread starts new thread for each new request
+	server = create_server((HOST, PORT), args.cheap_workers, args.heavy_workers, args.queue_size, args.queue_timeout)
+	# start server thread to accept connections and queue them to the worker threads of their lane
 	server_thread = threading.Thread(target=server.serve_forever)
 	server_thread.daemon = True
 	server_thread.start()
@@ -227,12 +840,23 @@ if __name__ == "__main__":
 
 	# parse blockchain files
 	#blockchain.setup("Bitcoin/blocks/")
-	blockchain.setup("")
+	blockchain.setup(args.data_dir, args.profile, args.profile_output, args.trace_memory)
 	print("Blockchain setup done.")
 
-	# hang to wait for connections
+	# warm caches in the background while requests are already served
+	if recorder is not None:
+		warmup_thread = threading.Thread(target=run_warmup, args=(args.warmup_interval,))
+		warmup_thread.daemon = True
+		warmup_thread.start()
+
+	# load blocks appended to the files while request threads keep reading the published generation
 	while True:
-		continue
+		if args.update_interval <= 0:
+			time.sleep(3600)
+			continue
+
+		time.sleep(args.update_interval)
+		blockchain.update(args.data_dir)
 
 	# clean up server
 	server.shutdown()
@@ -0,0 +1,83 @@
+# test_admission.py
+# Tests of request classification and lanes of the pooled server
+
+import unittest
+import threading
+import admission
+
+
+class GetRequestPathTest(unittest.TestCase):
+
+	def test_path_once_head_complete(self):
+		data = b"GET /blockheader?00ff HTTP/1.1\r\nHost: x\r\n\r\n"
+
+		self.assertEqual(admission.get_request_path(data), "/blockheader")
+
+	def test_none_while_headers_arrive(self):
+		self.assertIsNone(admission.get_request_path(b"GET /stats?0&10 HTTP/1.1\r\nHost: x\r\n"))
+		self.assertIsNone(admission.get_request_path(b"GET /sta"))
+
+	def test_bare_newlines(self):
+		self.assertEqual(admission.get_request_path(b"GET /latestheight HTTP/1.0\n\n"), "/latestheight")
+
+	def test_long_head_classified_by_request_line(self):
+		data = b"GET /stats?0&10 HTTP/1.1\r\nX-Padding: " + b"a" * admission.peek_size
+
+		self.assertEqual(admission.get_request_path(data[:admission.peek_size]), "/stats")
+
+	def test_malformed_request_line(self):
+		self.assertEqual(admission.get_request_path(b"GARBAGE\r\n\r\n"), "")
+
+
+class LaneTest(unittest.TestCase):
+
+	def setUp(self):
+		self.cheap = admission.Lane(admission.cheap_lane, 1, 2, 1.0)
+		self.heavy = admission.Lane(admission.heavy_lane, 1, 2, 1.0)
+		self.heavy.condition = self.cheap.condition
+
+	def test_put_bounded_by_queue_size(self):
+		self.assertTrue(self.cheap.put(("a", None, 0.0)))
+		self.assertTrue(self.cheap.put(("b", None, 0.0)))
+		self.assertFalse(self.cheap.put(("c", None, 0.0)))
+
+	def test_own_lane_served_first(self):
+		self.cheap.put(("cheap", None, 0.0))
+		self.heavy.put(("heavy", None, 0.0))
+
+		lane, item = self.heavy.get([self.cheap])
+		self.assertIs(lane, self.heavy)
+		self.assertEqual(item[0], "heavy")
+
+	def test_helps_other_lane_when_idle(self):
+		self.cheap.put(("cheap", None, 0.0))
+
+		lane, item = self.heavy.get([self.cheap])
+		self.assertIs(lane, self.cheap)
+		self.assertEqual(item[0], "cheap")
+
+	def test_stop_marker_left_to_own_workers(self):
+		self.cheap.threads = [None]
+		self.cheap.stop()
+
+		# heavy worker waits past the marker until its own lane has work
+		taken = []
+		worker = threading.Thread(target=lambda: taken.append(self.heavy.get([self.cheap])))
+		worker.start()
+		self.heavy.put(("heavy", None, 0.0))
+		worker.join()
+
+		self.assertEqual(taken[0][1][0], "heavy")
+		self.assertEqual(self.cheap.get(), (self.cheap, None))
+
+	def test_take_expired(self):
+		self.cheap.put(("old", None, 0.0))
+		self.cheap.put(("new", None, 5.0))
+
+		expired = self.cheap.take_expired(5.5)
+		self.assertEqual([item[0] for item in expired], ["old"])
+		self.assertEqual(self.cheap.get_depth(), 1)
+
+
+if __name__ == "__main__":
+	unittest.main()
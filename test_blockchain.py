@@ -0,0 +1,207 @@
+# test_blockchain.py
+# Tests of fees, input values and Merkle proofs on a generated chain
+
+import os
+import sys
+import struct
+import shutil
+import hashlib
+import binascii
+import tempfile
+import unittest
+import codec
+import blockchain
+import generation
+import generate
+
+
+def load_chain(directory_path, disk_index_path=None):
+	# load the files from scratch, as a server does at start, returns the published generation
+	blockchain.current = generation.IndexGeneration()
+	blockchain.file_offsets.clear()
+	blockchain.unresolved_txs = []
+	blockchain.unresolved_values = []
+	blockchain.transaction_cache.clear()
+	blockchain.merkle_cache.clear()
+	blockchain.disk_index_path = disk_index_path
+
+	run_quietly(lambda: blockchain.setup(directory_path))
+	return blockchain.current
+
+
+def run_quietly(function):
+	# load progress goes to stdout
+	stdout = sys.stdout
+	sys.stdout = open(os.devnull, "w")
+	try:
+		return function()
+	finally:
+		sys.stdout.close()
+		sys.stdout = stdout
+
+
+def expected_input_values(gen):
+	# satoshi spent by the inputs of every loaded transaction, -1 if a previous output is not loaded
+	# blocks past block_count were added by later generations
+	blocks = gen.blocks[:gen.block_count]
+
+	output_values = {}
+	for block in blocks:
+		for tx in block.get_transactions():
+			output_values[tx.get_hash_little()] = tx.get_output_values()
+
+	input_values = {}
+	for block in blocks:
+		for tx in block.get_transactions():
+			satoshi = 0
+			for input_tx in tx.get_inputs():
+				if tx.is_coinbase():
+					break
+				prev_values = output_values.get(input_tx.get_prev_hash_little())
+				if prev_values is None:
+					satoshi = -1
+					break
+				satoshi += prev_values[input_tx.get_prev_index_int()]
+			input_values[tx.get_hash_little()] = satoshi
+
+	return input_values
+
+
+def split_records(data):
+	# magic number | block size | block, of every block in a file
+	records = []
+	offset = 0
+	while offset < len(data):
+		size = struct.unpack("<I", data[offset + 4: offset + 8])[0]
+		records.append(data[offset: offset + 8 + size])
+		offset += 8 + size
+
+	return records
+
+
+def verify_proof(tx_hash_big, merkle_root_big, position, branch):
+	# fold the branch from the transaction hash up to the merkle root
+	node = binascii.unhexlify(tx_hash_big)[::-1]
+	for sibling_big in branch:
+		sibling = binascii.unhexlify(sibling_big)[::-1]
+		pair = sibling + node if position & 1 else node + sibling
+		node = hashlib.sha256(hashlib.sha256(pair).digest()).digest()
+		position = position // 2
+
+	return node[::-1] == binascii.unhexlify(merkle_root_big)
+
+
+class GeneratedChainTest(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		# files are named by appending to the directory path
+		cls.directory_path = os.path.join(tempfile.mkdtemp(prefix="blkchain"), "")
+		generator = generate.ChainGenerator(seed=3, txs_per_block=5, fork_rate=0.1)
+		filename = generate.write_files(generator, 120, cls.directory_path, shuffle_window=8)[0]
+
+		# an early block moved to a second file, so later transactions spend outputs of a later file
+		with open(filename, "rb") as file:
+			records = split_records(file.read())
+		with open(filename, "wb") as file:
+			file.write(b"".join(records[:30] + records[31:]))
+		cls.later_filename = blockchain.get_filename(cls.directory_path, 1)
+		with open(cls.later_filename, "wb") as file:
+			file.write(records[30])
+
+	@classmethod
+	def tearDownClass(cls):
+		blockchain.disk_index_path = None
+		blockchain.current = generation.IndexGeneration()
+		shutil.rmtree(cls.directory_path)
+
+	def setUp(self):
+		self.disk_index_path = tempfile.mkdtemp(prefix="blkindex")
+		self.addCleanup(shutil.rmtree, self.disk_index_path)
+
+	def load_in_two_updates(self, disk_index_path=None):
+		# load the first file, then the second in an update, returns both generations
+		os.rename(self.later_filename, self.later_filename + ".later")
+		try:
+			first = load_chain(self.directory_path, disk_index_path)
+		finally:
+			os.rename(self.later_filename + ".later", self.later_filename)
+		# transactions left to retry, resident or on disk
+		self.assertNotEqual(len(blockchain.unresolved_txs) + len(blockchain.unresolved_values), 0)
+
+		run_quietly(lambda: blockchain.update(self.directory_path))
+		return first, blockchain.current
+
+	def get_summaries(self, gen):
+		# summary of every main chain transaction, with input values and fees
+		summaries = {}
+		for block in gen.main_chain_blocks:
+			for tx in block.get_transactions():
+				summaries[tx.get_hash_little()] = blockchain.get_transaction_summary(gen, block, tx)
+		return summaries
+
+	def assert_fees(self, gen, summaries):
+		input_values = expected_input_values(gen)
+		for tx_hash, summary in summaries.items():
+			input_btc, fee_btc, fee_rate = summary[6:9]
+			satoshi = input_values[tx_hash]
+			if satoshi == -1:
+				self.assertEqual((input_btc, fee_btc, fee_rate), (-1.0, -1.0, -1.0))
+			else:
+				self.assertEqual(input_btc, satoshi / 100000000.0)
+				self.assertGreaterEqual(fee_btc, 0.0)
+
+	def test_fees_of_resident_chain(self):
+		gen = load_chain(self.directory_path)
+		input_values = expected_input_values(gen)
+		summaries = self.get_summaries(gen)
+
+		self.assertNotIn(-1, input_values.values())
+		self.assertEqual(len(summaries), sum([block.get_tx_count_int() for block in gen.main_chain_blocks]))
+		self.assertFalse(any([summary[7] == -1.0 for summary in summaries.values()]))
+		self.assert_fees(gen, summaries)
+
+		# fee is the input value less the output value of the transaction
+		for block in gen.main_chain_blocks:
+			for tx in block.get_transactions()[1:]:
+				fee_btc = summaries[tx.get_hash_little()][7]
+				expected = (input_values[tx.get_hash_little()] - tx.get_output_value_int()) / 100000000.0
+				self.assertAlmostEqual(fee_btc, expected, places=8)
+
+	def test_inputs_resolved_by_later_update(self):
+		first, gen = self.load_in_two_updates()
+
+		# outputs in files not loaded yet leave some fees unknown, resolved once they load
+		first_values = expected_input_values(first)
+		self.assertIn(-1, first_values.values())
+		self.assert_fees(gen, self.get_summaries(gen))
+		self.assertNotIn(-1, expected_input_values(gen).values())
+
+	def test_disk_fees_match_resident(self):
+		resident = self.get_summaries(load_chain(self.directory_path))
+		first, gen = self.load_in_two_updates(self.disk_index_path)
+
+		self.assertFalse(gen.tx_index.resident)
+		self.assertEqual(self.get_summaries(gen), resident)
+
+	def test_merkle_proofs(self):
+		gen = load_chain(self.directory_path)
+		tx_hashes = [tx.get_hash_big() for block in gen.main_chain_blocks for tx in block.get_transactions()]
+
+		proofs = blockchain.get_transaction_proofs(tx_hashes + ["00" * 32])
+		for tx_hash_big, block_hash, merkle_root, position, branch in proofs[:-1]:
+			self.assertTrue(verify_proof(tx_hash_big, merkle_root, position, branch))
+			self.assertEqual(merkle_root, gen.get_block(codec.reverse_hex(block_hash)).get_merk_hash_big())
+		self.assertEqual(proofs[-1], ("00" * 32, "", "", -1, []))
+
+	def test_merkle_proof_rejects_other_transaction(self):
+		load_chain(self.directory_path)
+		block = blockchain.current.main_chain_blocks[10]
+		tx_hashes = [tx.get_hash_big() for tx in block.get_transactions()]
+
+		tx_hash_big, block_hash, merkle_root, position, branch = blockchain.get_transaction_proofs(tx_hashes[:1])[0]
+		self.assertFalse(verify_proof(tx_hashes[1], merkle_root, position, branch))
+
+
+if __name__ == "__main__":
+	unittest.main()
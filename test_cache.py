@@ -0,0 +1,49 @@
+# test_cache.py
+# Tests of the bounded least recently used cache
+
+import unittest
+import cache
+
+
+class LRUCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.cache = cache.LRUCache("test", 100)
+		self.addCleanup(cache.caches.remove, self.cache)
+
+	def test_counts_entries_without_sizes(self):
+		self.cache.capacity = 2
+		for key in ("a", "b", "c"):
+			self.cache.put(key, key)
+
+		self.assertNotIn("a", self.cache)
+		self.assertEqual(len(self.cache), 2)
+
+	def test_evicts_least_recently_used_by_size(self):
+		self.cache.put("a", 1, 40)
+		self.cache.put("b", 2, 40)
+		# a becomes most recently used, so b is evicted first
+		self.cache.get("a")
+		self.cache.put("c", 3, 40)
+
+		self.assertIn("a", self.cache)
+		self.assertNotIn("b", self.cache)
+		self.assertEqual(self.cache.total_size, 80)
+
+	def test_replacing_entry_replaces_its_size(self):
+		self.cache.put("a", 1, 60)
+		self.cache.put("a", 2, 30)
+
+		self.assertEqual(self.cache.total_size, 30)
+		self.assertEqual(self.cache.get("a"), 2)
+
+	def test_entry_larger_than_capacity_not_kept(self):
+		self.cache.put("a", 1, 10)
+		self.cache.put("b", 2, 200)
+
+		self.assertEqual(len(self.cache), 0)
+		self.assertEqual(self.cache.total_size, 0)
+
+
+if __name__ == "__main__":
+	unittest.main()
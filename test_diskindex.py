@@ -0,0 +1,152 @@
+# test_diskindex.py
+# Tests of Bloom filters, txid runs on disk and the input value file
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import bloom
+import diskindex
+import txindex
+
+
+class FakeTx:
+
+	def __init__(self, tx_hash_little):
+		self.tx_hash_little = tx_hash_little
+
+	def get_hash_little(self):
+		return self.tx_hash_little
+
+
+class FakeBlock:
+
+	def __init__(self, tx_hashes):
+		self.txs = [FakeTx(tx_hash) for tx_hash in tx_hashes]
+
+	def get_transactions(self):
+		return self.txs
+
+
+def random_hash(rng):
+	return "%064x" % rng.getrandbits(256)
+
+
+class CountingPagedFile:
+	# paged file counting the pages read through it
+
+	def __init__(self, paged_file):
+		self.paged_file = paged_file
+		self.reads = 0
+
+	def get_page(self, page_number):
+		self.reads += 1
+		return self.paged_file.get_page(page_number)
+
+
+class BloomFilterTest(unittest.TestCase):
+
+	def test_no_false_negatives(self):
+		rng = random.Random(3)
+		keys = [rng.getrandbits(64) for i in range(0, 5000)]
+		bloom_filter = bloom.for_capacity(len(keys))
+		for key in keys:
+			bloom_filter.add(key)
+
+		self.assertTrue(all([key in bloom_filter for key in keys]))
+
+	def test_false_positive_rate(self):
+		rng = random.Random(4)
+		bloom_filter = bloom.for_capacity(5000)
+		for i in range(0, 5000):
+			bloom_filter.add(rng.getrandbits(64))
+
+		false_positives = sum([1 for i in range(0, 20000) if rng.getrandbits(64) in bloom_filter])
+		self.assertLess(false_positives / 20000.0, 2 * bloom.error_rate)
+
+	def test_probes_distinct(self):
+		bloom_filter = bloom.BloomFilter(64, 10)
+		for key in (0, 1, 2 ** 63 + 12345, 2 ** 64 - 1):
+			self.assertEqual(len(set(bloom_filter.probes(key))), 10)
+
+
+class DiskTxIndexTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory_path = tempfile.mkdtemp(prefix="diskindex")
+		self.addCleanup(shutil.rmtree, self.directory_path)
+
+		rng = random.Random(6)
+		self.blocks = [FakeBlock([random_hash(rng) for i in range(0, 9)]) for j in range(0, 80)]
+		# same txid in a block loaded much later, in another run
+		self.duplicate = self.blocks[2].txs[4].get_hash_little()
+		self.blocks[70].txs[1] = FakeTx(self.duplicate)
+
+		# one extend per few blocks, as updates load them, so runs are written and merged
+		self.index = diskindex.open_index(self.directory_path)
+		for block_count in range(5, 81, 5):
+			self.index = self.index.extend(self.blocks, block_count)
+
+		self.packed = txindex.TxIndex().extend(self.blocks, 80)
+
+	def test_matches_packed_index(self):
+		for block in self.blocks:
+			for tx in block.get_transactions():
+				self.assertEqual(self.index.find(tx.get_hash_little()), self.packed.find(tx.get_hash_little()))
+
+	def test_duplicate_across_runs(self):
+		self.assertEqual(self.index.find(self.duplicate), [(2, 4), (70, 1)])
+
+	def test_runs_merged(self):
+		self.assertEqual(len(self.index), 80 * 9)
+		self.assertLessEqual(len(self.index.runs), diskindex.max_runs)
+		self.assertLess(len(self.index.runs), 16)
+
+	def test_unknown_hash_skips_pages(self):
+		# every run's Bloom filter rejects nearly all absent prefixes before any page is read
+		counters = []
+		for run in self.index.runs:
+			run.prefixes.paged_file = CountingPagedFile(run.prefixes.paged_file)
+			counters.append(run.prefixes.paged_file)
+
+		rng = random.Random(8)
+		for i in range(0, 1000):
+			self.assertEqual(self.index.find(random_hash(rng)), [])
+		# a lookup of a present hash reads about 10 pages
+		self.assertLess(sum([counter.reads for counter in counters]), 100)
+
+	def test_older_index_unchanged(self):
+		older = diskindex.open_index(os.path.join(self.directory_path, "older")).extend(self.blocks, 40)
+		older.extend(self.blocks, 80)
+
+		self.assertEqual(older.find(self.blocks[60].txs[0].get_hash_little()), [])
+		self.assertEqual(older.find(self.duplicate), [(2, 4)])
+
+
+class InputValueFileTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory_path = tempfile.mkdtemp(prefix="inputvalues")
+		self.addCleanup(shutil.rmtree, self.directory_path)
+		self.values = diskindex.open_index(self.directory_path).input_values
+
+	def test_append_and_read(self):
+		self.assertEqual(self.values.append([0, 5000000000, -1]), 0)
+		self.assertEqual(self.values.append([7, 2 ** 62]), 3)
+
+		self.assertEqual(list(self.values.read(0, 5)), [0, 5000000000, -1, 7, 2 ** 62])
+		self.assertEqual(list(self.values.read(3, 2)), [7, 2 ** 62])
+
+	def test_resolve(self):
+		self.values.append([0, -1, -1])
+		self.values.resolve(1, 12345)
+
+		self.assertEqual(list(self.values.read(0, 3)), [0, 12345, -1])
+		# appends after a resolve still go past every earlier value
+		self.assertEqual(self.values.append([9]), 3)
+		self.assertEqual(list(self.values.read(0, 4)), [0, 12345, -1, 9])
+
+
+if __name__ == "__main__":
+	unittest.main()
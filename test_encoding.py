@@ -0,0 +1,80 @@
+# test_encoding.py
+# Tests of MessagePack and CBOR responses against the reference decoders
+
+import unittest
+import encoding
+
+try:
+	import msgpack
+except ImportError:
+	msgpack = None
+
+try:
+	import cbor2
+except ImportError:
+	cbor2 = None
+
+
+# response shaped like /transactioninfo, with every value type the encoders handle
+result = {
+			"tx_hash": "ab" * 32,
+			"block_hash": "00" * 28 + "0f1e2d3c",
+			"height": 170,
+			"size": 70000,
+			"time": 1231731025,
+			"value": 2 ** 40 + 7,
+			"offset": -1,
+			"fee": -70000,
+			"difficulty": 1.5,
+			"confirmed": True,
+			"address": None,
+			"type": "p2pkh",
+			"branch": ["11" * 32, "22" * 32],
+			"inputs": [{"prev_hash": "33" * 32, "sig_script": "", "vout": 4294967295}],
+			"note": "x" * 40
+		}
+
+
+class ReferenceEncoderTest(unittest.TestCase):
+
+	def setUp(self):
+		self.expected = encoding.to_binary(result)
+
+	def encode_both(self, response_format, module_name):
+		# body of the reference encoder and of the fallback encoder
+		content_type, reference = encoding.encode(result, response_format)
+		library = getattr(encoding, module_name)
+		setattr(encoding, module_name, None)
+		try:
+			content_type, fallback = encoding.encode(result, response_format)
+		finally:
+			setattr(encoding, module_name, library)
+		return reference, fallback
+
+	@unittest.skipIf(msgpack is None, "msgpack not installed")
+	def test_msgpack_round_trip(self):
+		for body in self.encode_both(encoding.msgpack_format, "msgpack"):
+			self.assertEqual(msgpack.unpackb(body, raw=False), self.expected)
+
+	@unittest.skipIf(msgpack is None, "msgpack not installed")
+	def test_msgpack_fallback_matches_reference(self):
+		reference, fallback = self.encode_both(encoding.msgpack_format, "msgpack")
+		self.assertEqual(reference, fallback)
+
+	@unittest.skipIf(cbor2 is None, "cbor2 not installed")
+	def test_cbor_round_trip(self):
+		for body in self.encode_both(encoding.cbor_format, "cbor2"):
+			self.assertEqual(cbor2.loads(body), self.expected)
+
+	@unittest.skipIf(cbor2 is None, "cbor2 not installed")
+	def test_cbor_fallback_matches_reference(self):
+		reference, fallback = self.encode_both(encoding.cbor_format, "cbor2")
+		self.assertEqual(reference, fallback)
+
+	def test_binary_fields_as_bytes(self):
+		self.assertEqual(self.expected["block_hash"][-4:], bytearray(b"\x0f\x1e\x2d\x3c"))
+		self.assertEqual(self.expected["inputs"][0]["sig_script"], bytearray())
+
+
+if __name__ == "__main__":
+	unittest.main()
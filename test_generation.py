@@ -0,0 +1,118 @@
+# test_generation.py
+# Tests of index generations and duplicate transaction lookups
+
+import unittest
+import generation
+
+
+class FakeTx:
+
+	def __init__(self, tx_hash_little):
+		self.tx_hash_little = tx_hash_little
+
+	def get_hash_little(self):
+		return self.tx_hash_little
+
+	def get_output_values(self):
+		return (int(self.tx_hash_little[:2], 16),)
+
+
+class FakeBlock:
+
+	def __init__(self, name, prev_name, height, tx_hashes):
+		self.name = name
+		self.prev_name = prev_name
+		self.height = height
+		self.txs = [FakeTx(tx_hash) for tx_hash in tx_hashes]
+
+	def get_curr_hash_little(self):
+		return self.name
+
+	def get_prev_hash_little(self):
+		return self.prev_name
+
+	def get_height(self):
+		return self.height
+
+	def get_transactions(self):
+		return self.txs
+
+	def get_tx_count_int(self):
+		return len(self.txs)
+
+
+coinbase_a = "aa" * 32
+coinbase_b = "bb" * 32
+# transaction mined in both a main chain block and its stale sibling
+shared_tx = "cc" * 32
+
+
+def set_main_chain(gen, blocks):
+	main_chain_blocks = gen.main_chain_blocks.branch()
+	main_chain_blocks.truncate(0)
+	for block in blocks:
+		main_chain_blocks.append(block)
+	gen.main_chain_blocks = main_chain_blocks
+	return
+
+
+class DuplicateTransactionTest(unittest.TestCase):
+
+	def setUp(self):
+		self.gen = generation.IndexGeneration()
+		# enough transactions in the packed index that the next blocks go to the dict layer
+		self.first = FakeBlock("a", "0", 0, [coinbase_a] + [("%02x" % i) * 32 for i in range(1, 40)])
+		self.gen.add_block(self.first)
+		self.gen.index_transactions(0)
+
+		# stale sibling loaded before the main chain block
+		self.stale = FakeBlock("s", "a", 1, [coinbase_b, shared_tx])
+		self.main = FakeBlock("m", "a", 1, [shared_tx])
+		self.gen.add_block(self.stale)
+		self.gen.add_block(self.main)
+		set_main_chain(self.gen, [self.first, self.main])
+
+	def find_names(self, gen, tx_hash):
+		block, tx_pos, alternates = gen.find_transaction_blocks(tx_hash)
+		return block.name, tx_pos, [alternate.name for alternate in alternates]
+
+	def test_main_chain_block_preferred(self):
+		self.assertFalse(self.gen.index_transactions(1))
+
+		self.assertEqual(self.find_names(self.gen, shared_tx), ("m", 0, ["s"]))
+
+	def test_main_chain_block_preferred_in_packed_index(self):
+		# rebuilding the packed index, where entries of a txid are in load order
+		self.gen.tx_index = self.gen.tx_index.extend(self.gen.blocks, self.gen.block_count)
+
+		self.assertEqual(self.find_names(self.gen, shared_tx), ("m", 0, ["s"]))
+
+	def test_latest_loaded_off_main_chain(self):
+		self.gen.index_transactions(1)
+		set_main_chain(self.gen, [self.first])
+
+		self.assertEqual(self.find_names(self.gen, shared_tx), ("m", 0, ["s"]))
+
+	def test_reorg_leaves_older_generation(self):
+		self.gen.index_transactions(1)
+		gen = generation.IndexGeneration(self.gen)
+		set_main_chain(gen, [self.first, self.stale])
+
+		self.assertEqual(self.find_names(gen, shared_tx), ("s", 1, ["m"]))
+		self.assertEqual(self.find_names(self.gen, shared_tx), ("m", 0, ["s"]))
+
+	def test_unique_and_unknown(self):
+		self.gen.index_transactions(1)
+
+		self.assertEqual(self.find_names(self.gen, coinbase_b), ("s", 0, []))
+		self.assertEqual(self.gen.find_transaction_blocks("dd" * 32), (None, -1, []))
+
+	def test_output_values_of_either_copy(self):
+		self.gen.index_transactions(1)
+
+		self.assertEqual(self.gen.get_output_values(shared_tx), (0xcc,))
+		self.assertIsNone(self.gen.get_output_values("dd" * 32))
+
+
+if __name__ == "__main__":
+	unittest.main()
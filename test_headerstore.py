@@ -0,0 +1,160 @@
+# test_headerstore.py
+# Tests of main chain header columns and the time index
+
+import random
+import unittest
+import chunked
+import headerstore
+
+
+class FakeBlock:
+	# header fields a HeaderStore reads from a block
+
+	def __init__(self, block_time):
+		self.block_time = block_time
+
+	def get_time_int(self):
+		return self.block_time
+
+	def get_nBits_int(self):
+		return 0x1d00ffff
+
+	def get_nonce_int(self):
+		return 0
+
+	def get_version_int(self):
+		return 1
+
+	def get_tx_count_int(self):
+		return 1
+
+	def get_size_int(self):
+		return 285
+
+	def get_coinbase_value_int(self):
+		return headerstore.initial_subsidy
+
+	def get_input_count_int(self):
+		return 1
+
+	def get_output_value_int(self):
+		return headerstore.initial_subsidy
+
+
+def make_store(times):
+	store = headerstore.HeaderStore()
+	store.extend([FakeBlock(block_time) for block_time in times])
+	return store
+
+
+def jittered_times(rng, count):
+	# block times out of order by up to two hours, each later than the median time past as consensus requires
+	times = []
+	for i in range(0, count):
+		recent = sorted(times[-headerstore.median_time_span:])
+		median_time_past = recent[len(recent) // 2] if len(recent) > 0 else 0
+		times.append(max(median_time_past + 1, 1000000 + 600 * i + rng.randint(-7200, 7200)))
+	return times
+
+
+class TimeRangeTest(unittest.TestCase):
+
+	def setUp(self):
+		self.times = jittered_times(random.Random(7), 3000)
+		self.store = make_store(self.times)
+
+	def brute_force(self, start_time, end_time):
+		return [i for i in range(0, len(self.times)) if start_time <= self.times[i] <= end_time]
+
+	def test_times_are_out_of_order(self):
+		self.assertTrue(any([self.times[i] < self.times[i - 1] for i in range(1, len(self.times))]))
+
+	def test_matches_every_block_in_range(self):
+		rng = random.Random(11)
+		for trial in range(0, 500):
+			start_time = rng.choice(self.times) + rng.randint(-3600, 3600)
+			end_time = start_time + rng.choice([0, 600, 6000, 60000, 600000])
+			expected = self.brute_force(start_time, end_time)
+
+			count, heights = self.store.get_time_range(start_time, end_time, 0, len(self.times))
+			self.assertEqual(count, len(expected))
+			self.assertEqual(heights, expected)
+
+	def test_pages(self):
+		rng = random.Random(13)
+		for trial in range(0, 500):
+			start_time = rng.choice(self.times) + rng.randint(-3600, 3600)
+			end_time = start_time + rng.choice([600, 6000, 60000])
+			expected = self.brute_force(start_time, end_time)
+			limit = rng.choice([1, 3, 10])
+			offset = rng.randint(0, len(expected) + 2)
+
+			count, heights = self.store.get_time_range(start_time, end_time, offset, limit)
+			self.assertEqual(count, len(expected))
+			self.assertEqual(heights, expected[offset: offset + limit])
+
+	def test_empty_range(self):
+		self.assertEqual(self.store.get_time_range(0, 10, 0, 10), (0, []))
+		self.assertEqual(self.store.get_time_range(self.times[-1] + 10000, self.times[-1] + 20000, 0, 10), (0, []))
+
+	def test_page_of_whole_chain(self):
+		# a page of a window spanning the whole chain lists only the page
+		count, heights = self.store.get_time_range(0, 2 ** 32 - 1, 1000, 5)
+
+		self.assertEqual(count, len(self.times))
+		self.assertEqual(heights, [1000, 1001, 1002, 1003, 1004])
+
+
+class RangeAggregatesTest(unittest.TestCase):
+
+	def test_totals_of_range(self):
+		store = make_store([1000000 + 600 * i for i in range(0, 10)])
+		aggregates = store.get_range_aggregates(2, 5)
+
+		self.assertEqual(aggregates["block_count"], 4)
+		self.assertEqual(aggregates["tx_count"], 4)
+		self.assertEqual(aggregates["issued"], 200.0)
+		self.assertEqual(aggregates["fees"], 0.0)
+
+
+class BranchTest(unittest.TestCase):
+
+	def setUp(self):
+		# small chunks so a short chain spans several
+		self.addCleanup(setattr, chunked, "chunk_size", chunked.chunk_size)
+		chunked.chunk_size = 4
+		self.times = [1000000 + 600 * i for i in range(0, 10)]
+		self.store = make_store(self.times)
+
+	def test_append_leaves_published_store(self):
+		store = self.store.branch()
+		store.extend([FakeBlock(2000000), FakeBlock(2000600)])
+
+		self.assertEqual(len(self.store), 10)
+		self.assertEqual(list(self.store.time), self.times)
+		self.assertEqual(list(store.time), self.times + [2000000, 2000600])
+
+	def test_reorg_leaves_published_store(self):
+		for fork_height in (9, 8, 6, 4, 0):
+			store = self.store.branch()
+			store.truncate(fork_height - 1)
+			store.extend([FakeBlock(3000000 + i) for i in range(0, 7)])
+
+			self.assertEqual(list(self.store.time), self.times)
+			self.assertEqual(list(store.time), self.times[:fork_height] + [3000000 + i for i in range(0, 7)])
+			self.assertEqual(list(store.height), list(range(0, fork_height + 7)))
+
+	def test_columns_match_store_built_at_once(self):
+		store = self.store.branch()
+		store.truncate(5)
+		store.extend([FakeBlock(3000000 + i) for i in range(0, 7)])
+		full = make_store(self.times[:6] + [3000000 + i for i in range(0, 7)])
+
+		for column, full_column in zip(store.columns(), full.columns()):
+			self.assertEqual(list(column), list(full_column))
+		self.assertEqual(list(store.column(store.time, 2, 11)), list(full.time[2:11]))
+		self.assertEqual(store.get_range_stats(1, 12), full.get_range_stats(1, 12))
+
+
+if __name__ == "__main__":
+	unittest.main()
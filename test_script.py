@@ -0,0 +1,90 @@
+# test_script.py
+# Tests of output script classification and address round trips
+
+import unittest
+import script
+
+
+# public key paid by the genesis coinbase output
+genesis_pubkey = ("04678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61de"
+				"b649f6bc3f4cef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5f")
+compressed_pubkey = "02" + "11" * 32
+
+# standard scripts with the address each pays to, BIP173 test vectors for the witness programs
+addressed_scripts = [
+						("76a91462e907b15cbf27d5425399ebf6f0fb50ebb88f1888ac", script.p2pkh_type,
+							"1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"),
+						("a914b472a266d0bd89c13706a4132ccfb16f7c3b9fcb87", script.p2sh_type,
+							"3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLy"),
+						("0014751e76e8199196d454941c45d1b3a323f1433bd6", script.p2wpkh_type,
+							"bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4"),
+						("00201863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262", script.p2wsh_type,
+							"bc1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3qccfmv3")
+					]
+
+
+class ClassifyScriptTest(unittest.TestCase):
+
+	def test_addressed_scripts(self):
+		for script_hex, script_type, address in addressed_scripts:
+			self.assertEqual(script.classify_script(script_hex), (script_type, address))
+
+	def test_p2pk_addressed_by_pubkey_hash(self):
+		self.assertEqual(script.classify_script("41" + genesis_pubkey + "ac"),
+						(script.p2pk_type, "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"))
+
+	def test_multisig(self):
+		# OP_1 <pubkey> <pubkey> OP_2 OP_CHECKMULTISIG
+		script_hex = "51" + "41" + genesis_pubkey + "21" + compressed_pubkey + "52ae"
+
+		self.assertEqual(script.classify_script(script_hex), (script.multisig_type, ""))
+
+	def test_multisig_needs_pubkeys(self):
+		script_hex = "51" + "41" + genesis_pubkey + "02abcd" + "52ae"
+
+		self.assertEqual(script.classify_script(script_hex), (script.nonstandard_type, ""))
+
+	def test_op_return(self):
+		self.assertEqual(script.classify_script("6a0568656c6c6f"), (script.op_return_type, ""))
+
+	def test_nonstandard(self):
+		# push running past the end of the script
+		self.assertEqual(script.classify_script("4c05aabb"), (script.nonstandard_type, ""))
+		self.assertEqual(script.classify_script(""), (script.nonstandard_type, ""))
+
+
+class AddressToScriptTest(unittest.TestCase):
+
+	def test_round_trip(self):
+		for script_hex, script_type, address in addressed_scripts:
+			self.assertEqual(script.address_to_script(address), script_hex)
+
+	def test_bech32_upper_case(self):
+		self.assertEqual(script.address_to_script("BC1QW508D6QEJXTDG4Y5R3ZARVARY0C5XW7KV8F3T4"),
+						addressed_scripts[2][0])
+
+	def test_invalid_addresses(self):
+		# bad checksum, mixed case, other network and characters outside the alphabet
+		for address in ("1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNb",
+						"bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t5",
+						"bc1qW508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4",
+						"tb1qw508d6qejxtdg4y5r3zarvary0c5xw7kxpjzsx",
+						"1A1zP1eP5QGefi2DMPTfTL5SLmv7Divf0a",
+						""):
+			self.assertEqual(script.address_to_script(address), "")
+
+
+class IndexKeyTest(unittest.TestCase):
+
+	def test_p2pk_shares_key_of_p2pkh(self):
+		p2pkh_script = script.address_to_script("1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa")
+
+		self.assertEqual(script.get_index_key("41" + genesis_pubkey + "ac"), script.get_script_hash(p2pkh_script))
+
+	def test_other_scripts_keyed_by_hash(self):
+		for script_hex, script_type, address in addressed_scripts:
+			self.assertEqual(script.get_index_key(script_hex), script.get_script_hash(script_hex))
+
+
+if __name__ == "__main__":
+	unittest.main()
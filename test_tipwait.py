@@ -0,0 +1,79 @@
+# test_tipwait.py
+# Tests of long-poll waiters released by the tipwait thread
+
+import socket
+import unittest
+import encoding
+import blockchain
+import tipwait
+
+
+class FakeClock:
+	# time that only moves when a test sets it
+
+	def __init__(self, now):
+		self.now = now
+
+	def __call__(self):
+		return self.now
+
+
+class TipWaitersTest(unittest.TestCase):
+
+	def setUp(self):
+		self.clock = FakeClock(1000.0)
+		# releasing thread is not started, tests run release rounds themselves
+		self.waiters = tipwait.TipWaiters(self.clock)
+
+	def park(self, timeout):
+		server_side, client_side = socket.socketpair()
+		self.addCleanup(client_side.close)
+		parked = self.waiters.park(server_side, "00" * 32, timeout, encoding.json_format)
+		self.assertTrue(parked)
+		client_side.setblocking(False)
+		return client_side
+
+	def read_response(self, client_side):
+		# bytes written to the client so far
+		try:
+			return client_side.recv(4096)
+		except socket.error:
+			return b""
+
+	def test_park_starts_release_round(self):
+		self.park(1)
+
+		self.assertTrue(self.waiters.pending)
+
+	def test_wait_recomputed_for_earlier_deadline(self):
+		self.park(10)
+		self.assertEqual(self.waiters.get_wait_seconds(self.clock()), 10)
+
+		self.park(1)
+		self.assertEqual(self.waiters.get_wait_seconds(self.clock()), 1)
+
+	def test_released_at_deadline(self):
+		client_side = self.park(1)
+
+		self.clock.now += 0.5
+		self.waiters.release(blockchain.current, self.clock())
+		self.assertEqual(self.read_response(client_side), b"")
+
+		self.clock.now += 0.5
+		self.waiters.release(blockchain.current, self.clock())
+		response = self.read_response(client_side)
+		self.assertTrue(response.startswith(b"HTTP/1.1 200 OK"))
+		self.assertIn(b'"changed": false', response)
+
+	def test_earlier_deadline_parked_after_later_one(self):
+		later = self.park(10)
+		earlier = self.park(1)
+
+		self.clock.now += 1
+		self.waiters.release(blockchain.current, self.clock())
+		self.assertNotEqual(self.read_response(earlier), b"")
+		self.assertEqual(self.read_response(later), b"")
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,130 @@
+# test_txindex.py
+# Tests of the packed txid index and its file
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import txindex
+
+
+class FakeTx:
+
+	def __init__(self, tx_hash_little):
+		self.tx_hash_little = tx_hash_little
+
+	def get_hash_little(self):
+		return self.tx_hash_little
+
+
+class FakeBlock:
+
+	def __init__(self, tx_hashes):
+		self.txs = [FakeTx(tx_hash) for tx_hash in tx_hashes]
+
+	def get_transactions(self):
+		return self.txs
+
+
+def random_hash(rng):
+	return "%064x" % rng.getrandbits(256)
+
+
+def make_blocks(rng, count, txs_per_block):
+	return [FakeBlock([random_hash(rng) for i in range(0, txs_per_block)]) for j in range(0, count)]
+
+
+def brute_force(blocks, block_count, tx_hash_little):
+	# (block id, position) of every transaction with the prefix of tx_hash_little, in load order
+	prefix = tx_hash_little[:16]
+	return [(block_id, position) for block_id in range(0, block_count)
+			for position, tx in enumerate(blocks[block_id].get_transactions())
+			if tx.get_hash_little()[:16] == prefix]
+
+
+class TxIndexTest(unittest.TestCase):
+
+	def setUp(self):
+		rng = random.Random(5)
+		self.blocks = make_blocks(rng, 60, 7)
+		# same txid in a later block, and another txid sharing its prefix
+		duplicate = self.blocks[3].txs[2].get_hash_little()
+		self.blocks[40].txs[5] = FakeTx(duplicate)
+		self.blocks[50].txs[0] = FakeTx(duplicate[:16] + "f" * 48)
+		self.duplicate = duplicate
+
+		# two extends, so the second merges new entries into the packed ones
+		self.index = txindex.TxIndex().extend(self.blocks, 30).extend(self.blocks, 60)
+
+	def test_finds_every_transaction(self):
+		for block in self.blocks:
+			for tx in block.get_transactions():
+				self.assertEqual(self.index.find(tx.get_hash_little()),
+								brute_force(self.blocks, 60, tx.get_hash_little()))
+
+	def test_shared_prefix_in_load_order(self):
+		self.assertEqual(self.index.find(self.duplicate), [(3, 2), (40, 5), (50, 0)])
+
+	def test_unknown_hash(self):
+		self.assertEqual(self.index.find("00" * 32), [])
+		self.assertEqual(self.index.find("ff" * 32), [])
+
+	def test_extend_leaves_older_index(self):
+		older = txindex.TxIndex().extend(self.blocks, 30)
+		older.extend(self.blocks, 60)
+
+		self.assertEqual(len(older), 30 * 7)
+		self.assertEqual(older.find(self.blocks[40].txs[0].get_hash_little()), [])
+
+
+class TxIndexFileTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory_path = tempfile.mkdtemp(prefix="txindex")
+		self.addCleanup(shutil.rmtree, self.directory_path)
+		self.path = os.path.join(self.directory_path, "txindex.bin")
+
+		rng = random.Random(9)
+		self.blocks = make_blocks(rng, 20, 5)
+		self.index = txindex.TxIndex().extend(self.blocks, 20)
+
+	def test_save_and_load(self):
+		self.index.save(self.path, b"\xab" * 32)
+		loaded, last_block_hash = txindex.load(self.path)
+
+		self.assertEqual(last_block_hash, b"\xab" * 32)
+		self.assertEqual(loaded.block_count, 20)
+		self.assertEqual(len(loaded), len(self.index))
+		for block in self.blocks:
+			for tx in block.get_transactions():
+				self.assertEqual(loaded.find(tx.get_hash_little()), self.index.find(tx.get_hash_little()))
+
+	def test_loaded_index_extends(self):
+		self.index.save(self.path, b"\x00" * 32)
+		loaded, last_block_hash = txindex.load(self.path)
+		more_blocks = self.blocks + make_blocks(random.Random(10), 5, 5)
+
+		extended = loaded.extend(more_blocks, 25)
+		tx_hash = more_blocks[22].txs[1].get_hash_little()
+		self.assertEqual(extended.find(tx_hash), [(22, 1)])
+
+	def test_missing_file(self):
+		self.assertEqual(txindex.load(self.path), (None, b""))
+
+	def test_truncated_file(self):
+		self.index.save(self.path, b"\x00" * 32)
+		with open(self.path, "r+b") as file:
+			file.truncate(os.path.getsize(self.path) - 4)
+
+		self.assertEqual(txindex.load(self.path), (None, b""))
+
+	def test_other_file(self):
+		with open(self.path, "wb") as file:
+			file.write(b"\x00" * (txindex.header_size + 100))
+
+		self.assertEqual(txindex.load(self.path), (None, b""))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,249 @@
+# tipwait.py
+# Connections waiting for a new latest block, parked without a thread each and released in one broadcast
+
+# https://html.spec.whatwg.org/multipage/server-sent-events.html
+
+import json
+import time
+import heapq
+import socket
+import itertools
+import threading
+import encoding
+import codec
+import blockchain
+
+
+# seconds a long-poll request waits when the client gives no timeout
+default_timeout = 30
+
+# longest wait a client may ask for, a client that went away holds its socket until then
+max_timeout = 300
+
+# connections parked at once, more get 503 before file descriptors run out
+max_waiters = 10000
+
+# seconds between comments on idle event streams, keeping proxies from closing them and finding dead clients
+heartbeat_interval = 15.0
+
+# comment line ignored by event stream clients
+heartbeat = b": keep-alive\n\n"
+
+
+def has_moved(tip_little, known_tip_little):
+	# whether a client knowing known_tip should be told of tip, never before the first block is loaded
+	return tip_little != "" and tip_little != known_tip_little
+
+
+def get_tip_result(gen, known_tip_little):
+	# latest block of the generation and whether it differs from the one the client knows
+	return {"hash": codec.reverse_hex(gen.latest_block_little), "height": gen.blockchain_height,
+			"changed": has_moved(gen.latest_block_little, known_tip_little)}
+
+
+def render_response(result, response_format):
+	# complete response of a released long-poll request, the connection is closed after it
+	content_type, body = encoding.encode(result, response_format)
+	head = ("HTTP/1.1 200 OK\r\n"
+			"Content-Type: " + content_type + "\r\n"
+			"Content-Length: " + str(len(body)) + "\r\n"
+			"Connection: close\r\n\r\n").encode("ascii")
+	return head + body
+
+
+def render_event(gen):
+	# event stream message of the latest block
+	data = json.dumps({"hash": codec.reverse_hex(gen.latest_block_little), "height": gen.blockchain_height})
+	return ("event: tip\ndata: " + data + "\n\n").encode("utf-8")
+
+
+def send_message(request, message):
+	# write without blocking, a client that cannot take a small message at once is dropped
+	try:
+		return request.send(message) == len(message)
+	except socket.error:
+		return False
+
+
+def close_connection(request):
+	# same as the server closing a connection its worker is done with
+	try:
+		request.shutdown(socket.SHUT_WR)
+	except socket.error:
+		pass
+	request.close()
+	return
+
+
+class Waiter:
+	# parked long-poll connection
+
+	def __init__(self, request, known_tip_little, response_format):
+		self.request = request
+		# latest block hash (little endian) the client already knows
+		self.known_tip_little = known_tip_little
+		# format of the response the client accepts
+		self.response_format = response_format
+
+
+class Stream:
+	# open event stream connection
+
+	def __init__(self, request):
+		self.request = request
+		# latest block hash (little endian) last sent, "" before the first event
+		self.tip_little = ""
+
+
+class TipWaiters:
+	# long-poll requests and event streams waiting for a new latest block
+	# sockets are held here instead of by worker threads, and one thread answers all of them
+	# when an update is published or a timeout passes
+
+	def __init__(self, clock=time.time):
+		# seconds since epoch, replaced by tests to move time without sleeping
+		self.clock = clock
+		# guards waiters and streams, taken by request threads parking and by the releasing thread
+		self.lock = threading.Lock()
+		# (deadline, sequence number, waiter) of parked long-poll requests, earliest deadline first
+		self.waiters = []
+		# ties of deadlines are ordered by parking order, waiters are never compared
+		self.sequence = itertools.count()
+		# open event streams
+		self.streams = []
+		# latest block hash (little endian) of the last release round
+		self.tip_little = ""
+		# a waiter or stream was added since the last release round
+		self.pending = False
+		# time of the last event or comment sent to streams
+		self.last_heartbeat = clock()
+		self.thread = None
+
+	def start(self):
+		# start releasing thread once
+		if self.thread is None:
+			self.thread = threading.Thread(target=self.run)
+			self.thread.daemon = True
+			self.thread.start()
+		return
+
+	def get_counts(self):
+		# number of parked connections by kind, for metrics
+		with self.lock:
+			return [((("kind", "longpoll"),), len(self.waiters)), ((("kind", "stream"),), len(self.streams))]
+
+	def is_full(self):
+		with self.lock:
+			return len(self.waiters) + len(self.streams) >= max_waiters
+
+	def park(self, request, known_tip_big, timeout, response_format):
+		# hold connection until the latest block moves past known_tip or timeout seconds pass
+		# returns False if the client should be answered now, the latest block already moved
+		known_tip_little = codec.reverse_hex(known_tip_big.lower())
+
+		with self.lock:
+			# checked under the lock, so a block published later is seen by the releasing thread
+			if has_moved(blockchain.current.latest_block_little, known_tip_little):
+				return False
+
+			request.setblocking(False)
+			heapq.heappush(self.waiters, (self.clock() + timeout, next(self.sequence),
+								Waiter(request, known_tip_little, response_format)))
+
+		self.wake()
+		return True
+
+	def subscribe(self, request):
+		# send every new latest block to the connection, starting with the current one
+		with self.lock:
+			request.setblocking(False)
+			self.streams.append(Stream(request))
+
+		# first event is sent by the next release round
+		self.wake()
+		return
+
+	def wake(self):
+		# start a release round now, so a new stream gets its first event and the wait
+		# is recomputed for a deadline earlier than the one the releasing thread sleeps to
+		with blockchain.published:
+			self.pending = True
+			blockchain.published.notify_all()
+		return
+
+	def get_wait_seconds(self, now):
+		# until the earliest deadline or next heartbeat
+		with self.lock:
+			deadline = self.waiters[0][0] if len(self.waiters) > 0 else now + heartbeat_interval
+
+		return max(0.0, min(deadline, self.last_heartbeat + heartbeat_interval) - now)
+
+	def run(self):
+		while True:
+			with blockchain.published:
+				# a block published during the last round was notified before this wait, check it first
+				if blockchain.current.latest_block_little == self.tip_little and not self.pending:
+					blockchain.published.wait(self.get_wait_seconds(self.clock()))
+				self.pending = False
+
+			self.release(blockchain.current, self.clock())
+
+	def release(self, gen, now):
+		# answer waiters told of a new latest block or timed out, and send events to streams
+		tip_little = gen.latest_block_little
+
+		with self.lock:
+			due = []
+			if has_moved(tip_little, self.tip_little):
+				kept = []
+				for entry in self.waiters:
+					if has_moved(tip_little, entry[2].known_tip_little):
+						due.append(entry[2])
+					else:
+						kept.append(entry)
+				heapq.heapify(kept)
+				self.waiters = kept
+
+			while len(self.waiters) > 0 and self.waiters[0][0] <= now:
+				due.append(heapq.heappop(self.waiters)[2])
+
+			streams = list(self.streams)
+
+		self.tip_little = tip_little
+
+		# rendered once per format and outcome, then the same bytes are sent to every waiter
+		responses = {}
+		for waiter in due:
+			key = (waiter.response_format, has_moved(tip_little, waiter.known_tip_little))
+			if key not in responses:
+				responses[key] = render_response(get_tip_result(gen, waiter.known_tip_little),
+												waiter.response_format)
+			send_message(waiter.request, responses[key])
+			close_connection(waiter.request)
+
+		heartbeat_due = now - self.last_heartbeat >= heartbeat_interval
+		if heartbeat_due:
+			self.last_heartbeat = now
+
+		event = None
+		dropped = set()
+		for stream in streams:
+			if has_moved(tip_little, stream.tip_little):
+				if event is None:
+					event = render_event(gen)
+				message = event
+				stream.tip_little = tip_little
+			elif heartbeat_due:
+				message = heartbeat
+			else:
+				continue
+
+			if not send_message(stream.request, message):
+				dropped.add(stream)
+
+		if len(dropped) > 0:
+			with self.lock:
+				self.streams = [stream for stream in self.streams if stream not in dropped]
+			for stream in dropped:
+				close_connection(stream.request)
+		return
@@ -0,0 +1,187 @@
+# txindex.py
+# Sorted packed index of transaction hashes to the blocks holding them
+
+# https://git-scm.com/docs/pack-format#_pack_idx_files_have_the_following_format
+
+import os
+import sys
+import mmap
+import array
+import bisect
+import struct
+
+# NumPy is optional, it sorts large indexes without a Python object per entry
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+# unsigned 64 bit array typecode, Python 2 has no "Q" but "L" is 64 bit on LP64 platforms
+try:
+	array.array("Q")
+	uint64_typecode = "Q"
+except ValueError:
+	uint64_typecode = "L"
+
+# top bits of txid prefix in the fan-out table, narrowing each binary search to a bucket
+fanout_bits = 16
+
+# recent transactions kept in a dict until they are this share of the packed index
+rebuild_ratio = 0.125
+
+# file layout: header, fan-out table, prefixes, block ids, positions, arrays in native byte order
+file_magic = b"TXIDX001"
+# magic, byte order, number of entries, number of blocks indexed, hash of last block indexed
+header_format = "<8s8sQQ32s"
+header_size = struct.calcsize(header_format)
+
+
+def get_prefix(tx_hash_little):
+	# first 8 bytes of little endian tx hash as unsigned int, ordered like the bytes
+	return int(tx_hash_little[:16], 16)
+
+
+def build_fanout(prefixes):
+	# index of first prefix of each top bits bucket, one past last prefix at the end
+	fanout = array.array(uint64_typecode)
+	shift = 64 - fanout_bits
+	for top in range(0, (1 << fanout_bits) + 1):
+		fanout.append(bisect.bisect_left(prefixes, top << shift))
+	return fanout
+
+
+def to_array(typecode, values):
+	# NumPy array or memoryview to array of typecode
+	column = array.array(typecode)
+	data = values.tobytes()
+	if hasattr(column, "frombytes"):
+		column.frombytes(data)
+	else:
+		column.fromstring(data)
+	return column
+
+
+def map_column(buffer, offset, typecode, count):
+	# column of mapped file without reading it, copied into memory on Python 2
+	column = array.array(typecode)
+	end = offset + count * column.itemsize
+	if hasattr(memoryview, "cast"):
+		return memoryview(buffer)[offset: end].cast(typecode)
+
+	column.fromstring(buffer[offset: end])
+	return column
+
+
+class TxIndex:
+	# txid prefixes in sorted order with block id and position of each transaction
+	# 16 bytes per transaction, never modified once built
+
+	# transactions of indexed blocks stay in memory
+	resident = True
+
+	def __init__(self, prefixes=None, block_ids=None, positions=None, block_count=0, fanout=None):
+		# first 8 bytes of each tx hash, ties ordered by block id
+		self.prefixes = prefixes if prefixes is not None else array.array(uint64_typecode)
+		# index of block in load order holding the transaction
+		self.block_ids = block_ids if block_ids is not None else array.array("I")
+		# position of the transaction in the block
+		self.positions = positions if positions is not None else array.array("I")
+		# blocks with ids below this are indexed
+		self.block_count = block_count
+		# start of each top bits bucket of prefixes
+		self.fanout = fanout if fanout is not None else build_fanout(self.prefixes)
+		# mapped file backing the columns, None when built in memory
+		self.map = None
+
+	def __len__(self):
+		return len(self.prefixes)
+
+	def find(self, tx_hash_little):
+		# (block id, position) of every transaction with the prefix, in load order
+		# different txids may share a prefix, callers compare the full hash
+		prefix = get_prefix(tx_hash_little)
+		top = prefix >> (64 - fanout_bits)
+		end = self.fanout[top + 1]
+
+		candidates = []
+		i = bisect.bisect_left(self.prefixes, prefix, self.fanout[top], end)
+		while i < end and self.prefixes[i] == prefix:
+			candidates.append((self.block_ids[i], self.positions[i]))
+			i += 1
+
+		return candidates
+
+	def extend(self, blocks, block_count):
+		# new index with transactions of blocks from this one's block count up to block_count
+		prefixes = array.array(uint64_typecode)
+		block_ids = array.array("I")
+		positions = array.array("I")
+		for block_id in range(self.block_count, block_count):
+			txs = blocks[block_id].get_transactions()
+			for position in range(0, len(txs)):
+				prefixes.append(get_prefix(txs[position].get_hash_little()))
+				block_ids.append(block_id)
+				positions.append(position)
+
+		if numpy is not None:
+			# sort by prefix, then block id, without a Python object per entry
+			all_prefixes = numpy.concatenate((numpy.frombuffer(self.prefixes, dtype=numpy.uint64),
+											numpy.frombuffer(prefixes, dtype=numpy.uint64)))
+			all_block_ids = numpy.concatenate((numpy.frombuffer(self.block_ids, dtype=numpy.uint32),
+											numpy.frombuffer(block_ids, dtype=numpy.uint32)))
+			all_positions = numpy.concatenate((numpy.frombuffer(self.positions, dtype=numpy.uint32),
+											numpy.frombuffer(positions, dtype=numpy.uint32)))
+			order = numpy.lexsort((all_block_ids, all_prefixes))
+
+			return TxIndex(to_array(uint64_typecode, all_prefixes[order]), to_array("I", all_block_ids[order]),
+						to_array("I", all_positions[order]), block_count)
+
+		entries = sorted(list(zip(self.prefixes, self.block_ids, self.positions)) +
+						list(zip(prefixes, block_ids, positions)))
+		return TxIndex(array.array(uint64_typecode, [entry[0] for entry in entries]),
+					array.array("I", [entry[1] for entry in entries]),
+					array.array("I", [entry[2] for entry in entries]), block_count)
+
+	def save(self, path, last_block_hash):
+		# write to a temporary file and rename, so a mapped older file stays intact
+		header = struct.pack(header_format, file_magic, sys.byteorder.encode("ascii"), len(self),
+							self.block_count, last_block_hash)
+
+		temp_path = path + ".tmp"
+		with open(temp_path, "wb") as file:
+			file.write(header)
+			for column in (self.fanout, self.prefixes, self.block_ids, self.positions):
+				file.write(column.tobytes() if hasattr(column, "tobytes") else column.tostring())
+		os.rename(temp_path, path)
+		return
+
+
+def load(path):
+	# index mapped from file and hash of its last indexed block, None and "" if not a valid index
+	if not os.path.isfile(path) or os.path.getsize(path) < header_size:
+		return None, b""
+
+	with open(path, "rb") as file:
+		buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+	magic, byteorder, count, block_count, last_block_hash = struct.unpack(header_format, buffer[:header_size])
+	if magic != file_magic or byteorder.rstrip(b"\x00") != sys.byteorder.encode("ascii"):
+		return None, b""
+
+	fanout_count = (1 << fanout_bits) + 1
+	if len(buffer) != header_size + 8 * fanout_count + 16 * count:
+		return None, b""
+
+	offset = header_size
+	fanout = map_column(buffer, offset, uint64_typecode, fanout_count)
+	offset += 8 * fanout_count
+	prefixes = map_column(buffer, offset, uint64_typecode, count)
+	offset += 8 * count
+	block_ids = map_column(buffer, offset, "I", count)
+	offset += 4 * count
+	positions = map_column(buffer, offset, "I", count)
+
+	index = TxIndex(prefixes, block_ids, positions, block_count, fanout)
+	index.map = buffer
+	return index, last_block_hash
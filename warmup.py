@@ -0,0 +1,121 @@
+# warmup.py
+# Record hot block and transaction hashes, and replay them to warm caches after a restart
+
+import os
+import json
+import time
+import threading
+import collections
+
+
+# hashes of each kind kept in the saved file, hottest first
+hot_entries = 10000
+
+# hashes of each kind counted between saves before the coldest are dropped
+max_counted = 4 * hot_entries
+
+# seconds between saves of the hot hashes
+save_interval = 60.0
+
+
+class AccessRecorder:
+	# request counts of block and transaction hashes, saved periodically
+	# counts are halved on every save, so hashes hot long ago make way for recent ones,
+	# but are never dropped for being idle, so a quiet period before a restart keeps the hot set
+
+	def __init__(self, path):
+		# file the hot hashes are saved to and replayed from
+		self.path = path
+		# hash (as requested) -> number of requests, decayed
+		self.block_counts = collections.Counter()
+		self.tx_counts = collections.Counter()
+		# request threads record concurrently
+		self.lock = threading.Lock()
+
+	def record_block(self, block_hash_big):
+		self.record(self.block_counts, block_hash_big)
+		return
+
+	def record_transaction(self, tx_hash_big):
+		self.record(self.tx_counts, tx_hash_big)
+		return
+
+	def record(self, counts, key):
+		with self.lock:
+			counts[key] += 1
+
+			# bound memory when clients probe many distinct hashes
+			if len(counts) > max_counted:
+				hottest = counts.most_common(hot_entries)
+				counts.clear()
+				counts.update(dict(hottest))
+		return
+
+	def get_hot(self):
+		# (block hashes, tx hashes) hottest first
+		with self.lock:
+			blocks = [key for key, count in self.block_counts.most_common(hot_entries)]
+			txs = [key for key, count in self.tx_counts.most_common(hot_entries)]
+
+		return blocks, txs
+
+	def age(self):
+		# halve every count, the coldest are dropped once too many hashes are counted
+		with self.lock:
+			for counts in (self.block_counts, self.tx_counts):
+				for key in list(counts):
+					counts[key] *= 0.5
+		return
+
+	def save(self):
+		# write to a temporary file and rename, so a crash never leaves a partial file
+		blocks, txs = self.get_hot()
+
+		temp_path = self.path + ".tmp"
+		with open(temp_path, "w") as file:
+			json.dump({"blocks": blocks, "transactions": txs}, file)
+		os.rename(temp_path, self.path)
+
+		self.age()
+		return
+
+	def run(self, interval):
+		# save hot hashes every interval seconds, for a daemon thread
+		while True:
+			time.sleep(interval)
+			try:
+				self.save()
+			except (IOError, OSError) as error:
+				print("Failed to save hot hashes to " + self.path + ": " + str(error))
+
+
+def load_hot(path):
+	# (block hashes, tx hashes) saved by an earlier run, empty if none
+	if not os.path.isfile(path):
+		return [], []
+
+	try:
+		with open(path, "r") as file:
+			hot = json.load(file)
+	except (IOError, OSError, ValueError):
+		return [], []
+
+	return hot.get("blocks", []), hot.get("transactions", [])
+
+
+def replay(path, warm_block, warm_transaction):
+	# call warm_block and warm_transaction on each saved hash, hottest first
+	# returns number of hashes replayed
+	blocks, txs = load_hot(path)
+	start = time.time()
+
+	for block_hash_big in blocks:
+		warm_block(block_hash_big)
+
+	for tx_hash_big in txs:
+		warm_transaction(tx_hash_big)
+
+	print("Warmed caches with %d blocks and %d transactions in %.1f s" %
+		(len(blocks), len(txs), time.time() - start))
+
+	return len(blocks) + len(txs)